@@ -1,6 +1,109 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
 
-from content.models import Content, ContentScore, UpdateContentMeanScoreEvent
+from content.models import Content, ContentScore, UpdateContentMeanScoreEvent, ScoreEventSummary, \
+    ContentScoreStatistics, NormalizationRun
+
+# The changelist applies unknown parameters as lookups, so the next keyset page is just a primary key filter.
+KEYSET_VAR = 'pk__lt'
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts exactly only up to ADMIN_EXACT_COUNT_LIMIT rows, with a COUNT over a LIMIT subquery. Past that, an
+    unfiltered table reports the row estimate of the database statistics, and a filtered one one row more
+    than the limit; older rows are still reachable through the keyset link.
+    """
+
+    @cached_property
+    def count(self):
+        # Below one page the changelist would drop pagination and load the whole queryset.
+        limit = max(settings.ADMIN_EXACT_COUNT_LIMIT, self.per_page)
+        count = self.object_list.order_by()[:limit + 1].count()
+        if count <= limit or self.object_list.query.where:
+            return count
+        return max(self.get_table_estimate(self.object_list.model), count)
+
+    @staticmethod
+    def get_table_estimate(model):
+        table = model._meta.db_table
+        if connection.vendor == 'mysql':
+            sql = 'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+        elif connection.vendor == 'postgresql':
+            sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+        else:
+            return 0
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+        return int(row[0] or 0) if row else 0
+
+
+class IdFilter(admin.SimpleListFilter):
+    """
+    Filters on the id of an indexed relation, typed into a box instead of picked from a list,
+    so the sidebar never loads the rows of the related table.
+    """
+    template = 'admin/id_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name, PAGE_VAR, KEYSET_VAR]),
+            'display': 'All',
+            # The form replaces the query string, so it carries the other parameters along.
+            'hidden_params': [(key, value) for key, value in changelist.params.items()
+                              if key not in (self.parameter_name, PAGE_VAR, KEYSET_VAR)],
+        }
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value is not None and value.isdigit():
+            return queryset.filter(**{f'{self.parameter_name}_id': int(value)})
+        return queryset
+
+
+def get_id_filter(field_name):
+    return type(f'{field_name.title()}IdFilter', (IdFilter,), {'title': field_name, 'parameter_name': field_name})
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables too large to count or to offer as choices: related rows are joined in
+    instead of loaded per row, foreign keys are edited by id, filters use indexed columns only and pages are
+    walked by primary key instead of OFFSET.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-pk',)
+    list_per_page = 100
+    # "Show all" is only offered when everything fits on one page anyway.
+    list_max_show_all = 100
+    change_list_template = 'admin/scalable_change_list.html'
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is None:
+            return response
+
+        # Keyset navigation only follows the default, primary key ordering.
+        results = changelist.result_list
+        if ORDER_VAR not in request.GET and len(results) == changelist.list_per_page:
+            response.context_data['keyset_next_url'] = changelist.get_query_string(
+                {KEYSET_VAR: results[len(results) - 1].pk}, remove=[PAGE_VAR])
+        return response
 
 
 class ContentAdmin(admin.ModelAdmin):
@@ -8,17 +111,54 @@ class ContentAdmin(admin.ModelAdmin):
     readonly_fields = ('score_sum', 'score_count', 'normalized_score_mean')
 
 
-class ContentScoreAdmin(admin.ModelAdmin):
+class ContentScoreAdmin(ScalableModelAdmin):
     list_display = ('user', 'content', 'score', 'scored_at')
+    list_select_related = ('user', 'content')
+    list_filter = (get_id_filter('user'), get_id_filter('content'))
+    raw_id_fields = ('user', 'content')
     readonly_fields = ('scored_at',)
 
 
-class UpdateContentMeanScoreEventAdmin(admin.ModelAdmin):
+class UpdateContentMeanScoreEventAdmin(ScalableModelAdmin):
     list_display = ('content', 'content_score', 'type', 'old_score', 'new_score', 'occurred_at')
+    list_select_related = ('content', 'content_score__user', 'content_score__content')
+    list_filter = (get_id_filter('content'), get_id_filter('content_score'))
+    raw_id_fields = ('content', 'content_score')
     readonly_fields = ('occurred_at',)
 
 
+class ScoreEventSummaryAdmin(ScalableModelAdmin):
+    list_display = ('content', 'add_count', 'update_count', 'score_change_sum', 'last_occurred_at')
+    list_select_related = ('content',)
+    raw_id_fields = ('content',)
+    readonly_fields = ('add_count', 'update_count', 'score_change_sum', 'first_occurred_at', 'last_occurred_at',
+                       'last_event_id')
+
+
+class ContentScoreStatisticsAdmin(ScalableModelAdmin):
+    list_display = ('content', 'bucket_mean', 'bucket_weight', 'closed_through')
+    list_select_related = ('content',)
+    raw_id_fields = ('content',)
+    readonly_fields = ('bucket_weight', 'bucket_mean', 'bucket_m2', 'closed_through')
+
+
+class NormalizationRunAdmin(admin.ModelAdmin):
+    list_display = ('started_at', 'duration', 'candidate_count', 'normalized_count', 'updated_count', 'error_count',
+                    'estimated_item_time_p50_ms', 'estimated_item_time_p99_ms')
+    list_filter = ('started_at',)
+    ordering = ('-started_at',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # Register your models here.
 admin.site.register(Content, ContentAdmin)
 admin.site.register(ContentScore, ContentScoreAdmin)
 admin.site.register(UpdateContentMeanScoreEvent, UpdateContentMeanScoreEventAdmin)
+admin.site.register(ScoreEventSummary, ScoreEventSummaryAdmin)
+admin.site.register(ContentScoreStatistics, ContentScoreStatisticsAdmin)
+admin.site.register(NormalizationRun, NormalizationRunAdmin)
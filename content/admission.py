@@ -0,0 +1,229 @@
+"""
+Admission control for score writes. Before a write touches the database it has to take a token from the bucket
+of its user and from the bucket of its content, and a slot of the content's in-flight writes. A surge on one
+content is then turned away with a 429 instead of queueing on that content's row locks and holding
+connections that list reads need.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+import redis
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+
+from redit.metrics import SCORE_WRITES_ADMITTED, SCORE_WRITES_SHED
+
+# Seconds a client is asked to wait when the content has no free write slot.
+CONCURRENCY_RETRY_AFTER = 1
+
+
+def refill(tokens, updated_at, now, rate, burst):
+    return min(burst, tokens + max(0.0, now - updated_at) * rate)
+
+
+class LocalAdmissionController:
+    """
+    In-process token buckets and slot counts. Every process admits its own share,
+    so it is meant for tests and single-process servers.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        """
+        Returns the seconds until the bucket has a token again, or 0 and the bucket state after taking one.
+        The caller stores the states only once every check passed, so a rejected write takes nothing.
+        """
+        if not rate:
+            return 0, None
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        tokens = refill(tokens, updated_at, now, rate, burst)
+        if tokens < 1:
+            return (1 - tokens) / rate, None
+        return 0, (key, (tokens - 1, now))
+
+    def acquire(self, user_id, content_id, limits):
+        now = time.monotonic()
+        with self._lock:
+            updates = []
+            for reason, key, rate, burst in (
+                    ('user', ('user', user_id), limits.user_rate, limits.user_burst),
+                    ('content', ('content', content_id), limits.content_rate, limits.content_burst)):
+                if key[1] is None:
+                    continue
+                wait, update = self.take(key, rate, burst, now)
+                if wait:
+                    return reason, wait
+                if update is not None:
+                    updates.append(update)
+
+            if content_id is not None and limits.content_concurrency:
+                if self._in_flight.get(content_id, 0) >= limits.content_concurrency:
+                    return 'concurrency', CONCURRENCY_RETRY_AFTER
+                self._in_flight[content_id] = self._in_flight.get(content_id, 0) + 1
+            self._buckets.update(updates)
+        return None, 0
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._in_flight.clear()
+
+    def release(self, content_id, limits):
+        if content_id is None or not limits.content_concurrency:
+            return
+        with self._lock:
+            in_flight = self._in_flight.get(content_id, 0) - 1
+            if in_flight > 0:
+                self._in_flight[content_id] = in_flight
+            else:
+                self._in_flight.pop(content_id, None)
+
+
+class RedisAdmissionController:
+    """
+    Token buckets as `tokens`/`updated_at` hashes and slot counts as integers. One script checks and takes
+    everything atomically, so concurrent web processes share the limits.
+    """
+    KEY_PREFIX = 'content:admission'
+    # A crashed process never releases its slots, so slot counts expire once no write has been admitted for so long.
+    SLOT_TIMEOUT = 30
+    ACQUIRE_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local function take(key, rate, burst)
+        if rate <= 0 or key == '' then
+            return 0, nil
+        end
+        local state = redis.call('HMGET', key, 'tokens', 'updated_at')
+        local tokens = tonumber(state[1]) or burst
+        local updated_at = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+        if tokens < 1 then
+            return (1 - tokens) / rate, nil
+        end
+        return 0, tokens - 1
+    end
+
+    local user_wait, user_tokens = take(KEYS[1], tonumber(ARGV[2]), tonumber(ARGV[3]))
+    if user_wait > 0 then
+        return {'user', tostring(user_wait)}
+    end
+    local content_wait, content_tokens = take(KEYS[2], tonumber(ARGV[4]), tonumber(ARGV[5]))
+    if content_wait > 0 then
+        return {'content', tostring(content_wait)}
+    end
+    local concurrency = tonumber(ARGV[6])
+    if concurrency > 0 and KEYS[3] ~= '' then
+        if tonumber(redis.call('GET', KEYS[3]) or '0') >= concurrency then
+            return {'concurrency', ARGV[8]}
+        end
+        redis.call('INCR', KEYS[3])
+        redis.call('EXPIRE', KEYS[3], tonumber(ARGV[7]))
+    end
+
+    if user_tokens then
+        redis.call('HSET', KEYS[1], 'tokens', user_tokens, 'updated_at', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3]) / tonumber(ARGV[2])) + 1)
+    end
+    if content_tokens then
+        redis.call('HSET', KEYS[2], 'tokens', content_tokens, 'updated_at', now)
+        redis.call('EXPIRE', KEYS[2], math.ceil(tonumber(ARGV[5]) / tonumber(ARGV[4])) + 1)
+    end
+    return {'', '0'}
+    """
+    RELEASE_SCRIPT = """
+    if tonumber(redis.call('GET', KEYS[1]) or '0') > 0 then
+        return redis.call('DECR', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+        self.acquire_script = self.client.register_script(self.ACQUIRE_SCRIPT)
+        self.release_script = self.client.register_script(self.RELEASE_SCRIPT)
+
+    def get_key(self, kind, value):
+        return f'{self.KEY_PREFIX}:{kind}:{value}' if value is not None else ''
+
+    def acquire(self, user_id, content_id, limits):
+        reason, wait = self.acquire_script(
+            keys=[self.get_key('user', user_id), self.get_key('content', content_id),
+                  self.get_key('in_flight', content_id)],
+            args=[time.time(), limits.user_rate, limits.user_burst, limits.content_rate, limits.content_burst,
+                  limits.content_concurrency, self.SLOT_TIMEOUT, CONCURRENCY_RETRY_AFTER],
+        )
+        return reason.decode() or None, float(wait)
+
+    def release(self, content_id, limits):
+        if content_id is None or not limits.content_concurrency:
+            return
+        self.release_script(keys=[self.get_key('in_flight', content_id)])
+
+
+class AdmissionLimits:
+    def __init__(self):
+        self.user_rate = settings.CONTENT_SCORE_ADMISSION_USER_RATE
+        self.user_burst = settings.CONTENT_SCORE_ADMISSION_USER_BURST
+        self.content_rate = settings.CONTENT_SCORE_ADMISSION_CONTENT_RATE
+        self.content_burst = settings.CONTENT_SCORE_ADMISSION_CONTENT_BURST
+        self.content_concurrency = settings.CONTENT_SCORE_ADMISSION_CONTENT_CONCURRENCY
+
+
+_controllers = {}
+
+
+def get_admission_controller():
+    """
+    Returns the configured controller, or None when admission control is off.
+    """
+    backend = settings.CONTENT_SCORE_ADMISSION_BACKEND
+    if not backend:
+        return None
+
+    key = (backend, settings.CONTENT_SCORE_ADMISSION_REDIS_URL)
+    if key not in _controllers:
+        if backend == 'redis':
+            _controllers[key] = RedisAdmissionController(settings.CONTENT_SCORE_ADMISSION_REDIS_URL)
+        elif backend == 'local':
+            _controllers[key] = LocalAdmissionController()
+        else:
+            raise Exception("admission controller backend {} is not valid".format(backend))
+    return _controllers[key]
+
+
+def acquire_score_write(user_id, content_id):
+    """
+    Takes the tokens and a write slot of a score write, or raises `Throttled` (a 429 with `Retry-After`).
+    Returns the function that gives the slot back once the write is done. Either id may be None when
+    the request does not carry a valid one; only the limits of the other are checked then.
+    """
+    controller = get_admission_controller()
+    if controller is None:
+        return lambda: None
+
+    limits = AdmissionLimits()
+    reason, wait = controller.acquire(user_id, content_id, limits)
+    if reason is not None:
+        SCORE_WRITES_SHED.labels(reason).inc()
+        raise Throttled(wait=math.ceil(wait))
+
+    SCORE_WRITES_ADMITTED.inc()
+    return lambda: controller.release(content_id, limits)
+
+
+@contextmanager
+def admit_score_write(user_id, content_id):
+    """
+    Runs the block as an admitted score write, see `acquire_score_write`.
+    """
+    release = acquire_score_write(user_id, content_id)
+    try:
+        yield
+    finally:
+        release()
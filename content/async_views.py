@@ -0,0 +1,176 @@
+"""
+Async variants of the content list and score endpoints for ASGI deployments. They return the same bodies as
+the DRF views, but a request waiting on the database does not hold a worker thread.
+
+DRF does not run async views, so these are plain Django views. They authenticate with a JWT or the `user_id`
+parameter only. Sessions are not supported, which is why the views can be exempt from CSRF checks.
+"""
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, NotFound, ParseError, \
+    ValidationError
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import exception_handler
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+
+from .admission import acquire_score_write
+from .models import Content, ContentScore
+from .serializers import ContentScoreSerializer, CONTENT_LIST_FIELDS, get_content_rows
+from .users import ensure_users_exist
+from .views import ContentPagination
+
+
+async def aget_user_id(request, data=None, create=False):
+    """
+    Async counterpart of `UserMixin.get_user_id`: the user id of a valid JWT, otherwise the `user_id` parameter.
+    """
+    authenticated = await sync_to_async(JWTStatelessUserAuthentication().authenticate)(request)
+    if authenticated is not None:
+        return authenticated[0].id
+
+    user_id = request.GET.get('user_id')
+    if not user_id and data:
+        user_id = data.get('user_id')
+    if not user_id:
+        return None
+
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        raise ValidationError({"user_id": "A valid integer is required."})
+    if create:
+        await sync_to_async(ensure_users_exist)([user_id])
+    return user_id
+
+
+def get_error_response(exception):
+    """
+    Renders an API exception with DRF's exception handler, like the sync views, so both answer with the same
+    body, status and headers (e.g. `Retry-After`).
+    """
+    drf_response = exception_handler(exception, {})
+    # The sync views authenticate with sessions first, which have no WWW-Authenticate challenge, so DRF turns
+    # authentication failures into 403s there.
+    if isinstance(exception, (NotAuthenticated, AuthenticationFailed)):
+        drf_response.status_code = 403
+    response = JsonResponse(drf_response.data, status=drf_response.status_code, safe=False)
+    for header, value in drf_response.items():
+        if header != 'Content-Type':
+            response[header] = value
+    return response
+
+
+class AsyncContentListView(View):
+    """
+    Page number pagination over the contents, with the same parameters and body as `ContentListView`.
+    Pages are not cached and cursor pagination is not supported.
+    """
+    pagination_class = ContentPagination
+
+    def get_page_size(self, request):
+        pagination = self.pagination_class
+        try:
+            page_size = int(request.GET[pagination.page_size_query_param])
+        except (KeyError, ValueError):
+            return pagination.page_size
+        if page_size <= 0:
+            return pagination.page_size
+        return min(page_size, pagination.max_page_size)
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            user_id = await aget_user_id(request)
+        except APIException as e:
+            return get_error_response(e)
+
+        page_size = self.get_page_size(request)
+        count = await Content.objects.acount()
+        page_count = max(1, math.ceil(count / page_size))
+        page_number = request.GET.get(self.pagination_class.page_query_param, 1)
+        try:
+            page_number = page_count if page_number == 'last' else int(page_number)
+        except ValueError:
+            page_number = 0
+        if not 1 <= page_number <= page_count:
+            return get_error_response(NotFound('Invalid page.'))
+
+        offset = (page_number - 1) * page_size
+        rows = [
+            row async for row in Content.objects.order_by('id').values(*CONTENT_LIST_FIELDS)[offset:offset + page_size]
+        ]
+        content_ids = [row['id'] for row in rows]
+        pending_deltas = None
+        if settings.CONTENT_SCORE_WRITE_BEHIND:
+            pending_deltas = await sync_to_async(Content.get_pending_score_deltas)(content_ids)
+        user_scores = None
+        if user_id is not None:
+            user_scores = {
+                content_id: score async for content_id, score in ContentScore.objects.filter(
+                    user_id=user_id, content_id__in=content_ids).values_list('content_id', 'score')
+            }
+
+        return JsonResponse({
+            'count': count,
+            'next': self.get_page_link(request, page_number + 1) if page_number < page_count else None,
+            'previous': self.get_page_link(request, page_number - 1) if page_number > 1 else None,
+            'results': get_content_rows(rows, pending_deltas, user_scores),
+        })
+
+    def get_page_link(self, request, page_number):
+        url = request.build_absolute_uri()
+        if page_number == 1:
+            return remove_query_param(url, self.pagination_class.page_query_param)
+        return replace_query_param(url, self.pagination_class.page_query_param, page_number)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncContentScoreCreateUpdateView(View):
+    """
+    Creates or updates the score of the requesting user, like `ContentScoreCreateUpdateView`.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            try:
+                data = json.loads(request.body) if request.content_type == 'application/json' else request.POST.dict()
+            except ValueError as e:
+                raise ParseError(f'JSON parse error - {e}')
+            user_id = await aget_user_id(request, data)
+            # Admitted before the first query, like the sync view.
+            release = await sync_to_async(acquire_score_write)(user_id, self.get_content_id(data))
+        except APIException as e:
+            return get_error_response(e)
+        try:
+            # The validation, the write and its transaction run in one worker thread; the event loop only awaits it.
+            return JsonResponse(await sync_to_async(self.save_score)(data, user_id), status=201)
+        except APIException as e:
+            return get_error_response(e)
+        finally:
+            await sync_to_async(release)()
+
+    @staticmethod
+    def get_content_id(data):
+        try:
+            return int(data.get('content'))
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def save_score(data, user_id):
+        """
+        Validates and saves the score with the serializer and checks of the sync view and returns its body.
+        """
+        serializer = ContentScoreSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        if user_id is None:
+            raise ValidationError({"user": "user_id is required."})
+        ensure_users_exist([user_id])
+        serializer.save(user_id=user_id)
+        return serializer.data
@@ -0,0 +1,280 @@
+import platform
+import random
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+import django
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import Client
+from django.utils import timezone
+
+from content.datasets import DatasetSpec, generate_dataset
+from content.models import Content
+from content.serializers import ContentSerializer, CONTENT_LIST_FIELDS, get_content_rows
+from content.tasks import get_normalization_candidates, get_normalization_shards, normalize_content_shard
+
+SIZES = {
+    'small': DatasetSpec(users=200, contents=100, scores_per_content=50, surge_users=10),
+    'medium': DatasetSpec(users=2000, contents=1000, scores_per_content=200, surge_users=40, surge_ratio=0.2),
+    'large': DatasetSpec(users=20000, contents=10000, scores_per_content=500, surge_users=100, surge_ratio=0.1),
+}
+OPERATIONS = ('list', 'list_cached', 'serialize_models', 'serialize_rows', 'score', 'score_contended', 'normalize')
+# Contents per page of the serialization micro-benchmarks, the largest page the list allows.
+SERIALIZATION_PAGE_SIZE = 100
+# Latency metrics compared against a baseline, with throughput and the query counts.
+COMPARED_LATENCIES = ('p50_ms', 'p95_ms')
+
+
+class QueryCounter:
+    """
+    `execute_wrapper` hook that only counts statements, which is cheaper than capturing their SQL.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def summarize(latencies, query_counts, errors, elapsed):
+    """
+    Turns raw per-operation samples in seconds into the reported statistics.
+    """
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'iterations': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_ms': float(latencies_ms.mean()) if len(latencies) else 0.0,
+        'p50_ms': float(np.percentile(latencies_ms, 50)) if len(latencies) else 0.0,
+        'p95_ms': float(np.percentile(latencies_ms, 95)) if len(latencies) else 0.0,
+        'p99_ms': float(np.percentile(latencies_ms, 99)) if len(latencies) else 0.0,
+        'queries_mean': float(np.mean(query_counts)) if query_counts else 0.0,
+        'queries_max': int(max(query_counts)) if query_counts else 0,
+    }
+
+
+def measure(operation, iterations, setup=None):
+    """
+    Runs `operation(iteration)` `iterations` times on this thread; `setup(iteration)` runs untimed before each call.
+    Returns the raw `(latencies, query_counts, errors)` samples.
+    """
+    latencies, query_counts, errors = [], [], 0
+    for iteration in range(iterations):
+        if setup is not None:
+            setup(iteration)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started_at = time.perf_counter()
+            try:
+                if not operation(iteration):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started_at)
+        query_counts.append(counter.count)
+    return latencies, query_counts, errors
+
+
+def measure_concurrently(operation, iterations, concurrency):
+    """
+    Runs `operation(worker, iteration)` from `concurrency` threads, each with its own database connection.
+    """
+    results = [None] * concurrency
+    barrier = threading.Barrier(concurrency)
+
+    def worker(index):
+        try:
+            barrier.wait()
+            results[index] = measure(lambda iteration: operation(index, iteration), iterations)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+
+    latencies, query_counts, errors = [], [], 0
+    for worker_latencies, worker_query_counts, worker_errors in results:
+        latencies += worker_latencies
+        query_counts += worker_query_counts
+        errors += worker_errors
+    return summarize(latencies, query_counts, errors, elapsed)
+
+
+class Benchmark:
+    """
+    Benchmarks the hot paths against the current database, which has to hold the dataset of `spec`.
+    Requests go through the test client, so middleware, DRF and serialization are included in the latencies.
+    """
+
+    def __init__(self, spec, iterations=100, concurrency=8, seed=0):
+        self.spec = spec
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.rng = random.Random(seed)
+        self.client = Client()
+        self.content_ids = list(Content.objects.order_by('id').values_list('id', flat=True))
+        self.page_count = max(1, len(self.content_ids) // 10)
+
+    def random_user_id(self):
+        # Ids above the dataset exercise the user creation path of the views as well.
+        return self.rng.randint(1, self.spec.users * 2)
+
+    def request_list_page(self, iteration):
+        response = self.client.get('/content/list/', {
+            'page': self.rng.randint(1, self.page_count), 'user_id': self.random_user_id()
+        })
+        return response.status_code == 200
+
+    def serialize_page(self, fast):
+        """
+        Reads and renders one list page without HTTP, as model instances through `ContentSerializer`
+        or as column values through `get_content_rows`.
+        """
+        offset = self.rng.randint(0, max(0, len(self.content_ids) - SERIALIZATION_PAGE_SIZE))
+        contents = Content.objects.order_by('id')[offset:offset + SERIALIZATION_PAGE_SIZE]
+        if fast:
+            rows = list(contents.values(*CONTENT_LIST_FIELDS))
+            results = get_content_rows(rows, Content.get_pending_score_deltas([row['id'] for row in rows]))
+        else:
+            results = ContentSerializer(Content.attach_pending_score_deltas(list(contents)), many=True).data
+        return len(results) > 0
+
+    def post_score(self, client, content_id, user_id):
+        response = client.post('/content/score/', {
+            'content': content_id, 'score': self.rng.randint(0, 5), 'user_id': user_id
+        }, content_type='application/json')
+        return response.status_code == 201
+
+    def run_operation(self, name):
+        if name in ('list', 'list_cached'):
+            setup = (lambda iteration: cache.clear()) if name == 'list' else None
+            started_at = time.perf_counter()
+            samples = measure(self.request_list_page, self.iterations, setup)
+            return summarize(*samples, time.perf_counter() - started_at)
+
+        if name in ('serialize_models', 'serialize_rows'):
+            started_at = time.perf_counter()
+            samples = measure(lambda iteration: self.serialize_page(name == 'serialize_rows'), self.iterations)
+            return summarize(*samples, time.perf_counter() - started_at)
+
+        if name == 'score':
+            started_at = time.perf_counter()
+            samples = measure(
+                lambda iteration: self.post_score(self.client, self.rng.choice(self.content_ids), self.random_user_id()),
+                self.iterations)
+            return summarize(*samples, time.perf_counter() - started_at)
+
+        if name == 'score_contended':
+            # Every writer scores the same content with its own users, so they all contend for one Content row.
+            content_id = self.content_ids[0]
+            clients = [Client() for _ in range(self.concurrency)]
+            first_user_id = self.spec.users * 2 + 1
+            return measure_concurrently(
+                lambda worker, iteration: self.post_score(
+                    clients[worker], content_id, first_user_id + worker * self.iterations + iteration),
+                self.iterations, self.concurrency)
+
+        if name == 'normalize':
+            # Dropping the normalized means makes every content a candidate again.
+            setup = lambda iteration: Content.objects.update(normalized_score_mean=None)
+
+            def normalize(iteration):
+                shards = get_normalization_shards(list(get_normalization_candidates().values_list('id', flat=True)))
+                return all(normalize_content_shard(first_id, last_id)['errors'] == 0 for first_id, last_id in shards)
+
+            iterations = max(1, self.iterations // 20)
+            samples = measure(normalize, iterations, setup)
+            result = summarize(*samples, sum(samples[0]))
+            result['contents_per_second'] = len(self.content_ids) * iterations / sum(samples[0])
+            return result
+
+        raise Exception("benchmark operation {} is not valid".format(name))
+
+    def run(self, operations=OPERATIONS):
+        return {name: self.run_operation(name) for name in operations}
+
+
+def prepare_dataset(size, seed, end=None):
+    spec = replace(SIZES[size], seed=seed, end=end or timezone.now())
+    generate_dataset(spec)
+    Content.normalize_batch(list(Content.objects.all()))
+    return spec
+
+
+def get_environment():
+    return {
+        'database': connection.vendor,
+        'django': django.get_version(),
+        'python': platform.python_version(),
+        'write_behind': settings.CONTENT_SCORE_WRITE_BEHIND,
+        'pagination': settings.CONTENT_LIST_PAGINATION,
+        'created_at': timezone.now().isoformat(),
+    }
+
+
+def compare_results(baseline, current, tolerance=0.2):
+    """
+    Lists the metrics of `current` that are worse than in `baseline` by more than `tolerance` (a fraction).
+    Query counts are compared exactly, since they do not depend on the machine.
+    """
+    regressions = []
+    for size, operations in current['results'].items():
+        for name, stats in operations.items():
+            baseline_stats = baseline.get('results', {}).get(size, {}).get(name)
+            if baseline_stats is None:
+                continue
+
+            def flag(metric, worse):
+                if worse:
+                    regressions.append({
+                        'size': size, 'operation': name, 'metric': metric,
+                        'baseline': baseline_stats[metric], 'current': stats[metric],
+                    })
+
+            for metric in COMPARED_LATENCIES:
+                flag(metric, stats[metric] > baseline_stats[metric] * (1 + tolerance))
+            flag('throughput', stats['throughput'] < baseline_stats['throughput'] * (1 - tolerance))
+            flag('queries_max', stats['queries_max'] > baseline_stats['queries_max'])
+            flag('errors', stats['errors'] > baseline_stats['errors'])
+    return regressions
+
+
+def run_http_load(url, concurrency, total_requests, method='GET', body=None, timeout=30):
+    """
+    Sends `total_requests` requests to a running server from `concurrency` client threads, so deployments
+    (sync workers against ASGI workers) can be compared at the same worker count.
+    `{index}` in the url or body is replaced by the request number, e.g. to spread scores over users.
+    """
+    def send(index):
+        data = body.replace('{index}', str(index)).encode() if body is not None else None
+        request = urllib.request.Request(url.replace('{index}', str(index)), data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        started_at = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                succeeded = response.status < 400
+        except Exception:
+            succeeded = False
+        return time.perf_counter() - started_at, succeeded
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = list(pool.map(send, range(1, total_requests + 1)))
+    elapsed = time.perf_counter() - started_at
+    return summarize(
+        [latency for latency, _ in samples], [], sum(1 for _, succeeded in samples if not succeeded), elapsed)
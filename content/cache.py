@@ -0,0 +1,69 @@
+import hashlib
+
+from django.core.cache import cache
+
+CONTENT_LIST_VERSION_KEY = 'content:list:version'
+CONTENT_LIST_CACHE_HITS_KEY = 'content:list:cache:hits'
+CONTENT_LIST_CACHE_MISSES_KEY = 'content:list:cache:misses'
+
+
+def increment(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout=None):
+            return 1
+        return cache.incr(key)
+
+
+def get_content_list_version():
+    version = cache.get(CONTENT_LIST_VERSION_KEY)
+    if version is None:
+        cache.add(CONTENT_LIST_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CONTENT_LIST_VERSION_KEY, 1)
+    return version
+
+
+def bump_content_list_version():
+    """
+    Invalidates every cached content list page. Called by score writes and normalization runs.
+    """
+    return increment(CONTENT_LIST_VERSION_KEY)
+
+
+def get_request_digest(request, ignored_params=('user_id',)):
+    """
+    Hashes everything of a list request that shapes its body except the requesting user.
+    """
+    query = sorted(
+        (key, value) for key, values in request.query_params.lists() if key not in ignored_params for value in values
+    )
+    return hashlib.sha1(repr((request.get_host(), request.path, query)).encode()).hexdigest()
+
+
+def get_content_list_cache_key(version, request, ignored_params=('user_id',)):
+    """
+    Builds the key of a shared page from everything that shapes its body except the requesting user.
+    """
+    return f'content:list:page:{version}:{get_request_digest(request, ignored_params)}'
+
+
+def get_content_list_etag(request, page_version, user_version):
+    """
+    Builds the strong ETag of a list page from the request, the version of its contents and the version
+    of the requesting user's scores.
+    """
+    digest = hashlib.sha1(repr((get_request_digest(request), page_version, user_version)).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def record_content_list_cache_access(hit):
+    increment(CONTENT_LIST_CACHE_HITS_KEY if hit else CONTENT_LIST_CACHE_MISSES_KEY)
+
+
+def get_content_list_cache_stats():
+    return {
+        'version': get_content_list_version(),
+        'hits': cache.get(CONTENT_LIST_CACHE_HITS_KEY, 0),
+        'misses': cache.get(CONTENT_LIST_CACHE_MISSES_KEY, 0),
+    }
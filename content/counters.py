@@ -0,0 +1,248 @@
+import logging
+import threading
+import uuid
+from datetime import datetime, timezone as datetime_timezone
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DrainedDeltas(dict):
+    """
+    Deltas taken by `drain`. They stay in the buffer, where `get_many` still counts them, until `acknowledge`
+    is told they were written; whatever is not acknowledged when `release` ends the drain is taken by the next one.
+    """
+
+    def __init__(self, buffer, deltas=(), flushing_keys=(), token=None):
+        super().__init__(deltas)
+        self.buffer = buffer
+        self.flushing_keys = list(flushing_keys)
+        self.token = token
+
+    def acknowledge(self, keys):
+        self.buffer.acknowledge(self.flushing_keys, keys)
+
+    def release(self):
+        self.buffer.release(self.flushing_keys, self.token)
+
+
+class LocalScoreDeltaBuffer:
+    """
+    In-process stand-in for the Redis buffer. Deltas are only visible to the process that recorded them,
+    so it is meant for tests and single-process development servers.
+    """
+
+    def __init__(self):
+        self._deltas = {}
+        self._flushing = {}
+        self._draining = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def merge(deltas, more_deltas):
+        for key, (sum_change, count_change) in more_deltas.items():
+            old_sum, old_count = deltas.get(key, (0, 0))
+            deltas[key] = (old_sum + sum_change, old_count + count_change)
+
+    def add(self, deltas):
+        with self._lock:
+            self.merge(self._deltas, deltas)
+
+    def get_many(self, content_ids):
+        with self._lock:
+            deltas = {}
+            for pending in (self._flushing, self._deltas):
+                self.merge(deltas, {content_id: pending[content_id] for content_id in content_ids
+                                    if content_id in pending})
+            return deltas
+
+    def drain(self):
+        with self._lock:
+            if self._draining:
+                return DrainedDeltas(self)
+            self._draining = True
+            self.merge(self._flushing, self._deltas)
+            self._deltas = {}
+            return DrainedDeltas(self, self._flushing)
+
+    def acknowledge(self, flushing_keys, keys):
+        with self._lock:
+            for key in keys:
+                self._flushing.pop(key, None)
+
+    def release(self, flushing_keys, token):
+        with self._lock:
+            self._draining = False
+
+
+class RedisScoreDeltaBuffer:
+    """
+    Keeps pending deltas in a single Redis hash with `<content_id>:sum` and `<content_id>:count` fields.
+    """
+    KEY = 'content:score_deltas'
+    # A drain holds this lease until it is released, so drains never overlap; one that crashed lets it expire.
+    FLUSH_LEASE_SECONDS = 600
+    # Moves the live hash to the given flushing key and lists every flushing key not acknowledged yet, in one step.
+    # Increments that arrive while flushing land in a fresh hash; the set outlives a flush that crashed.
+    DETACH_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        redis.call('RENAME', KEYS[1], KEYS[2])
+        redis.call('SADD', KEYS[3], KEYS[2])
+    end
+    return redis.call('SMEMBERS', KEYS[3])
+    """
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+        self.detach_script = self.client.register_script(self.DETACH_SCRIPT)
+        self.release_script = self.client.register_script(self.RELEASE_SCRIPT)
+
+    def add(self, deltas):
+        pipeline = self.client.pipeline(transaction=True)
+        for content_id, (sum_change, count_change) in deltas.items():
+            pipeline.hincrby(self.KEY, f'{self.encode_key(content_id)}:sum', sum_change)
+            pipeline.hincrby(self.KEY, f'{self.encode_key(content_id)}:count', count_change)
+        pipeline.execute()
+
+    @staticmethod
+    def encode_key(content_id):
+        return str(content_id)
+
+    @staticmethod
+    def decode_key(field):
+        return int(field)
+
+    def get_fields(self, keys):
+        return [field for key in keys for field in (f'{self.encode_key(key)}:sum', f'{self.encode_key(key)}:count')]
+
+    def get_many(self, content_ids):
+        """
+        Adds up the deltas of the live hash and of the flushing hashes that were not acknowledged yet.
+        The flushing set is watched, so a drain that detaches the live hash meanwhile makes the read start over.
+        """
+        content_ids = list(content_ids)
+        if not content_ids:
+            return {}
+
+        fields = self.get_fields(content_ids)
+
+        def read_hashes(pipeline):
+            hash_keys = [self.KEY, *pipeline.smembers(f'{self.KEY}:flushing')]
+            pipeline.multi()
+            for hash_key in hash_keys:
+                pipeline.hmget(hash_key, fields)
+
+        deltas = {}
+        for values in self.client.transaction(read_hashes, f'{self.KEY}:flushing'):
+            for index, content_id in enumerate(content_ids):
+                sum_change, count_change = values[2 * index], values[2 * index + 1]
+                if sum_change is not None or count_change is not None:
+                    old_sum, old_count = deltas.get(content_id, (0, 0))
+                    deltas[content_id] = (old_sum + int(sum_change or 0), old_count + int(count_change or 0))
+        return deltas
+
+    def drain(self):
+        """
+        Takes the pending deltas, together with those earlier drains did not acknowledge. The flushing hashes are
+        only read: `acknowledge` deletes the fields that were written, and `release` ends the drain.
+        While another drain holds the lease nothing is taken.
+        """
+        token = uuid.uuid4().hex
+        if not self.client.set(f'{self.KEY}:flush_lease', token, nx=True, ex=self.FLUSH_LEASE_SECONDS):
+            return DrainedDeltas(self)
+
+        flushing_keys = self.detach_script(
+            keys=[self.KEY, f'{self.KEY}:flushing:{uuid.uuid4().hex}', f'{self.KEY}:flushing'])
+        pipeline = self.client.pipeline(transaction=False)
+        for flushing_key in flushing_keys:
+            pipeline.hgetall(flushing_key)
+
+        deltas = {}
+        for raw_deltas in pipeline.execute():
+            for field, value in raw_deltas.items():
+                key, kind = field.decode().rsplit(':', 1)
+                key = self.decode_key(key)
+                sum_change, count_change = deltas.get(key, (0, 0))
+                if kind == 'sum':
+                    sum_change += int(value)
+                else:
+                    count_change += int(value)
+                deltas[key] = (sum_change, count_change)
+        return DrainedDeltas(self, deltas, flushing_keys, token)
+
+    def acknowledge(self, flushing_keys, keys):
+        fields = self.get_fields(keys)
+        if not fields:
+            return
+        pipeline = self.client.pipeline(transaction=True)
+        for flushing_key in flushing_keys:
+            pipeline.hdel(flushing_key, *fields)
+        pipeline.execute()
+
+    def release(self, flushing_keys, token):
+        """
+        Forgets the flushing hashes that were acknowledged completely, which Redis deleted with their last field,
+        and gives up the lease.
+        """
+        if token is None:
+            return
+        pipeline = self.client.pipeline(transaction=False)
+        for flushing_key in flushing_keys:
+            pipeline.exists(flushing_key)
+        emptied_keys = [key for key, exists in zip(flushing_keys, pipeline.execute()) if not exists]
+        if emptied_keys:
+            self.client.srem(f'{self.KEY}:flushing', *emptied_keys)
+        self.release_script(keys=[f'{self.KEY}:flush_lease'], args=[token])
+
+
+class RedisBucketDeltaBuffer(RedisScoreDeltaBuffer):
+    """
+    The same buffer for hourly bucket deltas, keyed by `(content_id, hour)`, with `<content_id>@<hour>` fields
+    where the hour is a Unix timestamp.
+    """
+    KEY = 'content:bucket_deltas'
+
+    @staticmethod
+    def encode_key(key):
+        content_id, hour = key
+        return f'{content_id}@{int(hour.timestamp())}'
+
+    @staticmethod
+    def decode_key(field):
+        content_id, hour = field.split('@')
+        return int(content_id), datetime.fromtimestamp(int(hour), datetime_timezone.utc)
+
+
+_buffers = {}
+
+
+def get_delta_buffer(redis_class):
+    backend = settings.CONTENT_SCORE_BUFFER_BACKEND
+    key = (redis_class, backend, settings.CONTENT_SCORE_BUFFER_REDIS_URL)
+    if key not in _buffers:
+        if backend == 'redis':
+            _buffers[key] = redis_class(settings.CONTENT_SCORE_BUFFER_REDIS_URL)
+        elif backend == 'local':
+            _buffers[key] = LocalScoreDeltaBuffer()
+        else:
+            raise Exception("score delta buffer backend {} is not valid".format(backend))
+    return _buffers[key]
+
+
+def get_score_delta_buffer():
+    return get_delta_buffer(RedisScoreDeltaBuffer)
+
+
+def get_bucket_delta_buffer():
+    """
+    Buffer of the `(content_id, hour)` keyed hourly bucket deltas of write-behind mode.
+    """
+    return get_delta_buffer(RedisBucketDeltaBuffer)
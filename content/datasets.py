@@ -0,0 +1,182 @@
+import logging
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+from content.cache import bump_content_list_version
+from content.models import Content, ContentScore, UpdateContentMeanScoreEvent, ContentHourlyScore
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DatasetSpec:
+    """
+    Shape of a synthetic dataset. The same spec, seed and `end` always produce the same rows on an empty database.
+    """
+    users: int = 100
+    contents: int = 5
+    scores_per_content: int = 100
+    span_hours: int = 24
+    # Share of the contents that get an attack surge: their last `surge_users` scorers give
+    # `surge_scores` within the last `surge_hours`, like the `initialize_db` scenario.
+    surge_ratio: float = 1.0
+    surge_users: int = 20
+    surge_hours: int = 4
+    surge_scores: tuple = (0, 1)
+    seed: int = 0
+    batch_size: int = 1000
+    username_prefix: str = 'user'
+    end: object = None
+
+    def validate(self):
+        if self.scores_per_content > self.users:
+            raise Exception("scores per content {} is not valid for {} users".format(self.scores_per_content, self.users))
+        if self.surge_users > self.scores_per_content:
+            raise Exception("surge users {} is not valid for {} scores per content".format(
+                self.surge_users, self.scores_per_content))
+        if not 0 < self.surge_hours < self.span_hours:
+            raise Exception("surge hours {} is not valid for a span of {} hours".format(self.surge_hours, self.span_hours))
+
+
+def create_users(spec):
+    """
+    Creates the missing `<prefix><n>` users and returns all their ids in `n` order.
+    """
+    usernames = [f'{spec.username_prefix}{i}' for i in range(1, spec.users + 1)]
+    # One unusable password hash is enough, hashing per user would dominate the run.
+    password = make_password(None)
+    for start in range(0, len(usernames), spec.batch_size):
+        User.objects.bulk_create(
+            [User(username=username, password=password) for username in usernames[start:start + spec.batch_size]],
+            ignore_conflicts=True,
+        )
+
+    user_ids = {}
+    for start in range(0, len(usernames), spec.batch_size):
+        user_ids.update(
+            User.objects.filter(username__in=usernames[start:start + spec.batch_size]).values_list('username', 'id')
+        )
+    return [user_ids[username] for username in usernames]
+
+
+def generate_content_scores(rng, spec, end, surged):
+    """
+    Returns `(user_index, score, scored_at)` triples for one content, the surge scores last.
+    """
+    user_indexes = rng.sample(range(spec.users), spec.scores_per_content)
+    normal_count = spec.scores_per_content - spec.surge_users if surged else spec.scores_per_content
+    normal_since = spec.surge_hours if surged else 0
+    quality = rng.uniform(2.5, 5)
+
+    scores = []
+    for position, user_index in enumerate(user_indexes):
+        if position < normal_count:
+            score = min(5, max(0, round(rng.gauss(quality, 1))))
+            seconds_ago = rng.uniform(normal_since * 3600, spec.span_hours * 3600)
+        else:
+            score = rng.randint(*spec.surge_scores)
+            seconds_ago = rng.uniform(0, spec.surge_hours * 3600)
+        scores.append((user_index, score, end - timedelta(seconds=seconds_ago)))
+    return scores
+
+
+def create_content_batch(spec, user_ids, first_number, generated_scores, end):
+    """
+    Writes one batch of contents with their scores, events and hourly buckets. Everything derived is computed
+    here, so the `save()` overrides are skipped and `bulk_create` can write each table in a few statements.
+    The ids of the new contents are read back by position, so nothing else may insert contents meanwhile.
+    """
+    contents = []
+    for number, scores in enumerate(generated_scores, start=first_number):
+        score_sum, score_count = sum(score for _, score, _ in scores), len(scores)
+        score_mean = score_sum / score_count if score_count else None
+        contents.append(Content(
+            title=f'Content {number}', text=f'This is the content text for item {number}.',
+            score_sum=score_sum, score_count=score_count, score_mean=score_mean, effective_score=score_mean,
+            score_changed_at=end if score_count else None,
+        ))
+
+    # MySQL does not return the ids of bulk created rows, so they are read back in insertion order.
+    last_id = Content.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    Content.objects.bulk_create(contents, batch_size=spec.batch_size)
+    content_ids = list(Content.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True))
+    if len(content_ids) != len(contents):
+        raise Exception("content batch of {} rows read back {} ids; another writer inserted contents".format(
+            len(contents), len(content_ids)))
+
+    content_scores, buckets = [], {}
+    for content_id, scores in zip(content_ids, generated_scores):
+        for user_index, score, scored_at in scores:
+            content_score = ContentScore(user_id=user_ids[user_index], content_id=content_id, score=score,
+                                         scored_at=scored_at)
+            content_scores.append(content_score)
+            ContentHourlyScore.get_bucket_deltas(None, content_score, buckets)
+    ContentScore.objects.bulk_create(content_scores, batch_size=spec.batch_size)
+
+    content_score_ids = {
+        (user_id, content_id): content_score_id
+        for content_score_id, user_id, content_id in ContentScore.objects.filter(content_id__in=content_ids)
+        .values_list('id', 'user_id', 'content_id')
+    }
+    UpdateContentMeanScoreEvent.objects.bulk_create([
+        UpdateContentMeanScoreEvent(
+            content_id=content_score.content_id,
+            content_score_id=content_score_ids[(content_score.user_id, content_score.content_id)],
+            type=UpdateContentMeanScoreEvent.Type.ADD_SCORE,
+            new_score=content_score.score,
+        )
+        for content_score in content_scores
+    ], batch_size=spec.batch_size)
+    # `occurred_at` is set on insert, so events get the times of their scores afterwards, which retention sees.
+    UpdateContentMeanScoreEvent.objects.filter(content_id__in=content_ids).update(occurred_at=Subquery(
+        ContentScore.objects.filter(id=OuterRef('content_score_id')).values('scored_at')[:1]
+    ))
+    ContentHourlyScore.objects.bulk_create([
+        ContentHourlyScore(content_id=content_id, hour=hour, score_sum=score_sum, score_count=score_count)
+        for (content_id, hour), (score_sum, score_count) in buckets.items()
+    ], batch_size=spec.batch_size)
+    return content_ids, len(content_scores), len(buckets)
+
+
+def generate_dataset(spec, progress=None):
+    """
+    Creates the users, contents and scores described by `spec`, with counters, materialized scores,
+    score events and hourly buckets consistent with what the regular write path would have produced.
+    """
+    spec.validate()
+    rng = random.Random(spec.seed)
+    end = spec.end or timezone.now()
+
+    user_ids = create_users(spec)
+    content_ids, score_count, bucket_count = [], 0, 0
+    contents_per_batch = max(1, spec.batch_size // max(1, spec.scores_per_content))
+    for first_index in range(0, spec.contents, contents_per_batch):
+        batch_length = min(contents_per_batch, spec.contents - first_index)
+        generated_scores = [
+            generate_content_scores(rng, spec, end, surged=rng.random() < spec.surge_ratio)
+            for _ in range(batch_length)
+        ]
+        with transaction.atomic():
+            batch_content_ids, batch_score_count, batch_bucket_count = create_content_batch(
+                spec, user_ids, first_index + 1, generated_scores, end)
+        content_ids += batch_content_ids
+        score_count += batch_score_count
+        bucket_count += batch_bucket_count
+        if progress is not None:
+            progress(len(content_ids), score_count)
+
+    bump_content_list_version()
+    logger.info(f"Generated {len(content_ids)} contents and {score_count} scores with seed {spec.seed}.")
+    return {
+        'users': len(user_ids),
+        'contents': content_ids,
+        'scores': score_count,
+        'buckets': bucket_count,
+    }
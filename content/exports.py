@@ -0,0 +1,75 @@
+import csv
+import json
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from content.models import ContentScore, UpdateContentMeanScoreEvent
+
+EXPORTS = {
+    'scores': {
+        'model': ContentScore,
+        'fields': ('id', 'user_id', 'content_id', 'score', 'scored_at'),
+        'time_field': 'scored_at',
+    },
+    'events': {
+        'model': UpdateContentMeanScoreEvent,
+        'fields': ('id', 'content_id', 'content_score_id', 'type', 'old_score', 'new_score', 'occurred_at'),
+        'time_field': 'occurred_at',
+    },
+}
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+
+def get_export_queryset(kind, content=None, since=None, until=None, after_id=None):
+    export = EXPORTS[kind]
+    queryset = export['model'].objects.all()
+    if content is not None:
+        queryset = queryset.filter(content_id=content)
+    if since is not None:
+        queryset = queryset.filter(**{f"{export['time_field']}__gte": since})
+    if until is not None:
+        queryset = queryset.filter(**{f"{export['time_field']}__lt": until})
+    if after_id is not None:
+        queryset = queryset.filter(id__gt=after_id)
+    return queryset.order_by('id')
+
+
+def iter_export_rows(kind, queryset, chunk_size=2000):
+    """
+    Yields the export rows in id order, one bounded keyset query per chunk. Unlike `.iterator()` this keeps
+    memory flat on MySQL too, where the driver buffers whole result sets.
+    """
+    fields = EXPORTS[kind]['fields']
+    last_id = None
+    while True:
+        chunk_queryset = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = list(chunk_queryset.values_list(*fields)[:chunk_size])
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+
+class Echo:
+    """
+    File-like object whose `write` hands the line back, so `csv.writer` can feed a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def render_export(kind, rows, output_format):
+    fields = EXPORTS[kind]['fields']
+    if output_format == 'csv':
+        encoder = DjangoJSONEncoder()
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([encoder.default(value) if isinstance(value, datetime) else value for value in row])
+    elif output_format == 'ndjson':
+        for row in rows:
+            yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+    else:
+        raise Exception("export format {} is not valid".format(output_format))
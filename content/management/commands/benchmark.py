@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import setup_test_environment, teardown_test_environment, override_settings
+
+from content.benchmark import SIZES, OPERATIONS, Benchmark, prepare_dataset, get_environment, compare_results
+
+
+def get_isolated_settings():
+    """
+    Process-local stand-ins for the shared Redis cache, delta buffers and admission buckets, so the benchmark
+    never clears or fills those of a deployment it is pointed at. Admission control stays on if it was.
+    """
+    return override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}},
+        CONTENT_SCORE_BUFFER_BACKEND='local',
+        CONTENT_SCORE_ADMISSION_BACKEND='local' if settings.CONTENT_SCORE_ADMISSION_BACKEND else '',
+    )
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the content list, score and normalization paths on freshly seeded throwaway databases '
+            'and optionally compare the results with a saved baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', action='append', choices=sorted(SIZES),
+                            help='Dataset size to benchmark, can be repeated (default: small)')
+        parser.add_argument('--operation', action='append', choices=OPERATIONS,
+                            help='Operation to benchmark, can be repeated (default: all)')
+        parser.add_argument('--iterations', type=int, default=100, help='Requests per operation')
+        parser.add_argument('--concurrency', type=int, default=8, help='Writers scoring the same content')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--database', default='default', help='Database alias the throwaway databases copy')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Baseline JSON file to flag regressions against')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Relative slowdown tolerated before a metric counts as a regression')
+
+    def handle(self, *args, **options):
+        sizes = options['size'] or ['small']
+        operations = options['operation'] or list(OPERATIONS)
+        results = {'environment': get_environment(), 'results': {}}
+
+        setup_test_environment()
+        try:
+            with get_isolated_settings():
+                for size in sizes:
+                    results['results'][size] = self.benchmark_size(size, operations, options)
+        finally:
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}.')
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                regressions = compare_results(json.load(baseline_file), results, options['tolerance'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(
+                    '{size} {operation} {metric}: {baseline:.2f} -> {current:.2f}'.format(**regression)))
+            if regressions:
+                raise CommandError(f'{len(regressions)} metrics regressed against {options["compare"]}.')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["compare"]}.'))
+
+    def benchmark_size(self, size, operations, options):
+        connection = connections[options['database']]
+        old_test_name = connection.settings_dict['TEST'].get('NAME')
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # A file database, unlike the in-memory test database, can be shared by the concurrent writers.
+                connection.settings_dict['TEST']['NAME'] = os.path.join(directory, f'benchmark_{size}.sqlite3')
+            old_name = connection.settings_dict['NAME']
+            try:
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                started_at = time.monotonic()
+                spec = prepare_dataset(size, options['seed'])
+                self.stdout.write(f'Seeded the {size} dataset in {time.monotonic() - started_at:.1f}s.')
+
+                benchmark = Benchmark(spec, options['iterations'], options['concurrency'], options['seed'])
+                size_results = {}
+                for name in operations:
+                    size_results[name] = stats = benchmark.run_operation(name)
+                    self.stdout.write(
+                        f'{size} {name}: {stats["throughput"]:.1f} ops/s, p50 {stats["p50_ms"]:.2f}ms, '
+                        f'p95 {stats["p95_ms"]:.2f}ms, p99 {stats["p99_ms"]:.2f}ms, '
+                        f'{stats["queries_mean"]:.1f} queries, {stats["errors"]} errors')
+                return size_results
+            finally:
+                if connection.settings_dict['NAME'] != old_name:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+                connection.settings_dict['TEST']['NAME'] = old_test_name
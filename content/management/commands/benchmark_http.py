@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from content.benchmark import run_http_load
+
+
+class Command(BaseCommand):
+    help = ('Load a running server with concurrent requests and report throughput and latency percentiles, '
+            'e.g. to compare the sync and the ASGI deployment at the same worker count')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Target url; `{index}` is replaced by the request number')
+        parser.add_argument('--method', default='GET')
+        parser.add_argument('--data', help='JSON body; `{index}` is replaced by the request number')
+        parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight at once')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests sent in total')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        stats = run_http_load(options['url'], options['concurrency'], options['requests'], options['method'].upper(),
+                              options['data'])
+        stats.update(url=options['url'], concurrency=options['concurrency'])
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(stats, output_file, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["url"]}: {stats["throughput"]:.1f} requests/s, p50 {stats["p50_ms"]:.2f}ms, '
+            f'p95 {stats["p95_ms"]:.2f}ms, p99 {stats["p99_ms"]:.2f}ms, {stats["errors"]} errors '
+            f'at concurrency {options["concurrency"]}'))
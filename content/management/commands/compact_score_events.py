@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from content.models import UpdateContentMeanScoreEvent
+
+
+class Command(BaseCommand):
+    help = 'Fold score events older than the retention window into per-content summaries and delete them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=settings.SCORE_EVENT_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=settings.SCORE_EVENT_COMPACTION_BATCH_SIZE,
+                            help='Events compacted per transaction')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many events would be compacted')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['retention_days'])
+        if options['dry_run']:
+            count = UpdateContentMeanScoreEvent.objects.filter(occurred_at__lt=before).count()
+            self.stdout.write(f'{count} score events occurred before {before} and would be compacted.')
+            return
+
+        started_at = time.monotonic()
+        compacted_count, batch_count = 0, 0
+        while options['max_batches'] is None or batch_count < options['max_batches']:
+            count = UpdateContentMeanScoreEvent.compact_batch(before, options['batch_size'])
+            if not count:
+                break
+            compacted_count += count
+            batch_count += 1
+            elapsed = time.monotonic() - started_at
+            self.stdout.write(
+                f'Batch {batch_count}: {compacted_count} events compacted ({compacted_count / elapsed:.0f} events/s).')
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully compacted {compacted_count} score events older than {before} '
+            f'in {batch_count} batches and {elapsed:.1f}s.'))
@@ -0,0 +1,54 @@
+from argparse import ArgumentTypeError
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from content.exports import EXPORTS, EXPORT_FORMATS, get_export_queryset, iter_export_rows, render_export
+
+
+def parse_aware_datetime(value):
+    """
+    Parses an ISO timestamp for the time filters, in the current time zone when it has none.
+    A malformed value is rejected instead of dropping the filter.
+    """
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ArgumentTypeError("datetime {} is not valid".format(value))
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Stream ContentScore or UpdateContentMeanScoreEvent rows as NDJSON or CSV with flat memory use'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS))
+        parser.add_argument('--content', type=int, help='Only export rows of this content id')
+        parser.add_argument('--since', type=parse_aware_datetime, help='Only export rows at or after this time')
+        parser.add_argument('--until', type=parse_aware_datetime, help='Only export rows before this time')
+        parser.add_argument('--after-id', type=int, help='Resume after this row id')
+        parser.add_argument('--format', dest='output_format', choices=EXPORT_FORMATS, default='ndjson')
+        parser.add_argument('--chunk-size', type=int, default=settings.CONTENT_EXPORT_CHUNK_SIZE,
+                            help='Rows read per query')
+        parser.add_argument('--output', help='File to write to, stdout by default')
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        queryset = get_export_queryset(
+            kind, content=options['content'], since=options['since'], until=options['until'],
+            after_id=options['after_id'],
+        )
+        lines = render_export(kind, iter_export_rows(kind, queryset, options['chunk_size']), options['output_format'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,74 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from content.datasets import DatasetSpec, generate_dataset
+from content.models import Content
+
+
+class Command(BaseCommand):
+    help = ('Generate a reproducible synthetic dataset of users, contents and scores with bulk inserts, '
+            'including attack surges of low scores')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--contents', type=int, default=5)
+        parser.add_argument('--scores-per-content', type=int, default=100)
+        parser.add_argument('--span-hours', type=int, default=24, help='Hours the scores are spread over')
+        parser.add_argument('--surge-ratio', type=float, default=1.0, help='Share of the contents that get a surge')
+        parser.add_argument('--surge-users', type=int, default=20, help='Scorers of a surged content that attack it')
+        parser.add_argument('--surge-hours', type=int, default=4, help='Final hours the surge scores fall in')
+        parser.add_argument('--surge-min-score', type=int, default=0)
+        parser.add_argument('--surge-max-score', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--end', help='ISO timestamp of the newest score, fix it to reproduce the same data')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per insert statement')
+        parser.add_argument('--username-prefix', default='user')
+        parser.add_argument('--normalize', action='store_true',
+                            help='Compute normalized_score_mean of the generated contents afterwards')
+
+    def handle(self, *args, **options):
+        end = None
+        if options['end']:
+            end = datetime.fromisoformat(options['end'])
+            if timezone.is_naive(end):
+                end = timezone.make_aware(end)
+
+        spec = DatasetSpec(
+            users=options['users'],
+            contents=options['contents'],
+            scores_per_content=options['scores_per_content'],
+            span_hours=options['span_hours'],
+            surge_ratio=options['surge_ratio'],
+            surge_users=options['surge_users'],
+            surge_hours=options['surge_hours'],
+            surge_scores=(options['surge_min_score'], options['surge_max_score']),
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            username_prefix=options['username_prefix'],
+            end=end,
+        )
+        try:
+            spec.validate()
+        except Exception as e:
+            raise CommandError(str(e))
+
+        started_at = time.monotonic()
+
+        def report_progress(content_count, score_count):
+            elapsed = time.monotonic() - started_at
+            self.stdout.write(f'{content_count} contents and {score_count} scores ({score_count / elapsed:.0f} scores/s).')
+
+        result = generate_dataset(spec, progress=report_progress)
+
+        if options['normalize']:
+            content_ids = result['contents']
+            for start in range(0, len(content_ids), spec.batch_size):
+                Content.normalize_batch(list(Content.objects.filter(id__in=content_ids[start:start + spec.batch_size])))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully generated {result["users"]} users, {len(result["contents"])} contents, '
+            f'{result["scores"]} scores and {result["buckets"]} hourly buckets with seed {spec.seed} '
+            f'in {time.monotonic() - started_at:.1f}s.'))
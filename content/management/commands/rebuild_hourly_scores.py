@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from content.models import Content, ContentHourlyScore
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the hourly score rollup of every content from its ContentScore rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of contents rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        content_ids = list(Content.objects.order_by('id').values_list('id', flat=True))
+
+        bucket_count = 0
+        for start in range(0, len(content_ids), batch_size):
+            bucket_count += ContentHourlyScore.rebuild(content_ids[start:start + batch_size])
+            self.stdout.write(f'Rebuilt {min(start + batch_size, len(content_ids))}/{len(content_ids)} contents.')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully rebuilt {bucket_count} hourly score buckets for {len(content_ids)} contents.'))
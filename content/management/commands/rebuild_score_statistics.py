@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from content.models import Content, ContentHourlyScore, ContentScoreStatistics
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the running bucket statistics of the online normalization mode from the hourly buckets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of contents rebuilt per transaction')
+        parser.add_argument('--decay', type=float, default=settings.CONTENT_NORMALIZATION_DECAY,
+                            help='Weight kept by the older buckets whenever a bucket is folded in')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        before = ContentHourlyScore.truncate_to_hour(timezone.now())
+        content_ids = list(Content.objects.order_by('id').values_list('id', flat=True))
+
+        bucket_count = 0
+        for start in range(0, len(content_ids), batch_size):
+            bucket_count += ContentScoreStatistics.rebuild(
+                content_ids[start:start + batch_size], before, decay=options['decay'])
+            self.stdout.write(f'Rebuilt {min(start + batch_size, len(content_ids))}/{len(content_ids)} contents.')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully folded {bucket_count} hourly buckets closed before {before} '
+            f'into the statistics of {len(content_ids)} contents.'))
@@ -0,0 +1,143 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Count, Max, Sum
+
+from content.counters import get_score_delta_buffer
+from content.models import Content, ContentScore
+
+RENORMALIZATION_BATCH_SIZE = 500
+
+
+def close_inherited_connections():
+    # Forked workers must not share the parent's database connections.
+    connections.close_all()
+
+
+def renormalize_range(first_id, last_id, z_threshold):
+    contents = Content.objects.filter(id__gte=first_id, id__lt=last_id).only(
+        'id', 'score_sum', 'score_count', 'normalized_score_mean'
+    ).order_by('id')
+
+    normalized_count, last_normalized_id = 0, first_id - 1
+    while True:
+        batch = list(contents.filter(id__gt=last_normalized_id)[:RENORMALIZATION_BATCH_SIZE])
+        if not batch:
+            return normalized_count
+        Content.normalize_batch(batch, z_threshold)
+        normalized_count += len(batch)
+        last_normalized_id = batch[-1].id
+
+
+class Command(BaseCommand):
+    help = ('Rebuild Content.score_sum/score_count from ContentScore with grouped queries per id range, '
+            'report the drift and optionally renormalize every content')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Width of each content id range')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drift')
+        parser.add_argument('--renormalize', action='store_true',
+                            help='Recompute normalized_score_mean of every content afterwards')
+        parser.add_argument('--z-threshold', type=float, default=2.0)
+        parser.add_argument('--workers', type=int, default=1, help='Processes used for renormalization')
+        parser.add_argument('--checkpoint', help='JSON file recording progress, so an interrupted run resumes')
+
+    def handle(self, *args, **options):
+        self.checkpoint_path = options['checkpoint']
+        self.checkpoint = self.load_checkpoint()
+        max_id = Content.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        chunk_size = options['chunk_size']
+
+        started_at = time.monotonic()
+        drifted_count = 0
+        first_id = self.checkpoint.get('reconciled_through', 0) + 1
+        for start in range(first_id, max_id + 1, chunk_size):
+            drifted_count += self.reconcile_range(start, start + chunk_size, options['dry_run'])
+            if not options['dry_run']:
+                self.save_checkpoint(reconciled_through=start + chunk_size - 1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Found {drifted_count} contents with drifted counters '
+            f'({"not fixed, dry run" if options["dry_run"] else "fixed"}) in {time.monotonic() - started_at:.1f}s.'))
+
+        if options['renormalize'] and not options['dry_run']:
+            self.renormalize(max_id, chunk_size, options['z_threshold'], options['workers'])
+
+    def reconcile_range(self, first_id, last_id, dry_run):
+        with transaction.atomic():
+            # Locking the content rows first holds back writers of this range until the counters are fixed,
+            # so the aggregate and the stored counters describe the same scores.
+            stored = {
+                content_id: (score_sum, score_count)
+                for content_id, score_sum, score_count in Content.objects.filter(id__gte=first_id, id__lt=last_id)
+                .select_for_update().values_list('id', 'score_sum', 'score_count')
+            }
+            actual = {
+                row['content_id']: (row['score_sum'], row['score_count'])
+                for row in ContentScore.objects.filter(content_id__gte=first_id, content_id__lt=last_id)
+                .values('content_id').annotate(score_sum=Sum('score'), score_count=Count('id')).order_by()
+            }
+
+            if settings.CONTENT_SCORE_WRITE_BEHIND:
+                # Buffered deltas will still be flushed, so they count as stored; so do those a running flush took
+                # but did not acknowledge, since the flush has to wait for these row locks to write them.
+                for content_id, (pending_sum, pending_count) in get_score_delta_buffer().get_many(stored).items():
+                    stored_sum, stored_count = stored[content_id]
+                    stored[content_id] = (stored_sum + pending_sum, stored_count + pending_count)
+
+            deltas = {}
+            for content_id, (stored_sum, stored_count) in stored.items():
+                actual_sum, actual_count = actual.get(content_id, (0, 0))
+                if (actual_sum, actual_count) != (stored_sum, stored_count):
+                    deltas[content_id] = (actual_sum - stored_sum, actual_count - stored_count)
+                    self.stdout.write(
+                        f'Content {content_id}: score_sum {stored_sum} -> {actual_sum}, '
+                        f'score_count {stored_count} -> {actual_count}')
+
+            if deltas and not dry_run:
+                Content.write_score_deltas(deltas)
+        return len(deltas)
+
+    def renormalize(self, max_id, chunk_size, z_threshold, workers):
+        started_at = time.monotonic()
+        first_id = self.checkpoint.get('renormalized_through', 0) + 1
+        ranges = [(start, start + chunk_size) for start in range(first_id, max_id + 1, chunk_size)]
+
+        normalized_count = 0
+        if workers > 1:
+            context = multiprocessing.get_context('fork')
+            connections.close_all()
+            with ProcessPoolExecutor(workers, mp_context=context, initializer=close_inherited_connections) as pool:
+                # Ranges are submitted in waves so the checkpoint only ever covers fully finished ranges.
+                for wave_start in range(0, len(ranges), workers):
+                    wave = ranges[wave_start:wave_start + workers]
+                    futures = [pool.submit(renormalize_range, start, end, z_threshold) for start, end in wave]
+                    normalized_count += sum(future.result() for future in futures)
+                    self.save_checkpoint(renormalized_through=wave[-1][1] - 1)
+                    self.stdout.write(f'Renormalized {normalized_count} contents up to id {wave[-1][1] - 1}.')
+        else:
+            for start, end in ranges:
+                normalized_count += renormalize_range(start, end, z_threshold)
+                self.save_checkpoint(renormalized_through=end - 1)
+                self.stdout.write(f'Renormalized {normalized_count} contents up to id {end - 1}.')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully renormalized {normalized_count} contents in {time.monotonic() - started_at:.1f}s.'))
+
+    def load_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as checkpoint_file:
+                return json.load(checkpoint_file)
+        return {}
+
+    def save_checkpoint(self, **progress):
+        self.checkpoint.update(progress)
+        if self.checkpoint_path:
+            with open(self.checkpoint_path, 'w') as checkpoint_file:
+                json.dump(self.checkpoint, checkpoint_file)
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.16 on 2026-10-18 04:50
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+import django.db.models.deletion
+
+
+def populate_hourly_scores(apps, schema_editor):
+    ContentScore = apps.get_model('content', 'ContentScore')
+    ContentHourlyScore = apps.get_model('content', 'ContentHourlyScore')
+
+    hourly_data = (
+        ContentScore.objects.annotate(hour=TruncHour('scored_at'))
+        .values('content_id', 'hour')
+        .annotate(score_count=Count('id'), score_sum=Sum('score'))
+        .order_by('content_id', 'hour')
+    )
+    ContentHourlyScore.objects.bulk_create(
+        (ContentHourlyScore(**bucket) for bucket in hourly_data.iterator()), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentHourlyScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('score_count', models.IntegerField(default=0)),
+                ('score_sum', models.IntegerField(default=0)),
+                ('content', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='content.content')),
+            ],
+            options={
+                'unique_together': {('content', 'hour')},
+            },
+        ),
+        migrations.RunPython(populate_hourly_scores, migrations.RunPython.noop),
+    ]
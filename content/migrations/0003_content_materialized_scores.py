@@ -0,0 +1,46 @@
+# Generated by Django 4.2.16 on 2026-10-18 04:57
+
+from django.db import migrations, models
+from django.db.models import Case, F, FloatField, When
+from django.db.models.functions import Abs, Cast
+from django.db.models.lookups import LessThan
+
+
+def populate_materialized_scores(apps, schema_editor):
+    Content = apps.get_model('content', 'Content')
+
+    score_mean = Cast(F('score_sum'), FloatField()) / F('score_count')
+    Content.objects.filter(score_count__gt=0).update(
+        score_mean=score_mean,
+        effective_score=Case(
+            When(normalized_score_mean__isnull=True, then=score_mean),
+            When(LessThan(Abs(F('normalized_score_mean') - score_mean), 1), then=score_mean),
+            default=F('normalized_score_mean'),
+            output_field=FloatField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0002_contenthourlyscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='effective_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='score_mean',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(fields=['effective_score', 'id'], name='content_effective_score_idx'),
+        ),
+        migrations.RunPython(populate_materialized_scores, migrations.RunPython.noop),
+    ]
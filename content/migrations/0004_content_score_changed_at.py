@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 04:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0003_content_materialized_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='score_changed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
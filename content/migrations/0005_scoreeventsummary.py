@@ -0,0 +1,27 @@
+# Generated by Django 4.2.16 on 2026-10-18 04:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0004_content_score_changed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreEventSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('add_count', models.IntegerField(default=0)),
+                ('update_count', models.IntegerField(default=0)),
+                ('score_change_sum', models.IntegerField(default=0)),
+                ('first_occurred_at', models.DateTimeField(blank=True, null=True)),
+                ('last_occurred_at', models.DateTimeField(blank=True, null=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('content', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='content.content')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-18 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0005_scoreeventsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contentscore',
+            name='previous_score',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='contentscore',
+            name='previous_scored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.16 on 2026-10-18 05:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0006_contentscore_previous_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentScoreStatistics',
+            fields=[
+                ('content', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='content.content')),
+                ('bucket_weight', models.FloatField(default=0)),
+                ('bucket_mean', models.FloatField(default=0)),
+                ('bucket_m2', models.FloatField(default=0)),
+                ('closed_through', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='contenthourlyscore',
+            index=models.Index(fields=['hour'], name='content_hourly_score_hour_idx'),
+        ),
+        migrations.AddField(
+            model_name='contenthourlyscore',
+            name='rejected',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='contenthourlyscore',
+            index=models.Index(fields=['content', 'rejected'], name='content_hourly_rejected_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-18 05:22
+
+from django.db import migrations, models
+import django.db.models.functions.datetime
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0007_contentscorestatistics'),
+    ]
+
+    operations = [
+        # The schema editor cannot fill existing rows from a SQL expression, so they are stamped with the time of
+        # the migration before the field gets the database clock default of the model.
+        migrations.AddField(
+            model_name='content',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='content',
+            name='modified_at',
+            field=models.DateTimeField(default=django.db.models.functions.datetime.Now),
+        ),
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(fields=['id', 'modified_at'], name='content_modified_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contentscore',
+            index=models.Index(fields=['user', 'scored_at'], name='content_score_user_scored_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 05:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0008_content_modified_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contentscore',
+            index=models.Index(fields=['user', 'content', 'score'], name='content_score_user_lookup_idx'),
+        ),
+    ]
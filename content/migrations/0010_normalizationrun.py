@@ -0,0 +1,32 @@
+# Generated by Django 4.2.16 on 2026-10-18 05:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0009_contentscore_user_lookup_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NormalizationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_id', models.CharField(max_length=32, unique=True)),
+                ('started_at', models.DateTimeField(db_index=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('changed_since', models.DateTimeField(blank=True, null=True)),
+                ('candidate_count', models.IntegerField(default=0)),
+                ('shard_count', models.IntegerField(default=0)),
+                ('normalized_count', models.IntegerField(default=0)),
+                ('updated_count', models.IntegerField(default=0)),
+                ('error_count', models.IntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('estimated_item_time_p50_ms', models.FloatField(blank=True, null=True)),
+                ('estimated_item_time_p99_ms', models.FloatField(blank=True, null=True)),
+                ('estimated_slowest_items', models.JSONField(blank=True, default=list)),
+            ],
+        ),
+    ]
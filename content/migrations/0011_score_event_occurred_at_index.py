@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 05:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0010_normalizationrun'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='updatecontentmeanscoreevent',
+            index=models.Index(fields=['occurred_at'], name='score_event_occurred_at_idx'),
+        ),
+    ]
@@ -1,12 +1,22 @@
 import logging
+import math
+from collections import Counter
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models, transaction
-from django.db.models import Avg, F, Count, ExpressionWrapper, FloatField, Q
-from django.db.models.functions import TruncHour, Abs
+from django.db.models import F, Count, Sum, Min, Max, FloatField, Q, Case, When, Value
+from django.db.models.functions import TruncHour, Abs, Cast, Coalesce, Now
+from django.db.models.lookups import GreaterThan, LessThan, LessThanOrEqual, IsNull
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
-from content.utils import filter_outliers
+from content.cache import bump_content_list_version
+from content.counters import get_score_delta_buffer, get_bucket_delta_buffer
+from content.upserts import upsert_rows, upsert_row_returning, convert_datetime
+from content.utils import filter_outliers, calculate_segmented_normalized_means, update_running_statistics, \
+    is_outlier, get_histogram_percentile
 
 logger = logging.getLogger(__name__)
 
@@ -21,32 +31,159 @@ class Content(models.Model):
     score_sum = models.IntegerField(default=0)
     normalized_score_mean = models.FloatField(null=True, blank=True)
 
+    # Materialized from the columns above by every writer so the score users see can be sorted and filtered on.
+    score_mean = models.FloatField(null=True, blank=True)
+    effective_score = models.FloatField(null=True, blank=True)
+    # Set whenever the counters change, so normalization only has to look at recently scored contents.
+    score_changed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Set by every writer of the listed columns, so list pages can be versioned without reading them.
+    # Always stamped with the database clock, like `score_changed_at`, so stamps of different writers compare.
+    modified_at = models.DateTimeField(default=Now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['effective_score', 'id'], name='content_effective_score_idx'),
+            # Covers the page version query of the list, which reads only these two columns in id order.
+            models.Index(fields=['id', 'modified_at'], name='content_modified_at_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Writes the materialized scores and the database clock stamp in the same statement as the other fields.
+        Counters this save does not write are taken from the row, since they may have moved on since it was read.
+        """
+        update_fields = kwargs.get('update_fields')
+        inputs = {
+            name: Value(getattr(self, name), output_field=self._meta.get_field(name))
+            if update_fields is None or name in update_fields else F(name)
+            for name in ('score_sum', 'score_count', 'normalized_score_mean')
+        }
+        stamped_fields = {**Content.get_materialized_score_expressions(**inputs), 'modified_at': Now()}
+        for name, value in stamped_fields.items():
+            setattr(self, name, value)
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *stamped_fields}
+        super().save(*args, **kwargs)
+        # Only the database knows the stamped values now, so like deferred fields they are read on first access.
+        for name in stamped_fields:
+            del self.__dict__[name]
+        transaction.on_commit(bump_content_list_version)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(bump_content_list_version)
+        return result
+
+    @classmethod
+    def get_materialized_score_expressions(cls, score_sum=F('score_sum'), score_count=F('score_count'),
+                                           normalized_score_mean=F('normalized_score_mean')):
+        """
+        SQL equivalent of `calculate_score_mean` and `get_score` over the given counter and mean expressions.
+        """
+        score_mean = Case(
+            When(GreaterThan(score_count, 0), then=Cast(score_sum, FloatField()) / score_count),
+            default=Value(None),
+            output_field=FloatField(),
+        )
+        effective_score = Case(
+            When(LessThanOrEqual(score_count, 0), then=Value(None)),
+            When(IsNull(normalized_score_mean, True), then=score_mean),
+            When(LessThan(Abs(normalized_score_mean - score_mean), cls.NORMALIZED_MEAN_MAXIMUM_DIFFERENCE),
+                 then=score_mean),
+            default=normalized_score_mean,
+            output_field=FloatField(),
+        )
+        return {'score_mean': score_mean, 'effective_score': effective_score}
+
+    @classmethod
+    def refresh_materialized_scores(cls, content_ids):
+        return cls.objects.filter(id__in=content_ids).update(**cls.get_materialized_score_expressions())
+
     def get_score(self):
-        exact_mean = self.calculate_score_mean()
-        if exact_mean is None:
+        pending_sum, pending_count = self.get_pending_score_delta()
+        return Content.calculate_score(
+            self.score_sum + pending_sum, self.score_count + pending_count, self.normalized_score_mean
+        )
+
+    @staticmethod
+    def calculate_score(score_sum, score_count, normalized_score_mean):
+        """
+        The score users see from plain column values, so list rows can be scored without model instances.
+        """
+        if score_count <= 0:
             return None
+        exact_mean = score_sum / score_count
 
-        if self.normalized_score_mean is None:
+        if normalized_score_mean is None:
             return exact_mean
 
-        if abs(self.normalized_score_mean - exact_mean) < Content.NORMALIZED_MEAN_MAXIMUM_DIFFERENCE:
+        if abs(normalized_score_mean - exact_mean) < Content.NORMALIZED_MEAN_MAXIMUM_DIFFERENCE:
             return exact_mean
         else:
-            return self.normalized_score_mean
+            return normalized_score_mean
 
     def calculate_score_mean(self):
-        if self.score_count > 0:
-            return self.score_sum / self.score_count
+        pending_sum, pending_count = self.get_pending_score_delta()
+        score_count = self.score_count + pending_count
+        if score_count > 0:
+            return (self.score_sum + pending_sum) / score_count
         return None
 
-    def calculate_normalized_score_mean(self, z_threshold=2.0):
-        hourly_data = (
-            ContentScore.objects.filter(content=self)
-            .annotate(hour=TruncHour('scored_at'))
-            .values('hour')
-            .annotate(score_count=Count('id'), score_mean=Avg('score'))
+    def get_score_count(self):
+        return self.score_count + self.get_pending_score_delta()[1]
+
+    def get_pending_score_delta(self):
+        """
+        Returns the `(score_sum, score_count)` deltas that are buffered but not yet flushed to this row.
+        """
+        if not settings.CONTENT_SCORE_WRITE_BEHIND:
+            return 0, 0
+
+        if not hasattr(self, '_pending_score_delta'):
+            self._pending_score_delta = get_score_delta_buffer().get_many([self.id]).get(self.id, (0, 0))
+        return self._pending_score_delta
+
+    @classmethod
+    def attach_pending_score_deltas(cls, contents):
+        """
+        Fetches the buffered deltas of all given contents at once so `get_score()` does not hit the buffer per row.
+        """
+        if not settings.CONTENT_SCORE_WRITE_BEHIND:
+            return contents
+
+        pending_deltas = cls.get_pending_score_deltas([content.id for content in contents])
+        for content in contents:
+            content._pending_score_delta = pending_deltas.get(content.id, (0, 0))
+        return contents
+
+    @classmethod
+    def get_pending_score_deltas(cls, content_ids):
+        """
+        Returns the buffered `(score_sum, score_count)` deltas of the given contents that have any.
+        """
+        if not settings.CONTENT_SCORE_WRITE_BEHIND:
+            return {}
+        return get_score_delta_buffer().get_many(content_ids)
+
+    def get_hourly_score_data(self):
+        return [
+            {'hour': bucket['hour'], 'score_count': bucket['score_count'],
+             'score_mean': bucket['score_sum'] / bucket['score_count']}
+            for bucket in ContentHourlyScore.objects.filter(content=self, score_count__gt=0)
+            .values('hour', 'score_count', 'score_sum')
             .order_by('hour')
-        )
+        ]
+
+    def calculate_normalized_score_mean(self, z_threshold=2.0):
+        if settings.CONTENT_NORMALIZATION_MODE == 'online':
+            normalized_means = ContentScoreStatistics.calculate_normalized_means(
+                [self], z_threshold, settings.CONTENT_NORMALIZATION_DECAY
+            )
+            if self.id in normalized_means:
+                new_mean = normalized_means[self.id]
+                return new_mean if new_mean is not None else self.calculate_score_mean()
+
+        hourly_data = self.get_hourly_score_data()
 
         filtered_data = filter_outliers(hourly_data, z_threshold)
         total_count = sum([h['score_count'] for h in filtered_data])
@@ -61,6 +198,9 @@ class Content(models.Model):
             logger.info(f"Starting normalization score update for Content ID {self.id} - Title: {self.title}")
             new_mean = self.calculate_normalized_score_mean()
             logger.info(f"Calculated normalized score mean: {new_mean} for Content ID {self.id}")
+            if new_mean == self.normalized_score_mean:
+                logger.info(f"Normalized score mean of Content ID {self.id} is unchanged")
+                return
             self.normalized_score_mean = new_mean
             self.save(update_fields=['normalized_score_mean'])
             logger.info(f"Successfully updated normalized score mean for Content ID {self.id}")
@@ -68,32 +208,149 @@ class Content(models.Model):
             logger.error(f"Error updating normalized score mean for Content ID {self.id}: {str(e)}", exc_info=True)
 
     @classmethod
-    def get_candidates_for_normalization(cls, threshold):
-        score_mean_expr = ExpressionWrapper(
-            F('score_sum') / F('score_count'),
-            output_field=FloatField()
-        )
+    def normalize_batch(cls, contents, z_threshold=2.0):
+        """
+        Batch equivalent of `update_normalized_score_mean`: reads the hourly buckets of all given contents
+        in one query, filters outliers with segmented NumPy operations and saves the results with one bulk update.
+        Only contents whose normalized mean changed are written, so unchanged pages keep their versions.
+        In the 'online' mode contents with running statistics skip the bucket history.
+        """
+        contents = cls.attach_pending_score_deltas(list(contents))
+        if not contents:
+            return contents
 
-        return Content.objects.annotate(
-            score_mean=score_mean_expr,
-            abs_difference=Abs(score_mean_expr - F('normalized_score_mean'))
+        normalized_means = {}
+        if settings.CONTENT_NORMALIZATION_MODE == 'online':
+            normalized_means = ContentScoreStatistics.calculate_normalized_means(
+                contents, z_threshold, settings.CONTENT_NORMALIZATION_DECAY
+            )
+
+        exact_content_ids = [content.id for content in contents if content.id not in normalized_means]
+        buckets = list(
+            ContentHourlyScore.objects.filter(content_id__in=exact_content_ids, score_count__gt=0)
+            .order_by('content_id', 'hour')
+            .values_list('content_id', 'score_count', 'score_sum')
+        ) if exact_content_ids else []
+        if buckets:
+            content_ids, score_counts, score_sums = zip(*buckets)
+            content_ids, means = calculate_segmented_normalized_means(
+                content_ids, score_counts, score_sums, z_threshold
+            )
+            normalized_means.update(zip(content_ids.tolist(), means.tolist()))
+
+        # Kept on the contents for the run telemetry, which shares the batch time out by the buckets read.
+        bucket_counts = Counter(content_id for content_id, _, _ in buckets)
+        changed_contents = []
+        for content in contents:
+            new_mean = normalized_means.get(content.id)
+            if new_mean is None or math.isnan(new_mean):
+                new_mean = content.calculate_score_mean()
+            content.hourly_bucket_count = bucket_counts[content.id]
+            if new_mean == content.normalized_score_mean:
+                continue
+            content.normalized_score_mean = new_mean
+            content.modified_at = Now()
+            changed_contents.append(content)
+
+        if changed_contents:
+            cls.objects.bulk_update(changed_contents, ['normalized_score_mean', 'modified_at'])
+            cls.refresh_materialized_scores([content.id for content in changed_contents])
+            transaction.on_commit(bump_content_list_version)
+        logger.info(f"Updated normalized score mean of {len(changed_contents)} of {len(contents)} contents in batch.")
+        return contents
+
+    @classmethod
+    def get_candidates_for_normalization(cls, threshold, changed_since=None):
+        """
+        Contents whose exact mean drifted more than `threshold` from the normalized one.
+        With `changed_since` only contents scored after it are checked, which the `score_changed_at` index serves.
+        """
+        candidates = Content.objects.annotate(
+            abs_difference=Abs(F('score_mean') - F('normalized_score_mean'))
         ).filter(
             Q(normalized_score_mean__isnull=True) |
             Q(abs_difference__gt=threshold)
         )
+        if changed_since is not None:
+            candidates = candidates.filter(score_changed_at__gt=changed_since)
+        return candidates
+
+    @classmethod
+    def apply_score_deltas(cls, deltas):
+        """
+        Applies the given score counter deltas.
+        `deltas` maps a content id to a `(score_sum_delta, score_count_delta)` pair.
+        In write-behind mode the deltas are handed to the score delta buffer once the surrounding transaction
+        commits, and `flush_content_score_deltas` writes them to the rows later.
+        """
+        if settings.CONTENT_SCORE_WRITE_BEHIND:
+            deltas = dict(deltas)
+            transaction.on_commit(lambda: get_score_delta_buffer().add(deltas))
+            transaction.on_commit(bump_content_list_version)
+            return len(deltas)
+
+        return cls.write_score_deltas(deltas)
+
+    @classmethod
+    def write_score_deltas(cls, deltas):
+        """
+        Writes the given score counter deltas to the rows in a single UPDATE statement.
+        """
+        deltas = {content_id: delta for content_id, delta in deltas.items() if delta != (0, 0)}
+        if not deltas:
+            return 0
+
+        transaction.on_commit(bump_content_list_version)
+        sum_delta = Case(
+            *[When(id=content_id, then=Value(sum_change)) for content_id, (sum_change, _) in deltas.items()],
+            default=Value(0),
+        )
+        count_delta = Case(
+            *[When(id=content_id, then=Value(count_change)) for content_id, (_, count_change) in deltas.items()],
+            default=Value(0),
+        )
+        new_score_sum = F('score_sum') + sum_delta
+        new_score_count = F('score_count') + count_delta
+        # The materialized scores come first: MySQL evaluates SET assignments left to right
+        # with already updated values, while other backends always read the old row.
+        return cls.objects.filter(id__in=deltas.keys()).update(
+            **cls.get_materialized_score_expressions(new_score_sum, new_score_count),
+            score_sum=new_score_sum,
+            score_count=new_score_count,
+            score_changed_at=Now(),
+            modified_at=Now(),
+        )
 
     def __str__(self):
         return f"{self.title}"
 
 
 class ContentScore(models.Model):
+    class BulkStatus(models.TextChoices):
+        CREATED = 'CREATED', 'Created'
+        UPDATED = 'UPDATED', 'Updated'
+        UNCHANGED = 'UNCHANGED', 'Unchanged'
+        NOT_FOUND = 'NOT_FOUND', 'Content not found'
+        # A later pair of the same request scored the content again, so this score was not written.
+        SUPERSEDED = 'SUPERSEDED', 'Superseded'
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.ForeignKey(Content, on_delete=models.CASCADE)
     score = models.IntegerField(validators=[MinValueValidator(0), MaxValueValidator(5)])
     scored_at = models.DateTimeField()
+    # The score this row held before its latest write, so an upsert can hand back the replaced score.
+    previous_score = models.IntegerField(null=True, blank=True)
+    previous_scored_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = (('user', 'content'),)
+        indexes = [
+            # The latest score of a user, which versions the `user_score` overlay of the list pages.
+            models.Index(fields=['user', 'scored_at'], name='content_score_user_scored_idx'),
+            # Carries the score next to the unique key, so looking up the scores of a user never reads the rows.
+            # A key column rather than INCLUDE, which only PostgreSQL supports.
+            models.Index(fields=['user', 'content', 'score'], name='content_score_user_lookup_idx'),
+        ]
 
     def save(
             self, force_insert=False, force_update=False, using=None, update_fields=None
@@ -102,38 +359,203 @@ class ContentScore(models.Model):
         try:
             with transaction.atomic():
                 logger.debug(
-                    f"Transaction started for saving ContentScore (User ID: {self.user.id}, Content ID: {self.content.id}).")
+                    f"Transaction started for saving ContentScore (User ID: {self.user_id}, Content ID: {self.content_id}).")
 
-                old_content_score = ContentScore.objects.filter(user=self.user,
-                                                                content=self.content).select_for_update().first()
+                old_content_score = ContentScore.objects.filter(user_id=self.user_id,
+                                                                content_id=self.content_id).select_for_update().first()
+                if old_content_score is not None:
+                    self.previous_score = old_content_score.score
+                    self.previous_scored_at = old_content_score.scored_at
                 super().save(force_insert, force_update, using, update_fields)
+                ContentHourlyScore.apply_bucket_deltas(
+                    ContentHourlyScore.get_bucket_deltas(old_content_score, self)
+                )
                 logger.info(
-                    f"ContentScore saved for User ID {self.user.id}, Content ID {self.content.id}, Score: {self.score}.")
+                    f"ContentScore saved for User ID {self.user_id}, Content ID {self.content_id}, Score: {self.score}.")
                 if old_content_score is None:
                     UpdateContentMeanScoreEvent.objects.create(
-                        content=self.content,
+                        content_id=self.content_id,
                         content_score=self,
                         type=UpdateContentMeanScoreEvent.Type.ADD_SCORE,
                         old_score=None,
                         new_score=self.score,
                     )
-                    logger.info(f"ADD_SCORE event created for Content ID {self.content.id} with score {self.score}.")
+                    logger.info(f"ADD_SCORE event created for Content ID {self.content_id} with score {self.score}.")
                 elif old_content_score.score != self.score:
                     UpdateContentMeanScoreEvent.objects.create(
-                        content=self.content,
+                        content_id=self.content_id,
                         content_score=self,
                         type=UpdateContentMeanScoreEvent.Type.UPDATE_SCORE,
                         old_score=old_content_score.score,
                         new_score=self.score,
                     )
                     logger.info(
-                        f"UPDATE_SCORE event created for Content ID {self.content.id}. Old score: {old_content_score.score}, New score: {self.score}.")
+                        f"UPDATE_SCORE event created for Content ID {self.content_id}. Old score: {old_content_score.score}, New score: {self.score}.")
         except Exception as e:
             logger.error(
-                f"Error occurred while saving ContentScore for User ID {self.user.id}, Content ID {self.content.id}: {str(e)}",
+                f"Error occurred while saving ContentScore for User ID {self.user_id}, Content ID {self.content_id}: {str(e)}",
                 exc_info=True)
             raise
 
+    @classmethod
+    def bulk_upsert(cls, user_id, scores):
+        """
+        Creates or updates many scores of a single user with a handful of bulk statements.
+        `scores` is a list of `(content_id, score)` pairs; when a content id is repeated the last score wins.
+        Returns one result per given pair, in order, with the outcome of the write for its content,
+        or SUPERSEDED for the pairs whose score a later pair replaced.
+        """
+        latest_scores, latest_indexes = {}, {}
+        for index, (content_id, score) in enumerate(scores):
+            if score < 0 or score > 5:
+                raise ValidationError('Score must be between 0 and 5.')
+            latest_scores[content_id] = score
+            latest_indexes[content_id] = index
+
+        scored_at = timezone.now()
+        statuses = {}
+        try:
+            with transaction.atomic():
+                existing_content_ids = set(
+                    Content.objects.filter(id__in=latest_scores.keys()).values_list('id', flat=True)
+                )
+                old_content_scores = {
+                    content_score.content_id: content_score
+                    for content_score in ContentScore.objects.filter(
+                        user_id=user_id, content_id__in=existing_content_ids
+                    ).select_for_update()
+                }
+
+                to_create, to_update, events, bucket_moves = [], [], [], []
+                for content_id, score in latest_scores.items():
+                    if content_id not in existing_content_ids:
+                        statuses[content_id] = cls.BulkStatus.NOT_FOUND
+                        continue
+
+                    old_content_score = old_content_scores.get(content_id)
+                    if old_content_score is None:
+                        to_create.append(cls(user_id=user_id, content_id=content_id, score=score, scored_at=scored_at))
+                        statuses[content_id] = cls.BulkStatus.CREATED
+                        continue
+
+                    bucket_moves.append((
+                        ContentScore(content_id=content_id, score=old_content_score.score,
+                                     scored_at=old_content_score.scored_at),
+                        old_content_score,
+                    ))
+                    old_score = old_content_score.score
+                    old_content_score.previous_score = old_score
+                    old_content_score.previous_scored_at = old_content_score.scored_at
+                    old_content_score.score = score
+                    old_content_score.scored_at = scored_at
+                    to_update.append(old_content_score)
+                    if old_score == score:
+                        statuses[content_id] = cls.BulkStatus.UNCHANGED
+                    else:
+                        statuses[content_id] = cls.BulkStatus.UPDATED
+                        events.append(UpdateContentMeanScoreEvent(
+                            content_id=content_id,
+                            content_score=old_content_score,
+                            type=UpdateContentMeanScoreEvent.Type.UPDATE_SCORE,
+                            old_score=old_score,
+                            new_score=score,
+                        ))
+
+                if to_update:
+                    ContentScore.objects.bulk_update(
+                        to_update, ['score', 'scored_at', 'previous_score', 'previous_scored_at']
+                    )
+                if to_create:
+                    ContentScore.objects.bulk_create(to_create)
+                    # Not every backend returns primary keys from a bulk insert, so the new rows are read back.
+                    for content_score in ContentScore.objects.filter(
+                            user_id=user_id, content_id__in=[c.content_id for c in to_create]):
+                        events.append(UpdateContentMeanScoreEvent(
+                            content_id=content_score.content_id,
+                            content_score=content_score,
+                            type=UpdateContentMeanScoreEvent.Type.ADD_SCORE,
+                            old_score=None,
+                            new_score=content_score.score,
+                        ))
+
+                bucket_deltas = {}
+                for old_content_score, new_content_score in bucket_moves + [(None, c) for c in to_create]:
+                    ContentHourlyScore.get_bucket_deltas(old_content_score, new_content_score, bucket_deltas)
+                ContentHourlyScore.apply_bucket_deltas(bucket_deltas)
+
+                if events:
+                    UpdateContentMeanScoreEvent.objects.bulk_create(events)
+                    Content.apply_score_deltas(UpdateContentMeanScoreEvent.aggregate_score_deltas(events))
+                logger.info(
+                    f"Bulk saved {len(to_create)} new and {len(to_update)} existing ContentScores for User ID {user_id}.")
+        except Exception as e:
+            logger.error(f"Error occurred while bulk saving ContentScores for User ID {user_id}: {str(e)}",
+                         exc_info=True)
+            raise
+
+        return [
+            {'content': content_id, 'score': score,
+             'status': statuses[content_id] if latest_indexes[content_id] == index else cls.BulkStatus.SUPERSEDED}
+            for index, (content_id, score) in enumerate(scores)
+        ]
+
+    @classmethod
+    def upsert(cls, user_id, content_id, score, scored_at=None):
+        """
+        Creates or updates a single score with one native upsert. The upsert copies the replaced score into
+        `previous_score`/`previous_scored_at` and hands it back in the same statement where the backend supports
+        RETURNING, so no row is read or locked beforehand. The buckets, the event and the counters then take one
+        statement each.
+        """
+        content_score = cls(user_id=user_id, content_id=content_id, score=score, scored_at=scored_at or timezone.now())
+        content_score.validate_score()
+        try:
+            with transaction.atomic():
+                content_score.id, content_score.previous_score, previous_scored_at = upsert_row_returning(
+                    cls,
+                    {'user_id': user_id, 'content_id': content_id, 'score': score,
+                     'scored_at': content_score.scored_at, 'previous_score': None, 'previous_scored_at': None},
+                    unique_columns=('user_id', 'content_id'),
+                    updates=(
+                        ('previous_score', '{old}.score'),
+                        ('previous_scored_at', '{old}.scored_at'),
+                        ('score', '{new}.score'),
+                        ('scored_at', '{new}.scored_at'),
+                    ),
+                    returning=('id', 'previous_score', 'previous_scored_at'),
+                )
+                content_score.previous_scored_at = convert_datetime(previous_scored_at)
+                content_score._state.adding = False
+
+                old_content_score = None
+                if content_score.previous_score is not None:
+                    old_content_score = cls(content_id=content_id, score=content_score.previous_score,
+                                            scored_at=content_score.previous_scored_at)
+                ContentHourlyScore.apply_bucket_deltas(
+                    ContentHourlyScore.get_bucket_deltas(old_content_score, content_score)
+                )
+
+                event = None
+                if old_content_score is None:
+                    event = UpdateContentMeanScoreEvent(type=UpdateContentMeanScoreEvent.Type.ADD_SCORE, old_score=None)
+                elif old_content_score.score != score:
+                    event = UpdateContentMeanScoreEvent(type=UpdateContentMeanScoreEvent.Type.UPDATE_SCORE,
+                                                        old_score=old_content_score.score)
+                if event is not None:
+                    event.content_id, event.content_score, event.new_score = content_id, content_score, score
+                    # Bulk created so `UpdateContentMeanScoreEvent.save` does not open another savepoint.
+                    UpdateContentMeanScoreEvent.objects.bulk_create([event])
+                    Content.apply_score_deltas({content_id: event.get_counter_deltas()})
+                logger.info(
+                    f"ContentScore upserted for User ID {user_id}, Content ID {content_id}, Score: {score} "
+                    f"(previous score: {content_score.previous_score}).")
+        except Exception as e:
+            logger.error(
+                f"Error occurred while upserting ContentScore for User ID {user_id}, Content ID {content_id}: {str(e)}",
+                exc_info=True)
+            raise
+        return content_score
+
     def validate_score(self):
         if self.score < 0 or self.score > 5:
             raise ValidationError('Score must be between 0 and 5.')
@@ -154,29 +576,432 @@ class UpdateContentMeanScoreEvent(models.Model):
     new_score = models.IntegerField()
     occurred_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Lets retention find the expired events, or that there are none, without walking the whole table.
+            models.Index(fields=['occurred_at'], name='score_event_occurred_at_idx'),
+        ]
+
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         try:
             with transaction.atomic():
                 super().save(force_insert, force_update, using, update_fields)
-                if self.type == UpdateContentMeanScoreEvent.Type.ADD_SCORE:
-                    Content.objects.filter(id=self.content.id).update(
-                        score_sum=F('score_sum') + self.get_score_change(),
-                        score_count=F('score_count') + 1,
-                    )
-                elif self.type == UpdateContentMeanScoreEvent.Type.UPDATE_SCORE:
-                    Content.objects.filter(id=self.content.id).update(
-                        score_sum=F('score_sum') + self.get_score_change(),
-                    )
-                else:
-                    raise Exception("type {} is not valid".format(self.type))
+                Content.apply_score_deltas({self.content_id: self.get_counter_deltas()})
         except Exception as e:
-            logger.error(f"Error occurred during save for content {self.content.id}: {str(e)}", exc_info=True)
+            logger.error(f"Error occurred during save for content {self.content_id}: {str(e)}", exc_info=True)
             raise
 
+    def get_counter_deltas(self):
+        if self.type == UpdateContentMeanScoreEvent.Type.ADD_SCORE:
+            return self.get_score_change(), 1
+        elif self.type == UpdateContentMeanScoreEvent.Type.UPDATE_SCORE:
+            return self.get_score_change(), 0
+        raise Exception("type {} is not valid".format(self.type))
+
+    @staticmethod
+    def aggregate_score_deltas(events):
+        deltas = {}
+        for event in events:
+            sum_change, count_change = event.get_counter_deltas()
+            old_sum, old_count = deltas.get(event.content_id, (0, 0))
+            deltas[event.content_id] = (old_sum + sum_change, old_count + count_change)
+        return deltas
+
     def get_score_change(self):
         if self.old_score:
             return self.new_score - self.old_score
         return self.new_score
 
+    @classmethod
+    def compact_batch(cls, before, batch_size):
+        """
+        Folds the oldest `batch_size` events that occurred before `before` into the per-content
+        `ScoreEventSummary` rows and deletes them, in one short transaction.
+        Returns the number of compacted events.
+        """
+        with transaction.atomic():
+            # Ordered like the `occurred_at` index, which then serves both the filter and the limit.
+            event_ids = list(
+                cls.objects.filter(occurred_at__lt=before).order_by('occurred_at', 'id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not event_ids:
+                return 0
+
+            folded_events = (
+                cls.objects.filter(id__in=event_ids)
+                .values('content_id')
+                .annotate(
+                    add_count=Count('id', filter=Q(type=cls.Type.ADD_SCORE)),
+                    update_count=Count('id', filter=Q(type=cls.Type.UPDATE_SCORE)),
+                    # Same as `get_score_change`, where a missing or zero old score changes nothing.
+                    score_change_sum=Sum(F('new_score') - Coalesce('old_score', 0)),
+                    first_occurred_at=Min('occurred_at'),
+                    last_occurred_at=Max('occurred_at'),
+                    last_event_id=Max('id'),
+                )
+            )
+            ScoreEventSummary.fold(folded_events)
+            cls.objects.filter(id__in=event_ids).delete()
+            return len(event_ids)
+
     def __str__(self):
         return f"{self.type} -> {self.old_score} -> {self.new_score}"
+
+
+class ScoreEventSummary(models.Model):
+    """
+    Per-content totals of the `UpdateContentMeanScoreEvent` rows removed by retention.
+    """
+    content = models.OneToOneField(Content, on_delete=models.CASCADE)
+    add_count = models.IntegerField(default=0)
+    update_count = models.IntegerField(default=0)
+    score_change_sum = models.IntegerField(default=0)
+    first_occurred_at = models.DateTimeField(null=True, blank=True)
+    last_occurred_at = models.DateTimeField(null=True, blank=True)
+    last_event_id = models.BigIntegerField(default=0)
+
+    @classmethod
+    def fold(cls, folded_events):
+        folded_events = {row['content_id']: row for row in folded_events}
+        summaries = {
+            summary.content_id: summary
+            for summary in cls.objects.filter(content_id__in=folded_events.keys()).select_for_update()
+        }
+
+        to_create, to_update = [], []
+        for content_id, row in folded_events.items():
+            summary = summaries.get(content_id)
+            if summary is None:
+                to_create.append(cls(content_id=content_id, add_count=row['add_count'],
+                                     update_count=row['update_count'], score_change_sum=row['score_change_sum'],
+                                     first_occurred_at=row['first_occurred_at'],
+                                     last_occurred_at=row['last_occurred_at'], last_event_id=row['last_event_id']))
+                continue
+
+            summary.add_count += row['add_count']
+            summary.update_count += row['update_count']
+            summary.score_change_sum += row['score_change_sum']
+            summary.first_occurred_at = min(filter(None, [summary.first_occurred_at, row['first_occurred_at']]))
+            summary.last_occurred_at = max(filter(None, [summary.last_occurred_at, row['last_occurred_at']]))
+            summary.last_event_id = max(summary.last_event_id, row['last_event_id'])
+            to_update.append(summary)
+
+        cls.objects.bulk_create(to_create)
+        cls.objects.bulk_update(to_update, ['add_count', 'update_count', 'score_change_sum', 'first_occurred_at',
+                                            'last_occurred_at', 'last_event_id'])
+
+    def __str__(self):
+        return f"{self.content_id}: {self.add_count} added, {self.update_count} updated"
+
+
+class ContentHourlyScore(models.Model):
+    """
+    Rollup of the scores of a content per hour, kept in step with `ContentScore` by its writers
+    so normalization never has to group the raw scores.
+    """
+    content = models.ForeignKey(Content, on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+    score_count = models.IntegerField(default=0)
+    score_sum = models.IntegerField(default=0)
+    # Folded into `ContentScoreStatistics` as an outlier; its current scores are left out of the online mean.
+    rejected = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = (('content', 'hour'),)
+        indexes = [
+            models.Index(fields=['hour'], name='content_hourly_score_hour_idx'),
+            models.Index(fields=['content', 'rejected'], name='content_hourly_rejected_idx'),
+        ]
+
+    @staticmethod
+    def truncate_to_hour(value):
+        # Matches TruncHour, which truncates in the current time zone.
+        return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def get_bucket_deltas(cls, old_content_score, new_content_score, deltas=None):
+        """
+        Adds the bucket changes caused by replacing `old_content_score` (None for a new score)
+        with `new_content_score` to `deltas`, keyed by `(content_id, hour)`.
+        """
+        if deltas is None:
+            deltas = {}
+
+        changes = [(new_content_score, 1)]
+        if old_content_score is not None:
+            changes.append((old_content_score, -1))
+
+        for content_score, sign in changes:
+            key = (content_score.content_id, cls.truncate_to_hour(content_score.scored_at))
+            old_sum, old_count = deltas.get(key, (0, 0))
+            deltas[key] = (old_sum + sign * content_score.score, old_count + sign)
+        return deltas
+
+    @classmethod
+    def apply_bucket_deltas(cls, deltas):
+        """
+        Applies `(score_sum_delta, score_count_delta)` pairs keyed by `(content_id, hour)`. In write-behind mode
+        they are handed to the bucket delta buffer once the surrounding transaction commits, like the counter
+        deltas, so writers to a popular content do not queue on the row of its current hour.
+        """
+        if settings.CONTENT_SCORE_WRITE_BEHIND:
+            deltas = {key: delta for key, delta in deltas.items() if delta != (0, 0)}
+            if deltas:
+                transaction.on_commit(lambda: get_bucket_delta_buffer().add(deltas))
+            return len(deltas)
+
+        return cls.write_bucket_deltas(deltas)
+
+    @classmethod
+    def write_bucket_deltas(cls, deltas):
+        """
+        Writes the given bucket deltas with one upsert that creates the missing buckets and increments the
+        existing ones.
+        """
+        deltas = {key: delta for key, delta in deltas.items() if delta != (0, 0)}
+        if not deltas:
+            return 0
+
+        # Sorted, so concurrent writers lock the buckets in the same order.
+        return upsert_rows(
+            cls,
+            ('content_id', 'hour', 'score_sum', 'score_count', 'rejected'),
+            [(content_id, hour, sum_change, count_change, False)
+             for (content_id, hour), (sum_change, count_change) in sorted(deltas.items())],
+            unique_columns=('content_id', 'hour'),
+            updates=(
+                ('score_sum', '{old}.score_sum + {new}.score_sum'),
+                ('score_count', '{old}.score_count + {new}.score_count'),
+            ),
+        )
+
+    @classmethod
+    def rebuild(cls, content_ids):
+        """
+        Recomputes the buckets of the given contents from their `ContentScore` rows. Buckets rejected by the
+        online statistics stay rejected.
+        """
+        with transaction.atomic():
+            rejected_hours = set(
+                cls.objects.filter(content_id__in=content_ids, rejected=True).values_list('content_id', 'hour')
+            )
+            cls.objects.filter(content_id__in=content_ids).delete()
+            hourly_data = (
+                ContentScore.objects.filter(content_id__in=content_ids)
+                .annotate(hour=TruncHour('scored_at'))
+                .values('content_id', 'hour')
+                .annotate(score_count=Count('id'), score_sum=Sum('score'))
+                .order_by('content_id', 'hour')
+            )
+            return len(cls.objects.bulk_create([
+                cls(**bucket, rejected=(bucket['content_id'], bucket['hour']) in rejected_hours)
+                for bucket in hourly_data
+            ]))
+
+    def __str__(self):
+        return f"{self.content_id} @ {self.hour}: {self.score_count}"
+
+
+class ContentScoreStatistics(models.Model):
+    """
+    Running statistics of the hourly bucket means of a content, for the 'online' normalization mode.
+    Buckets are folded in once their hour has closed: the Welford mean and variance are updated, and a bucket
+    that is an outlier against them is flagged as `rejected`. The normalized mean is then the counters minus
+    the current scores of the rejected buckets, which costs the same for a content of any age. Since those
+    are read at normalization time, a score moved out of a rejected bucket by a re-rating stops being rejected.
+    """
+    content = models.OneToOneField(Content, on_delete=models.CASCADE, primary_key=True)
+    bucket_weight = models.FloatField(default=0)
+    bucket_mean = models.FloatField(default=0)
+    bucket_m2 = models.FloatField(default=0)
+    # Buckets before this hour are folded in; later ones are still open.
+    closed_through = models.DateTimeField(null=True, blank=True)
+
+    def fold(self, score_sum, score_count, z_threshold=2.0, decay=1.0):
+        """
+        Adds a bucket to the statistics and returns whether it is rejected as an outlier. Like the exact
+        method, the bucket is part of the distribution it is compared against.
+        """
+        self.bucket_weight, self.bucket_mean, self.bucket_m2 = update_running_statistics(
+            self.bucket_weight, self.bucket_mean, self.bucket_m2, score_sum / score_count, decay
+        )
+        return is_outlier(score_sum / score_count, self.bucket_weight, self.bucket_mean, self.bucket_m2, z_threshold)
+
+    @classmethod
+    def get_open_buckets(cls, statistics, until=None):
+        """
+        Returns the buckets at or after `closed_through` of the given statistics (before `until` if given),
+        as `(bucket_id, score_sum, score_count)` lists in hour order keyed by content id, with one query.
+        """
+        statistics = [stats for stats in statistics if stats.closed_through is not None]
+        open_buckets = {stats.content_id: [] for stats in statistics}
+        if not statistics:
+            return open_buckets
+
+        closed_through = {stats.content_id: stats.closed_through for stats in statistics}
+        buckets = ContentHourlyScore.objects.filter(
+            content_id__in=closed_through.keys(), hour__gte=min(closed_through.values()), score_count__gt=0
+        )
+        if until is not None:
+            buckets = buckets.filter(hour__lt=until)
+        for bucket_id, content_id, hour, score_sum, score_count in buckets.order_by('content_id', 'hour').values_list(
+                'id', 'content_id', 'hour', 'score_sum', 'score_count'):
+            if hour >= closed_through[content_id]:
+                open_buckets[content_id].append((bucket_id, score_sum, score_count))
+        return open_buckets
+
+    @staticmethod
+    def get_rejected_totals(content_ids):
+        """
+        The current `(score_sum, score_count)` of the rejected buckets of the given contents, keyed by content id.
+        """
+        return {
+            row['content_id']: (row['rejected_sum'], row['rejected_count'])
+            for row in ContentHourlyScore.objects.filter(content_id__in=content_ids, rejected=True)
+            .values('content_id').annotate(rejected_sum=Sum('score_sum'), rejected_count=Sum('score_count'))
+            .order_by()
+        }
+
+    @classmethod
+    def close_buckets(cls, content_ids, before, z_threshold=2.0, decay=1.0):
+        """
+        Folds the buckets of the given contents that closed before `before` and were not folded yet, and flags
+        the rejected ones. Contents without statistics get them from their whole history.
+        Returns the number of folded buckets.
+        """
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create([cls(content_id=content_id) for content_id in content_ids],
+                                        ignore_conflicts=True)
+                statistics = list(cls.objects.filter(content_id__in=content_ids).order_by('content_id')
+                                  .select_for_update())
+                new_buckets = cls.get_open_buckets(statistics, until=before)
+
+                history = ContentHourlyScore.objects.filter(
+                    content_id__in=[stats.content_id for stats in statistics if stats.closed_through is None],
+                    hour__lt=before, score_count__gt=0,
+                ).order_by('content_id', 'hour').values_list('id', 'content_id', 'score_sum', 'score_count')
+                for bucket_id, content_id, score_sum, score_count in history:
+                    new_buckets.setdefault(content_id, []).append((bucket_id, score_sum, score_count))
+
+                folded_count, rejected_bucket_ids = 0, []
+                for stats in statistics:
+                    for bucket_id, score_sum, score_count in new_buckets.get(stats.content_id, []):
+                        if stats.fold(score_sum, score_count, z_threshold, decay):
+                            rejected_bucket_ids.append(bucket_id)
+                        folded_count += 1
+                    stats.closed_through = before
+
+                cls.objects.bulk_update(statistics, ['bucket_weight', 'bucket_mean', 'bucket_m2', 'closed_through'])
+                ContentHourlyScore.objects.filter(id__in=rejected_bucket_ids).update(rejected=True)
+                logger.info(f"Folded {folded_count} hourly buckets of {len(statistics)} contents closed before {before}.")
+                return folded_count
+        except Exception as e:
+            logger.error(f"Error occurred while closing hourly buckets before {before}: {str(e)}", exc_info=True)
+            raise
+
+    @classmethod
+    def rebuild(cls, content_ids, before, z_threshold=2.0, decay=1.0):
+        """
+        Recomputes the statistics of the given contents from their buckets, e.g. with another threshold or decay.
+        """
+        with transaction.atomic():
+            cls.objects.filter(content_id__in=content_ids).delete()
+            ContentHourlyScore.objects.filter(content_id__in=content_ids, rejected=True).update(rejected=False)
+            return cls.close_buckets(content_ids, before, z_threshold, decay)
+
+    @classmethod
+    def calculate_normalized_means(cls, contents, z_threshold=2.0, decay=1.0):
+        """
+        Online counterpart of `calculate_normalized_score_mean` for many contents, with three queries whatever
+        their age. Open buckets are classified against the statistics as if they were folded in now.
+        Contents without statistics are left out; a mean is None when every score was rejected.
+        """
+        statistics = list(cls.objects.filter(content_id__in=[content.id for content in contents],
+                                             closed_through__isnull=False))
+        open_buckets = cls.get_open_buckets(statistics)
+        rejected_totals = cls.get_rejected_totals(open_buckets.keys())
+        statistics = {stats.content_id: stats for stats in statistics}
+
+        normalized_means = {}
+        for content in contents:
+            stats = statistics.get(content.id)
+            if stats is None:
+                continue
+
+            rejected_sum, rejected_count = rejected_totals.get(content.id, (0, 0))
+            for _, score_sum, score_count in open_buckets[content.id]:
+                if stats.fold(score_sum, score_count, z_threshold, decay):
+                    rejected_sum += score_sum
+                    rejected_count += score_count
+            pending_sum, pending_count = content.get_pending_score_delta()
+            kept_count = content.score_count + pending_count - rejected_count
+            kept_sum = content.score_sum + pending_sum - rejected_sum
+            normalized_means[content.id] = kept_sum / kept_count if kept_count > 0 else None
+        return normalized_means
+
+    def __str__(self):
+        return f"{self.content_id}: mean {self.bucket_mean:.2f} over {self.bucket_weight:.1f} buckets"
+
+
+class NormalizationRun(models.Model):
+    """
+    Telemetry of one `normalize_candidate_contents_scores` run, recorded when it is dispatched and completed
+    by the chord callback. Item times are estimates: each batch's measured time shared out by the hourly buckets
+    its contents read, since a batch is normalized with vectorized operations rather than item by item.
+    """
+    run_id = models.CharField(max_length=32, unique=True)
+    started_at = models.DateTimeField(db_index=True)
+    # Unset until the chord callback ran; a run whose workers died stays unfinished.
+    finished_at = models.DateTimeField(null=True, blank=True)
+    changed_since = models.DateTimeField(null=True, blank=True)
+    candidate_count = models.IntegerField(default=0)
+    shard_count = models.IntegerField(default=0)
+    normalized_count = models.IntegerField(default=0)
+    # Contents whose normalized mean changed.
+    updated_count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    estimated_item_time_p50_ms = models.FloatField(null=True, blank=True)
+    estimated_item_time_p99_ms = models.FloatField(null=True, blank=True)
+    # `[content_id, milliseconds]` pairs, slowest first.
+    estimated_slowest_items = models.JSONField(default=list, blank=True)
+
+    @property
+    def duration(self):
+        if self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    def finish(self, shard_results, finished_at, slowest_item_count):
+        """
+        Adds up the results of the shards and saves the run as finished.
+        """
+        histograms = [result['estimated_item_time_histogram'] for result in shard_results
+                      if result.get('estimated_item_time_histogram')]
+        histogram = [sum(counts) for counts in zip(*histograms)]
+        slowest_items = sorted(
+            (item for result in shard_results for item in result.get('estimated_slowest_items', ())),
+            key=lambda item: item[1], reverse=True,
+        )[:slowest_item_count]
+
+        self.finished_at = finished_at
+        self.normalized_count = sum(result['normalized'] for result in shard_results)
+        self.updated_count = sum(result.get('updated', 0) for result in shard_results)
+        self.error_count = sum(result['errors'] for result in shard_results)
+        self.errors = [result['error'] for result in shard_results if result.get('error')]
+        self.estimated_item_time_p50_ms = get_histogram_percentile(histogram, 50)
+        self.estimated_item_time_p99_ms = get_histogram_percentile(histogram, 99)
+        self.estimated_slowest_items = [[content_id, round(time_ms, 3)] for content_id, time_ms in slowest_items]
+        self.save()
+
+    @classmethod
+    def prune(cls, before):
+        """
+        Deletes the runs started before `before` and returns how many there were.
+        """
+        return cls.objects.filter(started_at__lt=before).delete()[0]
+
+    def __str__(self):
+        return f"{self.run_id} @ {self.started_at}"
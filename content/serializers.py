@@ -1,11 +1,14 @@
+from django.conf import settings
 from django.utils import timezone
 from rest_framework import serializers
 
-from content.models import Content, ContentScore
+from content.exports import EXPORT_FORMATS
+from content.models import Content, ContentScore, NormalizationRun
 
 
 class ContentSerializer(serializers.ModelSerializer):
     score = serializers.SerializerMethodField()
+    score_count = serializers.SerializerMethodField()
     user_score = serializers.SerializerMethodField()
 
     class Meta:
@@ -16,6 +19,10 @@ class ContentSerializer(serializers.ModelSerializer):
     def get_score(obj):
         return obj.get_score()
 
+    @staticmethod
+    def get_score_count(obj):
+        return obj.get_score_count()
+
     @staticmethod
     def get_user_score(obj):
         if hasattr(obj, 'user_score') and obj.user_score:
@@ -23,6 +30,33 @@ class ContentSerializer(serializers.ModelSerializer):
         return None
 
 
+# The columns `get_content_rows` needs, for `values()` querysets of the content list.
+CONTENT_LIST_FIELDS = ('id', 'title', 'score_sum', 'score_count', 'normalized_score_mean')
+
+
+def get_content_rows(rows, pending_deltas=None, user_scores=None):
+    """
+    Renders `values(*CONTENT_LIST_FIELDS)` rows exactly like `ContentSerializer(many=True)` renders contents,
+    without building model instances or serializer fields. `pending_deltas` are the buffered counter deltas
+    and `user_scores` the scores of the requesting user, both keyed by content id.
+    """
+    pending_deltas = pending_deltas or {}
+    user_scores = user_scores or {}
+    content_rows = []
+    for row in rows:
+        pending_sum, pending_count = pending_deltas.get(row['id'], (0, 0))
+        score_count = row['score_count'] + pending_count
+        content_rows.append({
+            'id': row['id'],
+            'title': row['title'],
+            'score': Content.calculate_score(row['score_sum'] + pending_sum, score_count,
+                                             row['normalized_score_mean']),
+            'score_count': score_count,
+            'user_score': user_scores.get(row['id']),
+        })
+    return content_rows
+
+
 class ContentScoreSerializer(serializers.ModelSerializer):
     score = serializers.IntegerField(required=True)
 
@@ -31,17 +65,52 @@ class ContentScoreSerializer(serializers.ModelSerializer):
         fields = ['content', 'score']
 
     def create(self, validated_data):
-        user = validated_data['user']
-        content = validated_data['content']
-        new_score = validated_data['score']
-        scored_at = timezone.now()
-
-        content_score, created = ContentScore.objects.update_or_create(
-            user=user, content=content,
-            defaults={
-                'score': new_score,
-                'scored_at': scored_at
-            }
+        return ContentScore.upsert(
+            validated_data['user_id'], validated_data['content'].id, validated_data['score'], timezone.now()
         )
 
-        return content_score
+
+class ContentScoreItemSerializer(serializers.Serializer):
+    content = serializers.IntegerField()
+    score = serializers.IntegerField(min_value=0, max_value=5)
+
+
+class ContentScoreBulkSerializer(serializers.Serializer):
+    scores = ContentScoreItemSerializer(
+        many=True, allow_empty=False, max_length=settings.CONTENT_SCORE_BULK_MAX_ITEMS
+    )
+
+
+class ContentScoreLookupSerializer(serializers.Serializer):
+    OUTPUT_FORMATS = ('map', 'compact')
+
+    content_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=settings.CONTENT_SCORE_LOOKUP_MAX_ITEMS,
+    )
+    output = serializers.ChoiceField(choices=OUTPUT_FORMATS, default='map')
+
+    def to_internal_value(self, data):
+        # GET requests send the ids as one comma separated `ids` parameter.
+        if 'ids' in data and 'content_ids' not in data:
+            data = {'content_ids': [content_id for content_id in data['ids'].split(',') if content_id],
+                    'output': data.get('output', 'map')}
+        return super().to_internal_value(data)
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    content = serializers.IntegerField(required=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    after_id = serializers.IntegerField(required=False, min_value=0)
+    output = serializers.ChoiceField(choices=EXPORT_FORMATS, default='ndjson')
+
+
+class NormalizationRunSerializer(serializers.ModelSerializer):
+    duration = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = NormalizationRun
+        fields = ['run_id', 'started_at', 'finished_at', 'duration', 'changed_since', 'candidate_count',
+                  'shard_count', 'normalized_count', 'updated_count', 'error_count', 'errors',
+                  'estimated_item_time_p50_ms', 'estimated_item_time_p99_ms', 'estimated_slowest_items']
@@ -1,23 +1,307 @@
-from content.models import Content
-from celery import shared_task
+import heapq
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from content.counters import get_score_delta_buffer, get_bucket_delta_buffer
+from content.models import Content, UpdateContentMeanScoreEvent, ContentHourlyScore, ContentScoreStatistics, \
+    NormalizationRun
+from content.utils import get_time_histogram
+from celery import chord, shared_task
+from redit.metrics import TASK_ITEMS
 
 import logging
 
 logger = logging.getLogger(__name__)
 
 HOURLY_SCORE_CHANGE_THRESHOLD = 1
+NORMALIZATION_BATCH_SIZE = 500
+NORMALIZATION_SHARD_SIZE = 5000
+NORMALIZATION_LOCK_KEY = 'content:normalization:lock'
+NORMALIZATION_RERUN_KEY = 'content:normalization:rerun'
+NORMALIZATION_LOCK_TIMEOUT = 15 * 60
+NORMALIZATION_WATERMARK_KEY = 'content:normalization:watermark'
+# Re-checks contents scored shortly before the last run started, to cover transactions that committed late.
+NORMALIZATION_WATERMARK_OVERLAP = timedelta(minutes=1)
+# Slowest contents a normalization run records.
+NORMALIZATION_RUN_SLOWEST_ITEMS = 10
+BUCKET_CLOSING_BATCH_SIZE = 500
+BUCKET_CLOSING_WATERMARK_KEY = 'content:normalization:closed_through'
+
+
+def get_normalization_watermark():
+    watermark = cache.get(NORMALIZATION_WATERMARK_KEY)
+    if watermark is None:
+        return None
+    return watermark - NORMALIZATION_WATERMARK_OVERLAP
+
+
+def get_normalization_candidates(changed_since=None):
+    return Content.get_candidates_for_normalization(HOURLY_SCORE_CHANGE_THRESHOLD, changed_since).only(
+        'id', 'score_sum', 'score_count', 'normalized_score_mean'
+    ).order_by('id')
+
+
+def get_normalization_shards(candidate_ids):
+    """
+    Splits the sorted candidate ids into `(first_id, last_id)` ranges of at most NORMALIZATION_SHARD_SIZE ids.
+    """
+    return [
+        (candidate_ids[start], candidate_ids[min(start + NORMALIZATION_SHARD_SIZE, len(candidate_ids)) - 1])
+        for start in range(0, len(candidate_ids), NORMALIZATION_SHARD_SIZE)
+    ]
+
+
+def estimate_item_times(contents, elapsed_ms):
+    """
+    Shares the time of a normalized batch out among its contents by the hourly buckets each of them read,
+    plus one for the work every content costs. Returns the milliseconds keyed by content id.
+    """
+    weights = {content.id: getattr(content, 'hourly_bucket_count', 0) + 1 for content in contents}
+    total_weight = sum(weights.values())
+    return {content_id: elapsed_ms * weight / total_weight for content_id, weight in weights.items()}
+
+
+def release_normalization_lock(run_id):
+    if cache.get(NORMALIZATION_LOCK_KEY) == run_id:
+        cache.delete(NORMALIZATION_LOCK_KEY)
 
 
 @shared_task
 def normalize_candidate_contents_scores():
-    logger.info("Starting the normalization of candidate content scores.")
+    """
+    Splits the candidates into id-range shards and normalizes them in parallel with a chord.
+    Only one run holds the lock at a time; a tick that finds a run in progress asks it to run again once it ends.
+    Only contents scored since the last successful run are checked; without a watermark every content is.
+    Every dispatched run is recorded as a `NormalizationRun`, and runs past the retention window are deleted.
+    """
+    run_id = uuid.uuid4().hex
+    if not cache.add(NORMALIZATION_LOCK_KEY, run_id, NORMALIZATION_LOCK_TIMEOUT):
+        cache.set(NORMALIZATION_RERUN_KEY, True, NORMALIZATION_LOCK_TIMEOUT)
+        logger.info("Normalization of candidate content scores is already running; merged into the current run.")
+        return
+
+    started_at = timezone.now().isoformat()
+    changed_since = get_normalization_watermark()
+    logger.info(f"Starting the normalization of contents scored since {changed_since} (run {run_id}).")
     try:
-        candidates = Content.get_candidates_for_normalization(HOURLY_SCORE_CHANGE_THRESHOLD)
-        logger.info(f"Found {candidates.count()} candidates for normalization.")
-        for candidate in candidates:
-            logger.debug(f"Normalizing scores for Content ID {candidate.id} - Title: {candidate.title}")
-            candidate.update_normalized_score_mean()
+        candidate_ids = list(get_normalization_candidates(changed_since).values_list('id', flat=True))
+        shards = get_normalization_shards(candidate_ids)
+        logger.info(f"Dispatching {len(shards)} normalization shards (run {run_id}).")
+        NormalizationRun.prune(timezone.now() - timedelta(days=settings.NORMALIZATION_RUN_RETENTION_DAYS))
+        NormalizationRun.objects.create(run_id=run_id, started_at=parse_datetime(started_at),
+                                        changed_since=changed_since, candidate_count=len(candidate_ids),
+                                        shard_count=len(shards))
+        if not shards:
+            finish_normalization_run([], run_id, started_at)
+            return
 
-        logger.info("Successfully normalized scores for all candidate contents.")
+        changed_since = changed_since.isoformat() if changed_since is not None else None
+        chord([normalize_content_shard.s(first_id, last_id, changed_since) for first_id, last_id in shards])(
+            finish_normalization_run.s(run_id, started_at)
+        )
     except Exception as e:
+        release_normalization_lock(run_id)
         logger.error(f"Error occurred during normalization of candidate content scores: {str(e)}", exc_info=True)
+
+
+@shared_task
+def normalize_content_shard(first_id, last_id, changed_since=None):
+    """
+    Normalizes the candidates of one id range. Besides the counts, returns the histogram of the estimated item times
+    and the slowest items, which the chord callback adds up into the run record.
+    """
+    if changed_since is not None:
+        changed_since = parse_datetime(changed_since)
+    candidates = get_normalization_candidates(changed_since).filter(id__range=(first_id, last_id))
+    normalized_count, updated_count, item_times = 0, 0, {}
+    try:
+        # Normalized contents stop being candidates, so batches are walked by id instead of by offset.
+        last_normalized_id = first_id - 1
+        while True:
+            batch = list(candidates.filter(id__gt=last_normalized_id)[:NORMALIZATION_BATCH_SIZE])
+            if not batch:
+                break
+            logger.debug(f"Normalizing scores for Content IDs {batch[0].id} to {batch[-1].id}")
+            old_means = {content.id: content.normalized_score_mean for content in batch}
+            started_at = time.perf_counter()
+            Content.normalize_batch(batch)
+            item_times.update(estimate_item_times(batch, (time.perf_counter() - started_at) * 1000))
+            normalized_count += len(batch)
+            updated_count += sum(1 for content in batch if content.normalized_score_mean != old_means[content.id])
+            last_normalized_id = batch[-1].id
+
+        logger.info(f"Normalized scores for {normalized_count} candidate contents in shard {first_id}-{last_id}.")
+        error = None
+    except Exception as e:
+        # The chord callback has to run even when a shard fails, otherwise the run lock is never released.
+        logger.error(f"Error occurred during normalization of shard {first_id}-{last_id}: {str(e)}", exc_info=True)
+        error = f"Shard {first_id}-{last_id}: {str(e)}"
+
+    TASK_ITEMS.labels('normalize_content_shard').inc(normalized_count)
+    return {
+        'normalized': normalized_count,
+        'updated': updated_count,
+        'errors': 0 if error is None else 1,
+        'error': error,
+        'estimated_item_time_histogram': get_time_histogram(list(item_times.values())),
+        'estimated_slowest_items': heapq.nlargest(NORMALIZATION_RUN_SLOWEST_ITEMS, item_times.items(),
+                                                  key=lambda item: item[1]),
+    }
+
+
+@shared_task
+def finish_normalization_run(shard_results, run_id, started_at):
+    normalized_count = sum(result['normalized'] for result in shard_results)
+    updated_count = sum(result.get('updated', 0) for result in shard_results)
+    error_count = sum(result['errors'] for result in shard_results)
+    logger.info(
+        f"Successfully normalized scores for {normalized_count} candidate contents, {updated_count} of them changed, "
+        f"with {error_count} failed shards (run {run_id}).")
+
+    try:
+        run = NormalizationRun.objects.filter(run_id=run_id).first()
+        if run is not None:
+            run.finish(shard_results, timezone.now(), NORMALIZATION_RUN_SLOWEST_ITEMS)
+    except Exception as e:
+        # Losing the telemetry of a run must not keep the lock or the watermark from being updated.
+        logger.error(f"Error occurred while recording normalization run {run_id}: {str(e)}", exc_info=True)
+
+    # Failed shards are retried by the next run, which starts from the same watermark.
+    if error_count == 0:
+        cache.set(NORMALIZATION_WATERMARK_KEY, parse_datetime(started_at), None)
+    release_normalization_lock(run_id)
+    if cache.get(NORMALIZATION_RERUN_KEY):
+        cache.delete(NORMALIZATION_RERUN_KEY)
+        normalize_candidate_contents_scores.delay()
+
+    return {'normalized': normalized_count, 'updated': updated_count, 'errors': error_count}
+
+
+@shared_task
+def close_content_score_buckets():
+    """
+    Folds the hourly buckets that closed since the last run into the running statistics of the 'online'
+    normalization mode. Without a watermark every content is folded from its whole history.
+    """
+    if settings.CONTENT_NORMALIZATION_MODE != 'online':
+        return 0
+
+    before = ContentHourlyScore.truncate_to_hour(timezone.now())
+    closed_through = cache.get(BUCKET_CLOSING_WATERMARK_KEY)
+    buckets = ContentHourlyScore.objects.filter(hour__lt=before)
+    if closed_through is not None:
+        buckets = buckets.filter(hour__gte=closed_through)
+    content_ids = list(buckets.order_by('content_id').values_list('content_id', flat=True).distinct())
+
+    logger.info(f"Closing the hourly buckets of {len(content_ids)} contents before {before}.")
+    folded_count = 0
+    try:
+        for start in range(0, len(content_ids), BUCKET_CLOSING_BATCH_SIZE):
+            folded_count += ContentScoreStatistics.close_buckets(
+                content_ids[start:start + BUCKET_CLOSING_BATCH_SIZE], before,
+                decay=settings.CONTENT_NORMALIZATION_DECAY,
+            )
+    except Exception as e:
+        logger.error(f"Error occurred while closing hourly buckets: {str(e)}", exc_info=True)
+        raise
+
+    # Batches that did fold are not folded twice, since each statistics row remembers where it stopped.
+    cache.set(BUCKET_CLOSING_WATERMARK_KEY, before, None)
+    TASK_ITEMS.labels('close_content_score_buckets').inc(folded_count)
+    logger.info(f"Successfully folded {folded_count} hourly buckets of {len(content_ids)} contents.")
+    return folded_count
+
+
+def flush_bucket_deltas():
+    """
+    Moves the merged hourly bucket deltas from the write-behind buffer to the buckets, one upsert per chunk.
+    """
+    deltas = get_bucket_delta_buffer().drain()
+    try:
+        keys = sorted(deltas)
+        chunk_size = settings.CONTENT_SCORE_FLUSH_CHUNK_SIZE
+        for start in range(0, len(keys), chunk_size):
+            chunk_keys = keys[start:start + chunk_size]
+            with transaction.atomic():
+                ContentHourlyScore.write_bucket_deltas({key: deltas[key] for key in chunk_keys})
+            deltas.acknowledge(chunk_keys)
+    except Exception as e:
+        logger.error(f"Error occurred while flushing buffered bucket deltas: {str(e)}", exc_info=True)
+        raise
+    finally:
+        deltas.release()
+    return len(deltas)
+
+
+@shared_task
+def flush_content_score_deltas():
+    """
+    Moves the merged score deltas from the write-behind buffer to the content rows,
+    with at most one UPDATE per content and chunk, and the hourly bucket deltas to the buckets.
+    A chunk leaves the buffer only once its transaction committed; chunks that failed, or whose worker died,
+    are taken again by the next flush. Only a worker dying between a commit and its acknowledgement
+    makes that one chunk be written twice.
+    """
+    bucket_count = flush_bucket_deltas()
+    if bucket_count:
+        logger.info(f"Flushed buffered deltas of {bucket_count} hourly buckets.")
+
+    deltas = get_score_delta_buffer().drain()
+    try:
+        if not deltas:
+            return 0
+
+        logger.info(f"Flushing buffered score deltas of {len(deltas)} contents.")
+        content_ids = sorted(deltas)
+        chunk_size = settings.CONTENT_SCORE_FLUSH_CHUNK_SIZE
+        for start in range(0, len(content_ids), chunk_size):
+            chunk_ids = content_ids[start:start + chunk_size]
+            with transaction.atomic():
+                Content.write_score_deltas({content_id: deltas[content_id] for content_id in chunk_ids})
+            deltas.acknowledge(chunk_ids)
+    except Exception as e:
+        logger.error(f"Error occurred while flushing buffered score deltas: {str(e)}", exc_info=True)
+        raise
+    finally:
+        deltas.release()
+
+    TASK_ITEMS.labels('flush_content_score_deltas').inc(len(deltas))
+    logger.info(f"Successfully flushed buffered score deltas of {len(deltas)} contents.")
+    return len(deltas)
+
+
+@shared_task
+def compact_expired_score_events():
+    """
+    Folds score events older than SCORE_EVENT_RETENTION_DAYS into the per-content summaries, in bounded batches
+    so no transaction holds its locks for long.
+    """
+    before = timezone.now() - timedelta(days=settings.SCORE_EVENT_RETENTION_DAYS)
+    logger.info(f"Starting the compaction of score events older than {before}.")
+    started_at = time.monotonic()
+    compacted_count, batch_count = 0, 0
+    try:
+        while batch_count < settings.SCORE_EVENT_COMPACTION_MAX_BATCHES:
+            count = UpdateContentMeanScoreEvent.compact_batch(before, settings.SCORE_EVENT_COMPACTION_BATCH_SIZE)
+            if not count:
+                break
+            compacted_count += count
+            batch_count += 1
+    except Exception as e:
+        logger.error(f"Error occurred during compaction of score events: {str(e)}", exc_info=True)
+        raise
+    finally:
+        TASK_ITEMS.labels('compact_expired_score_events').inc(compacted_count)
+        elapsed = time.monotonic() - started_at
+        logger.info(
+            f"Compacted {compacted_count} score events in {batch_count} batches and {elapsed:.1f}s "
+            f"({compacted_count / elapsed if elapsed else 0:.0f} events/s).")
+
+    return compacted_count
@@ -1,8 +1,67 @@
-from django.test import TestCase
-from .models import Content, ContentScore
+import os
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings, AsyncClient, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from .counters import get_score_delta_buffer, get_bucket_delta_buffer
+from .users import known_user_ids, KnownUserIds
+from .models import Content, ContentScore, UpdateContentMeanScoreEvent, ContentHourlyScore, ScoreEventSummary, \
+    ContentScoreStatistics, NormalizationRun
+from .admission import acquire_score_write, get_admission_controller
+from .benchmark import compare_results, summarize
+from .datasets import DatasetSpec, generate_dataset
+from .utils import update_running_statistics, get_time_histogram, get_histogram_percentile
+from .cache import get_content_list_cache_stats, bump_content_list_version
+from .tasks import flush_content_score_deltas, normalize_candidate_contents_scores, NORMALIZATION_LOCK_KEY, \
+    NORMALIZATION_RERUN_KEY, NORMALIZATION_WATERMARK_KEY, normalize_content_shard, close_content_score_buckets
 from django.contrib.auth.models import User
 from django.utils import timezone
-from datetime import timedelta
+import json
+import time
+import numpy as np
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from asgiref.sync import sync_to_async, async_to_sync
+from prometheus_client import REGISTRY
+from redit.celery import app as celery_app
+from redit.metrics import RequestTimer
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class EagerCeleryMixin:
+    """
+    Runs tasks, groups and chords in-process with an in-memory result backend, so no broker is needed.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Settings loaded from Django keep their CELERY_ prefix in the app configuration.
+        old_configuration = {key: celery_app.conf[key] for key in ('CELERY_TASK_ALWAYS_EAGER', 'CELERY_RESULT_BACKEND')}
+        celery_app.conf['CELERY_TASK_ALWAYS_EAGER'] = True
+        celery_app.conf['CELERY_RESULT_BACKEND'] = 'cache+memory://'
+        celery_app._backend = celery_app._get_backend()
+        self.addCleanup(self.restore_celery, old_configuration)
+
+    @staticmethod
+    def restore_celery(old_configuration):
+        celery_app.conf.update(old_configuration)
+        celery_app._backend = celery_app._get_backend()
+
+
+def clear_delta_buffer(buffer):
+    deltas = buffer.drain()
+    deltas.acknowledge(list(deltas))
+    deltas.release()
+
 
 class ContentNormalizationTests(TestCase):
     def setUp(self):
@@ -47,3 +106,1134 @@ class ContentNormalizationTests(TestCase):
         # The mean should consider all scores including the score of 0
         expected_mean_with_outlier = (3 + 4 + 5 + 0) / 4  # Including the score of 0
         self.assertAlmostEqual(score_mean, expected_mean_with_outlier, places=2)
+
+
+class ContentScoreBulkTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1', id=1)
+        self.first_content = Content.objects.create(title='First', text='First content.')
+        self.second_content = Content.objects.create(title='Second', text='Second content.')
+        ContentScore.objects.create(content=self.first_content, user=self.user, score=2, scored_at=timezone.now())
+        self.client = APIClient()
+
+    def test_bulk_upsert_matches_single_score_counters(self):
+        response = self.client.post('/content/score/bulk/', {
+            'user_id': self.user.id,
+            'scores': [
+                {'content': self.first_content.id, 'score': 5},
+                {'content': self.second_content.id, 'score': 4},
+                {'content': 999, 'score': 1},
+            ],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            [ContentScore.BulkStatus.UPDATED, ContentScore.BulkStatus.CREATED, ContentScore.BulkStatus.NOT_FOUND],
+        )
+
+        self.first_content.refresh_from_db()
+        self.second_content.refresh_from_db()
+        self.assertEqual((self.first_content.score_sum, self.first_content.score_count), (5, 1))
+        self.assertEqual((self.second_content.score_sum, self.second_content.score_count), (4, 1))
+        self.assertEqual(UpdateContentMeanScoreEvent.objects.count(), 3)
+
+    def test_bulk_upsert_unchanged_score_creates_no_event(self):
+        results = ContentScore.bulk_upsert(self.user.id, [(self.first_content.id, 2)])
+
+        self.assertEqual(results[0]['status'], ContentScore.BulkStatus.UNCHANGED)
+        self.assertEqual(UpdateContentMeanScoreEvent.objects.count(), 1)
+
+    def test_bulk_upsert_marks_repeated_contents_superseded(self):
+        results = ContentScore.bulk_upsert(
+            self.user.id, [(self.second_content.id, 1), (self.first_content.id, 4), (self.second_content.id, 3)])
+
+        self.assertEqual([result['status'] for result in results], [
+            ContentScore.BulkStatus.SUPERSEDED, ContentScore.BulkStatus.UPDATED, ContentScore.BulkStatus.CREATED])
+        self.assertEqual(ContentScore.objects.get(user=self.user, content=self.second_content).score, 3)
+
+
+@override_settings(CONTENT_SCORE_WRITE_BEHIND=True, CONTENT_SCORE_BUFFER_BACKEND='local')
+class ContentScoreWriteBehindTests(TestCase):
+    def setUp(self):
+        clear_delta_buffer(get_score_delta_buffer())
+        self.addCleanup(clear_delta_buffer, get_score_delta_buffer())
+        self.user1 = User.objects.create(username='user1', id=1)
+        self.user2 = User.objects.create(username='user2', id=2)
+        self.content = Content.objects.create(title='Sample Content', text='This is a sample content.')
+
+    def test_buffered_deltas_are_pending_until_flushed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ContentScore.objects.create(content=self.content, user=self.user1, score=4, scored_at=timezone.now())
+            ContentScore.objects.create(content=self.content, user=self.user2, score=1, scored_at=timezone.now())
+
+        content = Content.objects.get(id=self.content.id)
+        self.assertEqual((content.score_sum, content.score_count), (0, 0))
+        self.assertAlmostEqual(content.get_score(), 2.5)
+        self.assertEqual(content.get_score_count(), 2)
+
+        self.assertEqual(flush_content_score_deltas(), 1)
+
+        content = Content.objects.get(id=self.content.id)
+        self.assertEqual((content.score_sum, content.score_count), (5, 2))
+        self.assertAlmostEqual(content.get_score(), 2.5)
+
+    @override_settings(CONTENT_SCORE_FLUSH_CHUNK_SIZE=1)
+    def test_deltas_stay_buffered_until_their_chunk_is_written(self):
+        other_content = Content.objects.create(title='Other Content', text='This is another content.')
+        get_score_delta_buffer().add({self.content.id: (4, 1), other_content.id: (2, 1)})
+
+        # A drain that is not released yet, like one whose worker is still writing, shuts out other drains,
+        # and its deltas stay visible until they are acknowledged.
+        deltas = get_score_delta_buffer().drain()
+        self.assertEqual(flush_content_score_deltas(), 0)
+        self.assertEqual(Content.objects.get(id=self.content.id).get_score_count(), 1)
+        deltas.acknowledge([self.content.id])
+        self.assertEqual(Content.objects.get(id=self.content.id).get_score_count(), 0)
+        deltas.release()
+
+        get_score_delta_buffer().add({self.content.id: (4, 1)})
+        write_score_deltas, chunks = Content.write_score_deltas, []
+
+        def fail_second_chunk(deltas):
+            chunks.append(deltas)
+            if len(chunks) == 2:
+                raise Exception('deadlock')
+            return write_score_deltas(deltas)
+
+        with patch.object(Content, 'write_score_deltas', side_effect=fail_second_chunk), \
+                self.assertRaises(Exception):
+            flush_content_score_deltas()
+
+        # Only the chunk that was not written is flushed again.
+        self.assertEqual(flush_content_score_deltas(), 1)
+        self.assertEqual(list(Content.objects.order_by('id').values_list('score_sum', 'score_count')),
+                         [(4, 1), (2, 1)])
+        self.assertEqual(get_score_delta_buffer().get_many([self.content.id, other_content.id]), {})
+
+    def test_score_writes_leave_the_bucket_rows_to_the_flush(self):
+        clear_delta_buffer(get_bucket_delta_buffer())
+        self.addCleanup(clear_delta_buffer, get_bucket_delta_buffer())
+        with self.captureOnCommitCallbacks(execute=True):
+            ContentScore.upsert(self.user1.id, self.content.id, 4)
+
+        # Writers of the same content share the bucket of the current hour, which a write must not lock.
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as context:
+            ContentScore.upsert(self.user2.id, self.content.id, 2)
+            ContentScore.bulk_upsert(self.user1.id, [(self.content.id, 5)])
+            ContentScore(user=User.objects.create(username='user3', id=3), content=self.content, score=1,
+                         scored_at=timezone.now()).save()
+        self.assertFalse([query for query in context.captured_queries
+                          if ContentHourlyScore._meta.db_table in query['sql']])
+        self.assertFalse(ContentHourlyScore.objects.exists())
+
+        flush_content_score_deltas()
+        self.assertEqual(list(ContentHourlyScore.objects.values_list('score_count', 'score_sum')), [(3, 8)])
+
+
+class ContentHourlyScoreTests(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1', id=1)
+        self.user2 = User.objects.create(username='user2', id=2)
+        self.content = Content.objects.create(title='Sample Content', text='This is a sample content.')
+        self.now = timezone.now()
+
+    def get_buckets(self):
+        return {
+            bucket.hour: (bucket.score_count, bucket.score_sum)
+            for bucket in ContentHourlyScore.objects.filter(content=self.content, score_count__gt=0)
+        }
+
+    def test_score_update_moves_old_score_out_of_its_bucket(self):
+        ContentScore.objects.create(
+            content=self.content, user=self.user1, score=1, scored_at=self.now - timedelta(hours=5))
+        ContentScore.objects.create(content=self.content, user=self.user2, score=4, scored_at=self.now)
+        content_score = ContentScore.objects.get(content=self.content, user=self.user1)
+        content_score.score = 3
+        content_score.scored_at = self.now
+        content_score.save()
+
+        self.assertEqual(self.get_buckets(), {ContentHourlyScore.truncate_to_hour(self.now): (2, 7)})
+
+    def test_rebuild_matches_incremental_buckets(self):
+        ContentScore.objects.create(
+            content=self.content, user=self.user1, score=1, scored_at=self.now - timedelta(hours=5))
+        ContentScore.bulk_upsert(self.user1.id, [(self.content.id, 2)])
+        ContentScore.bulk_upsert(self.user2.id, [(self.content.id, 5)])
+        incremental_buckets = self.get_buckets()
+
+        ContentHourlyScore.rebuild([self.content.id])
+
+        self.assertEqual(self.get_buckets(), incremental_buckets)
+        self.assertEqual(list(incremental_buckets.values()), [(2, 7)])
+
+
+class ContentBatchNormalizationTests(EagerCeleryMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        users = [User.objects.create(username=f'user{i}', id=i) for i in range(1, 13)]
+        now = timezone.now()
+        self.contents = [Content.objects.create(title=f'Content {i}', text=f'Content {i}.') for i in range(4)]
+
+        for index, content in enumerate(self.contents[:3]):
+            for user in users[:9]:
+                ContentScore.objects.create(content=content, user=user, score=(user.id + index) % 3 + 3,
+                                            scored_at=now - timedelta(hours=user.id % 5))
+            for user in users[9:]:
+                ContentScore.objects.create(content=content, user=user, score=index % 2,
+                                            scored_at=now - timedelta(hours=7))
+        # A single hourly bucket has no spread, so it falls back to the exact mean.
+        ContentScore.objects.create(content=self.contents[3], user=users[0], score=2, scored_at=now)
+
+    def test_batch_normalization_matches_per_object_reference(self):
+        contents = list(Content.objects.order_by('id'))
+        expected = [content.calculate_normalized_score_mean() for content in contents]
+
+        normalize_candidate_contents_scores()
+
+        for content, expected_mean in zip(Content.objects.order_by('id'), expected):
+            self.assertAlmostEqual(content.normalized_score_mean, expected_mean, places=9)
+
+    @patch('content.tasks.NORMALIZATION_SHARD_SIZE', 2)
+    def test_sharded_normalization_releases_lock(self):
+        normalize_candidate_contents_scores()
+
+        self.assertFalse(Content.objects.filter(normalized_score_mean__isnull=True).exists())
+        self.assertIsNone(cache.get(NORMALIZATION_LOCK_KEY))
+
+    def test_tick_during_running_normalization_is_merged(self):
+        cache.add(NORMALIZATION_LOCK_KEY, 'running', 60)
+
+        normalize_candidate_contents_scores()
+
+        self.assertTrue(Content.objects.filter(normalized_score_mean__isnull=True).exists())
+        self.assertTrue(cache.get(NORMALIZATION_RERUN_KEY))
+
+
+class ContentListPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='user1', id=1)
+        self.contents = [Content.objects.create(title=f'Content {i}', text=f'Content {i}.') for i in range(5)]
+        ContentScore.objects.create(content=self.contents[3], user=self.user, score=4, scored_at=timezone.now())
+        self.client = APIClient()
+
+    def test_cursor_pagination_walks_all_pages_with_user_score(self):
+        response = self.client.get('/content/list/', {'pagination': 'cursor', 'page_size': 2, 'user_id': self.user.id})
+        self.assertNotIn('count', response.data)
+
+        results = list(response.data['results'])
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            results.extend(response.data['results'])
+
+        self.assertEqual([result['id'] for result in results], [content.id for content in self.contents])
+        self.assertEqual([result['user_score'] for result in results], [None, None, None, 4, None])
+
+    def test_page_number_pagination_is_the_default(self):
+        response = self.client.get('/content/list/', {'page': 2, 'page_size': 2})
+
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([result['id'] for result in response.data['results']],
+                         [content.id for content in self.contents[2:4]])
+
+    def test_unknown_pagination_mode_is_rejected(self):
+        response = self.client.get('/content/list/', {'pagination': 'offset'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CONTENT_LIST_CACHE_TIMEOUT=0)
+class ContentListFastPathTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1', id=1)
+        self.contents = [Content.objects.create(title=f'Content "{i}" ✓', text='Text ' * 1000) for i in range(4)]
+        now = timezone.now()
+        ContentScore.objects.create(content=self.contents[0], user=self.user, score=0, scored_at=now)
+        ContentScore.objects.create(content=self.contents[1], user=self.user, score=5, scored_at=now)
+        # Far enough from the exact mean that the normalized mean is shown.
+        Content.objects.filter(id=self.contents[1].id).update(normalized_score_mean=3.25)
+        self.client = APIClient()
+
+    def get_bodies(self, path, params):
+        bodies = []
+        for fast_path in (False, True):
+            with override_settings(CONTENT_LIST_FAST_PATH=fast_path):
+                bodies.append(self.client.get(path, params).content)
+        return bodies
+
+    def test_rows_render_the_same_bytes_as_the_serializer(self):
+        for params in ({}, {'user_id': self.user.id}, {'pagination': 'cursor', 'page_size': 3, 'user_id': 2}):
+            model_body, row_body = self.get_bodies('/content/list/', params)
+            self.assertEqual(row_body, model_body)
+
+        model_body, row_body = self.get_bodies('/content/top/', {'user_id': self.user.id})
+        self.assertEqual(row_body, model_body)
+        self.assertEqual(json.loads(row_body)['results'][0]['score'], 3.25)
+
+    @override_settings(CONTENT_SCORE_WRITE_BEHIND=True, CONTENT_SCORE_BUFFER_BACKEND='local')
+    def test_rows_include_buffered_score_deltas(self):
+        clear_delta_buffer(get_score_delta_buffer())
+        get_score_delta_buffer().add({self.contents[2].id: (3, 1)})
+        self.addCleanup(clear_delta_buffer, get_score_delta_buffer())
+
+        model_body, row_body = self.get_bodies('/content/list/', {})
+        self.assertEqual(row_body, model_body)
+        self.assertEqual(json.loads(row_body)['results'][2]['score'], 3.0)
+
+    def test_rows_skip_the_text_column(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/content/list/', {'user_id': self.user.id})
+
+        self.assertFalse(any('"text"' in query['sql'] for query in context.captured_queries))
+
+
+class ContentListETagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        known_user_ids.clear()
+        self.user = User.objects.create(username='user1', id=1)
+        self.contents = [Content.objects.create(title=f'Content {i}', text=f'Content {i}.') for i in range(3)]
+        self.client = APIClient()
+
+    def get_page(self, etag=None, **params):
+        params.setdefault('user_id', self.user.id)
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/content/list/', params, **headers)
+
+    def score(self, content, user_id, score):
+        self.client.post('/content/score/', {'content': content.id, 'score': score, 'user_id': user_id},
+                         format='json')
+
+    @override_settings(CONTENT_LIST_CACHE_TIMEOUT=0)
+    def test_unchanged_page_is_not_modified(self):
+        etag = self.get_page()['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.get_page(etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        # The count, the (id, modified_at) slice and the latest score of the user; no title and no overlay.
+        self.assertEqual(len(context.captured_queries), 3)
+        self.assertFalse(any('"title"' in query['sql'] for query in context.captured_queries))
+        self.assertEqual(self.get_page(etag, pagination='cursor').status_code, 200)
+
+    @override_settings(CONTENT_LIST_CACHE_TIMEOUT=0)
+    def test_writes_change_the_etag(self):
+        etag = self.get_page()['ETag']
+        self.score(self.contents[1], 2, 4)
+        response = self.get_page(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][1]['score'], 4)
+
+        etag = response['ETag']
+        self.score(self.contents[2], self.user.id, 1)
+        response = self.get_page(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][2]['user_score'], 1)
+
+        etag = response['ETag']
+        Content.objects.create(title='New', text='New.')
+        self.assertEqual(self.get_page(etag).status_code, 200)
+
+    @override_settings(CONTENT_LIST_CACHE_TIMEOUT=0)
+    def test_normalization_without_changes_keeps_the_etag(self):
+        self.score(self.contents[1], 2, 4)
+        Content.normalize_batch(Content.objects.all())
+        etag = self.get_page()['ETag']
+        modified_at = Content.objects.get(id=self.contents[1].id).modified_at
+
+        with CaptureQueriesContext(connection) as context:
+            Content.normalize_batch(Content.objects.all())
+            Content.objects.get(id=self.contents[1].id).update_normalized_score_mean()
+
+        self.assertFalse(any(query['sql'].startswith('UPDATE') for query in context.captured_queries))
+        self.assertEqual(Content.objects.get(id=self.contents[1].id).modified_at, modified_at)
+        self.assertEqual(self.get_page(etag).status_code, 304)
+
+    def test_cached_page_is_not_modified_without_reading_the_page(self):
+        etag = self.get_page()['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.get_page(etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(self.get_page(etag, user_id=2).status_code, 304)
+
+    @override_settings(CONTENT_LIST_CACHE_TIMEOUT=0)
+    def test_cursor_pages_are_versioned(self):
+        response = self.get_page(pagination='cursor', page_size=2)
+        etag = response['ETag']
+        self.assertEqual(self.get_page(etag, pagination='cursor', page_size=2).status_code, 304)
+
+        next_response = self.client.get(response.data['next'])
+        self.assertNotEqual(next_response['ETag'], etag)
+
+
+class ContentScoreLookupTests(TestCase):
+    def setUp(self):
+        known_user_ids.clear()
+        self.user = User.objects.create(username='user1', id=1)
+        self.contents = [Content.objects.create(title=f'Content {i}', text=f'Content {i}.') for i in range(3)]
+        ContentScore.upsert(self.user.id, self.contents[0].id, 4)
+        ContentScore.upsert(self.user.id, self.contents[2].id, 0)
+        self.client = APIClient()
+
+    def test_scores_are_looked_up_with_one_query(self):
+        ids = ','.join(str(content.id) for content in self.contents)
+        with self.assertNumQueries(1):
+            response = self.client.get('/content/score/mine/', {'ids': ids, 'user_id': self.user.id})
+
+        self.assertEqual(response.json(), {'scores': {str(self.contents[0].id): 4, str(self.contents[2].id): 0}})
+
+    def test_compact_output_follows_the_request_order(self):
+        content_ids = [self.contents[2].id, 999, self.contents[0].id, self.contents[1].id]
+        response = self.client.post('/content/score/mine/', {
+            'content_ids': content_ids, 'output': 'compact', 'user_id': self.user.id
+        }, format='json')
+
+        self.assertEqual(response.json(), {'scores': '0-4-'})
+
+    def test_lookup_is_validated(self):
+        self.assertEqual(self.client.get('/content/score/mine/', {'ids': '1,2'}).status_code, 400)
+        self.assertEqual(self.client.get('/content/score/mine/', {'ids': '1,x', 'user_id': 1}).status_code, 400)
+
+        content_ids = list(range(1, settings.CONTENT_SCORE_LOOKUP_MAX_ITEMS + 2))
+        response = self.client.post('/content/score/mine/', {'content_ids': content_ids, 'user_id': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ContentListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create(username='user1', id=1)
+        self.user2 = User.objects.create(username='user2', id=2)
+        self.content = Content.objects.create(title='Sample Content', text='This is a sample content.')
+        ContentScore.objects.create(content=self.content, user=self.user1, score=4, scored_at=timezone.now())
+        self.client = APIClient()
+
+    def test_cached_page_overlays_the_requesting_user_score(self):
+        first_response = self.client.get('/content/list/', {'user_id': self.user1.id})
+        # Only the ContentScore lookup of the overlay and the latest score of the user for the ETag.
+        with self.assertNumQueries(2):
+            second_response = self.client.get('/content/list/', {'user_id': self.user2.id})
+
+        self.assertEqual(first_response.data['results'][0]['user_score'], 4)
+        self.assertEqual(second_response.data['results'][0]['user_score'], None)
+        self.assertEqual(second_response.data['results'][0]['score'], 4)
+        self.assertEqual(get_content_list_cache_stats()['hits'], 1)
+        self.assertEqual(get_content_list_cache_stats()['misses'], 1)
+
+    def test_version_bump_invalidates_cached_pages(self):
+        self.client.get('/content/list/')
+        Content.objects.filter(id=self.content.id).update(score_sum=2)
+        bump_content_list_version()
+
+        response = self.client.get('/content/list/')
+
+        self.assertEqual(response.data['results'][0]['score'], 2)
+        self.assertEqual(get_content_list_cache_stats()['misses'], 2)
+
+
+class ContentTopListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        users = [User.objects.create(username=f'user{i}', id=i) for i in range(1, 4)]
+        self.low = Content.objects.create(title='Low', text='Low.')
+        self.high = Content.objects.create(title='High', text='High.')
+        self.normalized = Content.objects.create(title='Normalized', text='Normalized.')
+        for user in users:
+            ContentScore.objects.create(content=self.low, user=user, score=1, scored_at=timezone.now())
+            ContentScore.objects.create(content=self.normalized, user=user, score=2, scored_at=timezone.now())
+        ContentScore.objects.create(content=self.high, user=users[0], score=5, scored_at=timezone.now())
+        self.normalized.refresh_from_db()
+        self.normalized.normalized_score_mean = 4.5
+        self.normalized.save(update_fields=['normalized_score_mean'])
+        self.client = APIClient()
+
+    def test_materialized_scores_follow_get_score(self):
+        for content in Content.objects.all():
+            self.assertAlmostEqual(content.effective_score, content.get_score())
+            self.assertAlmostEqual(content.score_mean, content.calculate_score_mean())
+
+    def test_save_writes_materialized_scores_and_stamp_in_one_statement(self):
+        content = Content(title='New', text='New.', score_sum=10, score_count=2, normalized_score_mean=3.0)
+        with CaptureQueriesContext(connection) as context:
+            content.save()
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual((content.score_mean, content.effective_score), (5.0, 3.0))
+        self.assertIsInstance(content.modified_at, datetime)
+
+        # Counters that moved on since the instance was read are taken from the row.
+        Content.objects.filter(id=content.id).update(score_sum=4, score_count=1)
+        content.normalized_score_mean = 1.0
+        with CaptureQueriesContext(connection) as context:
+            content.save(update_fields=['normalized_score_mean'])
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual((content.score_sum, content.score_mean, content.effective_score), (10, 4.0, 1.0))
+
+    def test_top_list_orders_by_effective_score(self):
+        response = self.client.get('/content/top/', {'ordering': '-score'})
+        self.assertEqual([row['id'] for row in response.data['results']],
+                         [self.high.id, self.normalized.id, self.low.id])
+        self.assertEqual(response.data['results'][1]['score'], 4.5)
+
+        response = self.client.get('/content/top/', {'ordering': 'score', 'min_score_count': 2})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.low.id, self.normalized.id])
+
+
+class ContentDirtyNormalizationTests(EagerCeleryMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = User.objects.create(username='user1', id=1)
+        self.user2 = User.objects.create(username='user2', id=2)
+        self.untouched = Content.objects.create(title='Untouched', text='Untouched.')
+        self.touched = Content.objects.create(title='Touched', text='Touched.')
+        for content in (self.untouched, self.touched):
+            ContentScore.objects.create(content=content, user=self.user1, score=3, scored_at=timezone.now())
+
+    def test_first_run_checks_every_content_and_sets_watermark(self):
+        normalize_candidate_contents_scores()
+
+        self.assertFalse(Content.objects.filter(normalized_score_mean__isnull=True).exists())
+        self.assertIsNotNone(cache.get(NORMALIZATION_WATERMARK_KEY))
+
+    def test_run_only_checks_contents_scored_since_watermark(self):
+        Content.objects.filter(id=self.untouched.id).update(score_changed_at=timezone.now() - timedelta(hours=1))
+        cache.set(NORMALIZATION_WATERMARK_KEY, timezone.now(), None)
+        ContentScore.objects.create(content=self.touched, user=self.user2, score=5, scored_at=timezone.now())
+
+        normalize_candidate_contents_scores()
+
+        self.untouched.refresh_from_db()
+        self.touched.refresh_from_db()
+        self.assertIsNone(self.untouched.normalized_score_mean)
+        self.assertAlmostEqual(self.touched.normalized_score_mean, 4)
+
+
+class ScoreExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', id=100, is_staff=True)
+        self.user = User.objects.create(username='user1', id=1)
+        self.contents = [Content.objects.create(title=f'Content {i}', text=f'Content {i}.') for i in range(3)]
+        for content in self.contents:
+            ContentScore.objects.create(content=content, user=self.user, score=3, scored_at=timezone.now())
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    @override_settings(CONTENT_EXPORT_CHUNK_SIZE=2)
+    def test_ndjson_export_resumes_after_id(self):
+        first_score = ContentScore.objects.order_by('id').first()
+        response = self.client.get('/content/export/scores/', {'after_id': first_score.id})
+
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['content_id'] for row in rows], [content.id for content in self.contents[1:]])
+
+    def test_csv_event_export_filters_by_content(self):
+        response = self.client.get('/content/export/events/', {'content': self.contents[0].id, 'output': 'csv'})
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,content_id,content_score_id,type,old_score,new_score,occurred_at')
+        self.assertEqual(len(lines), 2)
+
+    def test_export_requires_admin(self):
+        self.client.force_authenticate(self.user)
+
+        self.assertEqual(self.client.get('/content/export/scores/').status_code, 403)
+
+    def test_command_rejects_malformed_times(self):
+        for since in ('2024-13-01T00:00:00', '2024-13-01', 'yesterday'):
+            with self.assertRaises(CommandError):
+                call_command('export_scores', 'scores', '--since', since, stdout=StringIO())
+
+        output = StringIO()
+        call_command('export_scores', 'scores', '--since', '2999-01-01T00:00:00', stdout=output)
+        self.assertEqual(output.getvalue(), '')
+
+
+class ScoreEventCompactionTests(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1', id=1)
+        self.user2 = User.objects.create(username='user2', id=2)
+        self.content = Content.objects.create(title='Sample Content', text='This is a sample content.')
+        ContentScore.objects.create(content=self.content, user=self.user1, score=0, scored_at=timezone.now())
+        ContentScore.bulk_upsert(self.user1.id, [(self.content.id, 3)])
+        ContentScore.objects.create(content=self.content, user=self.user2, score=4, scored_at=timezone.now())
+        UpdateContentMeanScoreEvent.objects.update(occurred_at=timezone.now() - timedelta(days=100))
+
+    def test_compaction_folds_events_into_summary_in_batches(self):
+        before = timezone.now() - timedelta(days=90)
+        self.assertEqual(UpdateContentMeanScoreEvent.compact_batch(before, 2), 2)
+        self.assertEqual(UpdateContentMeanScoreEvent.compact_batch(before, 2), 1)
+        self.assertEqual(UpdateContentMeanScoreEvent.compact_batch(before, 2), 0)
+
+        summary = ScoreEventSummary.objects.get(content=self.content)
+        self.content.refresh_from_db()
+        self.assertEqual((summary.add_count, summary.update_count), (2, 1))
+        self.assertEqual(summary.score_change_sum, self.content.score_sum)
+        self.assertFalse(UpdateContentMeanScoreEvent.objects.exists())
+
+    def test_expired_events_are_found_through_the_occurred_at_index(self):
+        expired = UpdateContentMeanScoreEvent.objects.filter(occurred_at__lt=timezone.now())
+
+        self.assertIn('score_event_occurred_at_idx', expired.order_by('occurred_at', 'id')[:10].explain())
+        self.assertIn('score_event_occurred_at_idx', expired.order_by().explain())
+
+
+class ReconcileContentScoresTests(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username='user1', id=1)
+        self.user2 = User.objects.create(username='user2', id=2)
+        self.contents = [Content.objects.create(title=f'Content {i}', text=f'Content {i}.') for i in range(3)]
+        for content in self.contents:
+            ContentScore.objects.create(content=content, user=self.user1, score=2, scored_at=timezone.now())
+            ContentScore.objects.create(content=content, user=self.user2, score=5, scored_at=timezone.now())
+        Content.objects.filter(id=self.contents[1].id).update(score_sum=40, score_count=9)
+
+    def test_reconcile_fixes_drift_and_renormalizes_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'checkpoint.json')
+            output = StringIO()
+            call_command('reconcile_content_scores', '--chunk-size', '2', '--renormalize', '--checkpoint', checkpoint,
+                         stdout=output)
+
+            self.assertIn(f'Content {self.contents[1].id}: score_sum 40 -> 7, score_count 9 -> 2', output.getvalue())
+            with open(checkpoint) as checkpoint_file:
+                self.assertGreaterEqual(json.load(checkpoint_file)['renormalized_through'], self.contents[-1].id)
+
+            Content.objects.update(score_sum=0)
+            call_command('reconcile_content_scores', '--checkpoint', checkpoint, stdout=StringIO())
+
+        for content in Content.objects.all():
+            self.assertEqual((content.score_sum, content.score_count), (0, 2))
+            self.assertAlmostEqual(content.normalized_score_mean, 3.5)
+
+    def test_dry_run_only_reports(self):
+        output = StringIO()
+        call_command('reconcile_content_scores', '--dry-run', stdout=output)
+
+        self.assertIn('Found 1 contents with drifted counters', output.getvalue())
+        self.assertEqual(Content.objects.get(id=self.contents[1].id).score_sum, 40)
+
+
+class GenerateDatasetTests(TestCase):
+    def generate(self, *extra):
+        call_command('generate_dataset', '--users', '30', '--contents', '7', '--scores-per-content', '25',
+                     '--surge-users', '5', '--batch-size', '40', '--end', '2024-01-02T00:00:00+00:00', *extra,
+                     stdout=StringIO())
+
+    def test_generated_rows_match_the_write_path(self):
+        self.generate('--normalize')
+
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(ContentScore.objects.count(), 7 * 25)
+        self.assertEqual(UpdateContentMeanScoreEvent.objects.count(), 7 * 25)
+        self.assertFalse(UpdateContentMeanScoreEvent.objects.exclude(occurred_at=F('content_score__scored_at')))
+        for content in Content.objects.all():
+            scores = list(ContentScore.objects.filter(content=content).values_list('score', flat=True))
+            self.assertEqual((content.score_sum, content.score_count), (sum(scores), len(scores)))
+            self.assertAlmostEqual(content.score_mean, sum(scores) / len(scores))
+            self.assertAlmostEqual(content.normalized_score_mean, content.calculate_normalized_score_mean())
+
+        bucket_fields = ('content_id', 'hour', 'score_sum', 'score_count')
+        generated_buckets = sorted(ContentHourlyScore.objects.values_list(*bucket_fields))
+        ContentHourlyScore.rebuild(list(Content.objects.values_list('id', flat=True)))
+        self.assertEqual(sorted(ContentHourlyScore.objects.values_list(*bucket_fields)), generated_buckets)
+
+    def test_contents_inserted_meanwhile_are_detected(self):
+        insert_content = Content.objects.bulk_create
+
+        def insert_with_intruder(contents, **kwargs):
+            Content.objects.create(title='Intruder', text='Intruder.')
+            return insert_content(contents, **kwargs)
+
+        with patch.object(Content.objects, 'bulk_create', side_effect=insert_with_intruder), \
+                self.assertRaisesMessage(Exception, 'another writer inserted contents'):
+            self.generate()
+
+    def test_same_seed_produces_same_scores(self):
+        self.generate('--seed', '7')
+        first = list(ContentScore.objects.order_by('id').values_list('user__username', 'score', 'scored_at'))
+        ContentScore.objects.all().delete()
+        Content.objects.all().delete()
+        self.generate('--seed', '7')
+
+        self.assertEqual(list(ContentScore.objects.order_by('id').values_list('user__username', 'score', 'scored_at')),
+                         first)
+
+
+class BenchmarkComparisonTests(TestCase):
+    def test_summarize_reports_percentiles(self):
+        stats = summarize([index / 1000 for index in range(1, 101)], [3] * 100, 1, 2.0)
+
+        self.assertEqual((stats['iterations'], stats['errors'], stats['queries_max']), (100, 1, 3))
+        self.assertAlmostEqual(stats['throughput'], 50)
+        self.assertAlmostEqual(stats['p50_ms'], 50.5)
+        self.assertAlmostEqual(stats['p99_ms'], 99.01)
+
+    def test_compare_flags_slower_and_chattier_operations(self):
+        baseline = {'results': {'small': {
+            'list': summarize([0.010] * 10, [4] * 10, 0, 1.0),
+            'score': summarize([0.020] * 10, [9] * 10, 0, 1.0),
+        }}}
+        current = {'results': {'small': {
+            'list': summarize([0.011] * 10, [5] * 10, 0, 1.0),
+            'score': summarize([0.030] * 10, [9] * 10, 0, 1.0),
+            'normalize': summarize([1.0], [7], 0, 1.0),
+        }}}
+
+        regressions = compare_results(baseline, current, tolerance=0.2)
+
+        self.assertEqual(
+            sorted((regression['operation'], regression['metric']) for regression in regressions),
+            [('list', 'queries_max'), ('score', 'p50_ms'), ('score', 'p95_ms')],
+        )
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        Content.objects.create(title='Content', text='Content.')
+
+    def get_sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_requests_are_timed_and_counted_per_view(self):
+        labels = {'view': 'ContentListView', 'method': 'GET'}
+        old_count = self.get_sample('http_request_duration_seconds_count', status='200', **labels)
+        old_queries = self.get_sample('http_request_db_queries_sum', **labels)
+
+        self.client.get('/content/list/')
+
+        self.assertEqual(self.get_sample('http_request_duration_seconds_count', status='200', **labels), old_count + 1)
+        self.assertGreater(self.get_sample('http_request_db_queries_sum', **labels), old_queries)
+
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_request_duration_seconds_bucket{le="0.005",method="GET",status="200",view="ContentListView"}',
+                      response.content)
+
+    def test_queries_in_executor_threads_are_counted(self):
+        def run_query():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            finally:
+                connection.close()
+
+        # Under ASGI the ORM calls of async views run on executor threads with their own connections.
+        with RequestTimer(RequestFactory().get('/content/async/list/')) as timer:
+            async_to_sync(sync_to_async(run_query, thread_sensitive=False))()
+        self.assertEqual(timer.query_timer.count, 1)
+
+    def test_task_items_are_counted(self):
+        old_value = self.get_sample('celery_task_processed_items_total', task='normalize_content_shard')
+        content = Content.objects.get()
+        normalize_content_shard(content.id, content.id)
+
+        self.assertEqual(self.get_sample('celery_task_processed_items_total', task='normalize_content_shard'),
+                         old_value + 1)
+
+
+class AsyncContentViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='user1', id=1)
+        self.contents = [Content.objects.create(title=f'Content {i}', text=f'Content {i}.') for i in range(5)]
+        ContentScore.objects.create(content=self.contents[3], user=self.user, score=4, scored_at=timezone.now())
+
+    async def test_async_list_matches_the_sync_list(self):
+        params = {'page': 2, 'page_size': 2, 'user_id': self.user.id}
+        sync_response = await sync_to_async(APIClient().get)('/content/list/', params)
+        async_response = await AsyncClient().get('/content/async/list/', params)
+
+        self.assertEqual(async_response.status_code, 200)
+        expected = json.loads(sync_response.content)
+        for link in ('next', 'previous'):
+            expected[link] = expected[link].replace('/content/list/', '/content/async/list/')
+        self.assertEqual(json.loads(async_response.content), expected)
+
+        invalid_response = await AsyncClient().get('/content/async/list/', {'page': 9})
+        self.assertEqual(invalid_response.status_code, 404)
+
+    async def test_async_score_creates_and_updates(self):
+        client = AsyncClient()
+        for score in (2, 5):
+            response = await client.post('/content/async/score/', {
+                'content': self.contents[0].id, 'score': score, 'user_id': self.user.id
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+
+        content = await Content.objects.aget(id=self.contents[0].id)
+        self.assertEqual((content.score_sum, content.score_count), (5, 1))
+
+        response = await client.post('/content/async/score/', {'content': 999, 'score': 1, 'user_id': self.user.id},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('content', json.loads(response.content))
+
+    async def test_async_errors_match_the_sync_errors(self):
+        cases = [
+            {'content': self.contents[0].id, 'score': 1, 'user_id': 'abc'},
+            {'content': self.contents[0].id, 'score': 1},
+            {'content': 999, 'score': 1, 'user_id': self.user.id},
+            {'content': self.contents[0].id, 'score': 7, 'user_id': self.user.id},
+            {'score': 1, 'user_id': self.user.id},
+        ]
+        for body in cases:
+            sync_response = await sync_to_async(APIClient().post)('/content/score/', body, format='json')
+            async_response = await AsyncClient().post('/content/async/score/', body, content_type='application/json')
+            self.assertEqual((async_response.status_code, json.loads(async_response.content)),
+                             (sync_response.status_code, json.loads(sync_response.content)), body)
+
+        for path in ('/content/score/', '/content/async/score/'):
+            response = await AsyncClient().post(path, '{', content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        for params, headers in (({'user_id': 'abc'}, {}), ({}, {'Authorization': 'Bearer invalid'})):
+            sync_response = await sync_to_async(APIClient().get)('/content/list/', params, headers=headers)
+            async_response = await AsyncClient().get('/content/async/list/', params, headers=headers)
+            self.assertEqual((async_response.status_code, json.loads(async_response.content)),
+                             (sync_response.status_code, json.loads(sync_response.content)))
+
+
+class UserResolutionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        known_user_ids.clear()
+        self.content = Content.objects.create(title='Content', text='Content.')
+        self.client = APIClient()
+
+    @staticmethod
+    def get_user_queries(queries):
+        return [query['sql'] for query in queries if 'auth_user' in query['sql']]
+
+    def test_unknown_user_is_created_once(self):
+        with CaptureQueriesContext(connection) as first_queries:
+            self.client.post('/content/score/', {'content': self.content.id, 'score': 3, 'user_id': 42}, format='json')
+        with CaptureQueriesContext(connection) as second_queries:
+            response = self.client.post('/content/score/', {'content': self.content.id, 'score': 4, 'user_id': 42},
+                                        format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(User.objects.get(id=42).username, 'user_42')
+        self.assertEqual(len(self.get_user_queries(first_queries)), 2)
+        self.assertEqual(self.get_user_queries(second_queries), [])
+
+    def test_user_whose_insert_was_skipped_is_not_remembered(self):
+        User.objects.create(username='user_42', id=7)
+
+        response = self.client.post('/content/score/', {'content': self.content.id, 'score': 3, 'user_id': 42},
+                                    format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('user_id', response.data)
+        self.assertNotIn(42, known_user_ids)
+        self.assertFalse(ContentScore.objects.exists())
+
+    def test_jwt_user_is_not_loaded(self):
+        user = User.objects.create(username='user1', id=1)
+        ContentScore.objects.create(content=self.content, user=user, score=4, scored_at=timezone.now())
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/content/list/')
+
+        self.assertEqual(response.data['results'][0]['user_score'], 4)
+        self.assertEqual(self.get_user_queries(queries), [])
+
+    def test_known_user_ids_are_bounded_and_expire(self):
+        known = KnownUserIds(max_size=2, ttl=60)
+        known.add_many([1, 2])
+        self.assertIn(1, known)
+        known.add_many([3])
+
+        self.assertNotIn(2, known)
+        self.assertIn(1, known)
+        with patch('content.users.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertNotIn(1, known)
+
+
+class ContentScoreUpsertTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        known_user_ids.clear()
+        self.user = User.objects.create(username='user1', id=1)
+        self.content = Content.objects.create(title='Content', text='Content.')
+        self.client = APIClient()
+
+    def post_score(self, score):
+        return self.client.post('/content/score/', {'content': self.content.id, 'score': score, 'user_id': self.user.id},
+                                format='json')
+
+    def test_rating_costs_one_statement_per_table(self):
+        self.post_score(2)
+        # The content lookup of the serializer, then the upsert, bucket, event and counter statements
+        # inside the savepoint the test transaction turns the write transaction into.
+        with self.assertNumQueries(7):
+            response = self.post_score(5)
+
+        self.assertEqual(response.status_code, 201)
+        content_score = ContentScore.objects.get()
+        self.assertEqual((content_score.score, content_score.previous_score), (5, 2))
+        self.content.refresh_from_db()
+        self.assertEqual((self.content.score_sum, self.content.score_count, self.content.score_mean), (5, 1, 5.0))
+        self.assertEqual(list(ContentHourlyScore.objects.values_list('score_sum', 'score_count')), [(5, 1)])
+        self.assertEqual(list(UpdateContentMeanScoreEvent.objects.order_by('id').values_list('type', 'old_score')),
+                         [(UpdateContentMeanScoreEvent.Type.ADD_SCORE, None),
+                          (UpdateContentMeanScoreEvent.Type.UPDATE_SCORE, 2)])
+
+    def test_upsert_moves_the_score_to_its_new_hour(self):
+        scored_at = timezone.now() - timedelta(hours=3)
+        ContentScore.upsert(self.user.id, self.content.id, 3, scored_at)
+        content_score = ContentScore.upsert(self.user.id, self.content.id, 3)
+
+        self.assertEqual(content_score.previous_scored_at, scored_at)
+        self.assertEqual(UpdateContentMeanScoreEvent.objects.count(), 1)
+        self.assertEqual(
+            list(ContentHourlyScore.objects.order_by('hour').values_list('score_sum', 'score_count')),
+            [(0, 0), (3, 1)],
+        )
+
+
+class OnlineNormalizationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_running_statistics_match_numpy(self):
+        values = [1.0, 4.5, 2.0, 3.25, 5.0]
+        weight, mean, m2 = 0, 0.0, 0.0
+        for value in values:
+            weight, mean, m2 = update_running_statistics(weight, mean, m2, value)
+
+        self.assertAlmostEqual(mean, np.mean(values))
+        self.assertAlmostEqual(m2 / weight, np.var(values))
+
+    def test_online_means_stay_within_tolerance_of_exact_means(self):
+        end = ContentHourlyScore.truncate_to_hour(timezone.now())
+        # Without surges; a surge is where the two methods disagree most, see the README.
+        generate_dataset(DatasetSpec(users=200, contents=40, scores_per_content=60, surge_ratio=0, end=end))
+        contents = list(Content.objects.order_by('id'))
+        exact_means = {content.id: content.normalized_score_mean for content in Content.normalize_batch(contents)}
+
+        ContentScoreStatistics.close_buckets([content.id for content in contents], end)
+        with override_settings(CONTENT_NORMALIZATION_MODE='online'):
+            online_means = {content.id: content.normalized_score_mean
+                            for content in Content.normalize_batch(Content.objects.order_by('id'))}
+
+        differences = [abs(exact_means[content_id] - online_means[content_id]) for content_id in exact_means]
+        self.assertLess(max(differences), 0.2)
+        self.assertLess(np.mean(differences), 0.05)
+
+    def create_hourly_history(self):
+        """
+        A content scored 3 in each of the last 48 hours, except for a 5 ten hours ago.
+        """
+        content = Content.objects.create(title='Content', text='Content.')
+        now = timezone.now()
+        for hours_ago in range(48, 0, -1):
+            ContentScore.upsert(User.objects.create(username=f'user{hours_ago}').id, content.id,
+                                5 if hours_ago == 10 else 3, now - timedelta(hours=hours_ago))
+        return content
+
+    @override_settings(CONTENT_NORMALIZATION_MODE='online')
+    def test_normalization_cost_does_not_grow_with_history(self):
+        content = self.create_hourly_history()
+        ContentScore.upsert(User.objects.create(username='user0').id, content.id, 1, timezone.now())
+
+        self.assertEqual(close_content_score_buckets(), 48)
+        # Already folded buckets are skipped, only the watermark hour is looked at again.
+        self.assertEqual(close_content_score_buckets(), 0)
+        self.assertEqual(list(ContentHourlyScore.objects.filter(content=content, rejected=True)
+                              .values_list('score_sum', 'score_count')), [(5, 1)])
+
+        content.refresh_from_db()
+        # The statistics row, the open buckets and the rejected ones, however many hours the content has been
+        # scored in.
+        with self.assertNumQueries(3):
+            normalized_mean = content.calculate_normalized_score_mean()
+        # The open bucket with the single 1 is an outlier as well.
+        self.assertAlmostEqual(normalized_mean, 3.0)
+
+    @override_settings(CONTENT_NORMALIZATION_MODE='online')
+    def test_rerating_out_of_a_rejected_bucket_updates_the_mean(self):
+        content = self.create_hourly_history()
+        close_content_score_buckets()
+        surge_user_id = ContentScore.objects.get(content=content, score=5).user_id
+
+        ContentScore.upsert(surge_user_id, content.id, 3)
+
+        content.refresh_from_db()
+        # The 5 left its rejected bucket, so nothing is left out any more; a stale total would give 139 / 47.
+        self.assertAlmostEqual(content.calculate_normalized_score_mean(), 3.0, places=9)
+
+
+@override_settings(CONTENT_SCORE_ADMISSION_BACKEND='local', CONTENT_SCORE_ADMISSION_USER_RATE=0.01,
+                   CONTENT_SCORE_ADMISSION_USER_BURST=2, CONTENT_SCORE_ADMISSION_CONTENT_CONCURRENCY=1)
+class ScoreWriteAdmissionTests(TestCase):
+    def setUp(self):
+        known_user_ids.clear()
+        get_admission_controller().clear()
+        self.user = User.objects.create(username='user1', id=1)
+        self.content = Content.objects.create(title='Content', text='Content.')
+        self.client = APIClient()
+
+    def post_score(self, user_id=1, path='/content/score/'):
+        return self.client.post(path, {'content': self.content.id, 'score': 1, 'user_id': user_id}, format='json')
+
+    @staticmethod
+    def get_shed_count(reason):
+        return REGISTRY.get_sample_value('content_score_writes_shed_total', {'reason': reason}) or 0
+
+    def test_user_over_its_rate_is_shed_without_database_work(self):
+        shed_count = self.get_shed_count('user')
+        self.assertEqual(self.post_score().status_code, 201)
+        self.assertEqual(self.post_score().status_code, 201)
+
+        with self.assertNumQueries(0):
+            response = self.post_score()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '100')
+        self.assertEqual(self.get_shed_count('user'), shed_count + 1)
+        self.assertEqual(self.post_score(user_id=2).status_code, 201)
+
+    def test_writes_over_the_content_concurrency_are_shed(self):
+        shed_count = self.get_shed_count('concurrency')
+        release = acquire_score_write(2, self.content.id)
+
+        response = self.post_score()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.get_shed_count('concurrency'), shed_count + 1)
+        self.assertEqual(self.post_score(path='/content/async/score/').status_code, 429)
+
+        release()
+        self.assertEqual(self.post_score().status_code, 201)
+        # The slot of the admitted write was given back.
+        self.assertEqual(self.post_score(path='/content/async/score/').status_code, 201)
+
+
+class ScalableAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='admin', email='admin@example.com')
+        self.client.force_login(self.admin)
+        self.contents = [Content.objects.create(title=f'Content {i}', text=f'Content {i}.') for i in range(3)]
+
+    def create_scores(self, count):
+        first = User.objects.count()
+        users = User.objects.bulk_create([User(username=f'scorer{first + i}') for i in range(count)])
+        for i, user in enumerate(User.objects.filter(username__in=[user.username for user in users])):
+            ContentScore.upsert(user.id, self.contents[i % 3].id, i % 6)
+
+    def get_changelist_query_count(self, path, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_the_rows(self):
+        self.create_scores(2)
+        score_queries = self.get_changelist_query_count('/admin/content/contentscore/')
+        event_queries = self.get_changelist_query_count('/admin/content/updatecontentmeanscoreevent/')
+
+        self.create_scores(30)
+        self.assertEqual(self.get_changelist_query_count('/admin/content/contentscore/'), score_queries)
+        self.assertEqual(self.get_changelist_query_count('/admin/content/updatecontentmeanscoreevent/'),
+                         event_queries)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=5)
+    def test_large_changelists_are_walked_by_primary_key(self):
+        self.create_scores(150)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/admin/content/contentscore/')
+        self.assertFalse(any('COUNT(*)' in query['sql'] and 'LIMIT' not in query['sql']
+                             for query in context.captured_queries))
+        results = list(response.context['cl'].result_list)
+        self.assertEqual(len(results), 100)
+        self.assertIn('pk__lt=', response.context['keyset_next_url'])
+
+        response = self.client.get('/admin/content/contentscore/' + response.context['keyset_next_url'])
+        self.assertEqual([score.pk for score in response.context['cl'].result_list],
+                         list(ContentScore.objects.filter(pk__lt=results[-1].pk).order_by('-pk')
+                              .values_list('pk', flat=True)))
+
+    def test_id_filters_use_the_relation_index(self):
+        self.create_scores(6)
+        response = self.client.get('/admin/content/contentscore/', {'content': self.contents[1].id})
+
+        self.assertEqual({score.content_id for score in response.context['cl'].result_list}, {self.contents[1].id})
+        self.assertContains(response, f'name="content" value="{self.contents[1].id}"')
+
+
+class NormalizationRunTests(EagerCeleryMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create(username='admin', id=100, is_staff=True)
+        users = [User.objects.create(username=f'user{i}', id=i) for i in range(1, 4)]
+        self.contents = [Content.objects.create(title=f'Content {i}', text=f'Content {i}.') for i in range(4)]
+        for index, content in enumerate(self.contents):
+            for user in users:
+                ContentScore.objects.create(content=content, user=user, score=(user.id + index) % 5,
+                                            scored_at=timezone.now() - timedelta(hours=user.id))
+
+    @patch('content.tasks.NORMALIZATION_SHARD_SIZE', 3)
+    def test_run_is_recorded_with_counts_and_item_times(self):
+        normalize_candidate_contents_scores()
+
+        run = NormalizationRun.objects.get()
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual((run.candidate_count, run.shard_count, run.normalized_count, run.updated_count,
+                          run.error_count), (4, 2, 4, 4, 0))
+        self.assertLessEqual(run.estimated_item_time_p50_ms, run.estimated_item_time_p99_ms)
+        self.assertEqual({content_id for content_id, _ in run.estimated_slowest_items},
+                         {content.id for content in self.contents})
+
+        # Nothing drifted since, so the next run has no candidates and changes nothing.
+        normalize_candidate_contents_scores()
+        run = NormalizationRun.objects.order_by('-started_at', '-id').first()
+        self.assertEqual((run.candidate_count, run.updated_count), (0, 0))
+        self.assertIsNone(run.estimated_item_time_p50_ms)
+
+    def test_failed_shard_is_recorded(self):
+        with patch.object(Content, 'normalize_batch', side_effect=Exception('deadlock')):
+            normalize_candidate_contents_scores()
+
+        run = NormalizationRun.objects.get()
+        self.assertEqual(run.error_count, 1)
+        self.assertIn('deadlock', run.errors[0])
+        self.assertIsNone(cache.get(NORMALIZATION_LOCK_KEY))
+
+    @override_settings(NORMALIZATION_RUN_RETENTION_DAYS=7)
+    def test_runs_past_retention_are_deleted(self):
+        NormalizationRun.objects.create(run_id='old', started_at=timezone.now() - timedelta(days=8))
+        NormalizationRun.objects.create(run_id='recent', started_at=timezone.now() - timedelta(days=6))
+
+        normalize_candidate_contents_scores()
+
+        self.assertEqual(NormalizationRun.objects.filter(run_id__in=['old', 'recent']).count(), 1)
+        self.assertFalse(NormalizationRun.objects.filter(run_id='old').exists())
+
+    def test_runs_are_listed_as_json_to_admins(self):
+        normalize_candidate_contents_scores()
+        client = APIClient()
+
+        client.force_authenticate(self.admin)
+        response = client.get('/content/normalization/runs/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['normalized_count'], 4)
+        self.assertEqual(len(response.data['results'][0]['estimated_slowest_items']), 4)
+
+        client.force_authenticate(User.objects.get(id=1))
+        self.assertEqual(client.get('/content/normalization/runs/').status_code, 403)
+
+    def test_histogram_percentiles_are_upper_bucket_bounds(self):
+        histogram = get_time_histogram([0.5] * 98 + [10, 20])
+
+        self.assertTrue(0.5 <= get_histogram_percentile(histogram, 50) < 0.5 * 1.2)
+        self.assertTrue(10 <= get_histogram_percentile(histogram, 99) < 10 * 1.2)
+        self.assertIsNone(get_histogram_percentile(get_time_histogram([]), 50))
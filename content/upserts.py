@@ -0,0 +1,86 @@
+"""
+Native upserts the ORM cannot express: `INSERT ... ON CONFLICT DO UPDATE` on PostgreSQL and SQLite and
+`INSERT ... ON DUPLICATE KEY UPDATE` on MySQL 8.0.19+, with update expressions that read the stored row.
+
+Update expressions are templates in which `{old}` stands for the stored row and `{new}` for the rejected insert,
+e.g. `{old}.score_sum + {new}.score_sum`. MySQL applies the assignments left to right, each seeing the ones
+before it, while the other backends evaluate all of them against the stored row. An assignment that copies a
+column (like `previous_score = {old}.score`) therefore has to come before the one that overwrites it.
+"""
+from datetime import datetime, timezone as datetime_timezone
+
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def adapt_value(value):
+    if isinstance(value, datetime):
+        return connection.ops.adapt_datetimefield_value(value)
+    return value
+
+
+def convert_datetime(value):
+    """
+    Turns a datetime read by raw SQL into an aware datetime: SQLite returns text and MySQL naive UTC values.
+    """
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value, datetime_timezone.utc)
+    return value
+
+
+def build_upsert_sql(model, columns, row_count, unique_columns, updates, returning=()):
+    table = quote(model._meta.db_table)
+    row_placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    sql = f"INSERT INTO {table} ({', '.join(quote(column) for column in columns)}) " \
+          f"VALUES {', '.join([row_placeholder] * row_count)}"
+    if connection.vendor == 'mysql':
+        new = 'new'
+        sql += ' AS new ON DUPLICATE KEY UPDATE '
+    else:
+        new = 'EXCLUDED'
+        sql += f" ON CONFLICT ({', '.join(quote(column) for column in unique_columns)}) DO UPDATE SET "
+    sql += ', '.join(
+        f'{quote(column)} = {expression.format(old=table, new=new)}' for column, expression in updates
+    )
+    if returning:
+        sql += f" RETURNING {', '.join(quote(column) for column in returning)}"
+    return sql
+
+
+def upsert_rows(model, columns, rows, unique_columns, updates):
+    """
+    Upserts many rows with one statement and returns the affected row count as the backend reports it.
+    """
+    sql = build_upsert_sql(model, columns, len(rows), unique_columns, updates)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [adapt_value(value) for row in rows for value in row])
+        return cursor.rowcount
+
+
+def upsert_row_returning(model, row, unique_columns, updates, returning):
+    """
+    Upserts one row, given as a column to value dict, and returns the `returning` columns of the stored row.
+    Backends without RETURNING (MySQL) read them back in a second statement. It sees the row this upsert
+    wrote, which stays locked until the transaction ends.
+    """
+    columns = list(row)
+    can_return = connection.features.can_return_columns_from_insert
+    sql = build_upsert_sql(model, columns, 1, unique_columns, updates, returning if can_return else ())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [adapt_value(row[column]) for column in columns])
+        if can_return:
+            return cursor.fetchone()
+
+        cursor.execute(
+            f"SELECT {', '.join(quote(column) for column in returning)} FROM {quote(model._meta.db_table)} "
+            f"WHERE {' AND '.join(f'{quote(column)} = %s' for column in unique_columns)}",
+            [adapt_value(row[column]) for column in unique_columns],
+        )
+        return cursor.fetchone()
@@ -1,7 +1,19 @@
 from django.urls import path
-from .views import ContentScoreCreateUpdateView, ContentListView
+from .async_views import AsyncContentListView, AsyncContentScoreCreateUpdateView
+from .views import ContentScoreCreateUpdateView, ContentListView, ContentScoreBulkCreateUpdateView, \
+    ContentListCacheStatsView, ContentTopListView, ContentScoreExportView, ScoreEventExportView, \
+    ContentScoreLookupView, NormalizationRunListView
 
 urlpatterns = [
     path('list/', ContentListView.as_view(), name='content-list'),
+    path('top/', ContentTopListView.as_view(), name='content-top'),
+    path('list/cache-stats/', ContentListCacheStatsView.as_view(), name='content-list-cache-stats'),
     path('score/', ContentScoreCreateUpdateView.as_view(), name='content-score'),
+    path('score/bulk/', ContentScoreBulkCreateUpdateView.as_view(), name='content-score-bulk'),
+    path('score/mine/', ContentScoreLookupView.as_view(), name='content-score-lookup'),
+    path('normalization/runs/', NormalizationRunListView.as_view(), name='normalization-runs'),
+    path('export/scores/', ContentScoreExportView.as_view(), name='content-score-export'),
+    path('export/events/', ScoreEventExportView.as_view(), name='score-event-export'),
+    path('async/list/', AsyncContentListView.as_view(), name='content-list-async'),
+    path('async/score/', AsyncContentScoreCreateUpdateView.as_view(), name='content-score-async'),
 ]
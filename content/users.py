@@ -0,0 +1,67 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from rest_framework.exceptions import ValidationError
+
+
+class KnownUserIds:
+    """
+    Bounded LRU set of user ids known to exist, each remembered for at most `ttl` seconds,
+    so a deleted user is only trusted for that long.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._expires_at = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, user_id):
+        with self._lock:
+            expires_at = self._expires_at.get(user_id)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._expires_at[user_id]
+                return False
+            self._expires_at.move_to_end(user_id)
+            return True
+
+    def add_many(self, user_ids):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for user_id in user_ids:
+                self._expires_at[user_id] = expires_at
+                self._expires_at.move_to_end(user_id)
+            while len(self._expires_at) > self.max_size:
+                self._expires_at.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._expires_at.clear()
+
+
+known_user_ids = KnownUserIds(settings.CONTENT_KNOWN_USER_IDS_MAX_SIZE, settings.CONTENT_KNOWN_USER_IDS_TTL)
+
+
+def ensure_users_exist(user_ids):
+    """
+    Creates the `user_<id>` users of the given ids that are not known yet, with one INSERT that skips ids
+    created in the meantime, so concurrent requests for a new id do not race. Known ids cost no query.
+    The insert also skips rows that clash otherwise, e.g. on the username, so only ids read back are remembered.
+    """
+    unknown_user_ids = {user_id for user_id in user_ids if user_id not in known_user_ids}
+    if unknown_user_ids:
+        User.objects.bulk_create(
+            [User(id=user_id, username=f'user_{user_id}') for user_id in sorted(unknown_user_ids)],
+            ignore_conflicts=True,
+        )
+        existing_user_ids = set(User.objects.filter(id__in=unknown_user_ids).values_list('id', flat=True))
+        known_user_ids.add_many(existing_user_ids)
+        missing_user_ids = unknown_user_ids - existing_user_ids
+        if missing_user_ids:
+            raise ValidationError(
+                {"user_id": "User {} could not be created.".format(', '.join(map(str, sorted(missing_user_ids))))})
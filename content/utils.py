@@ -1,3 +1,5 @@
+import math
+
 import numpy as np
 
 def calculate_z_scores(hourly_data):
@@ -16,3 +18,78 @@ def filter_outliers(hourly_data, z_threshold=2.0):
     ]
 
 
+def calculate_segmented_normalized_means(segment_ids, score_counts, score_sums, z_threshold=2.0):
+    """
+    Vectorized `filter_outliers` plus weighted mean over the hourly buckets of many contents at once.
+    Buckets of the same content must be contiguous. Returns the content ids and their normalized means,
+    where a mean is nan when no bucket survives the filtering.
+    """
+    score_counts = np.asarray(score_counts, dtype=float)
+    score_sums = np.asarray(score_sums, dtype=float)
+    unique_ids, segment_index = np.unique(np.asarray(segment_ids), return_inverse=True)
+    bucket_counts = np.bincount(segment_index)
+
+    means = score_sums / score_counts
+    segment_means = np.bincount(segment_index, weights=means) / bucket_counts
+    deviations = means - segment_means[segment_index]
+    segment_std_devs = np.sqrt(np.bincount(segment_index, weights=deviations ** 2) / bucket_counts)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_scores = deviations / segment_std_devs[segment_index]
+        kept = np.abs(z_scores) <= z_threshold
+
+        kept_counts = np.bincount(segment_index, weights=score_counts * kept, minlength=len(unique_ids))
+        kept_sums = np.bincount(segment_index, weights=score_sums * kept, minlength=len(unique_ids))
+        return unique_ids, kept_sums / kept_counts
+
+
+def update_running_statistics(weight, mean, m2, value, decay=1.0):
+    """
+    Welford update of the mean and the sum of squared deviations with one more value. With `decay` below 1
+    the weight of everything seen so far shrinks by that factor first, so older values fade out exponentially.
+    Returns the new `(weight, mean, m2)`; the population variance is `m2 / weight`.
+    """
+    weight = weight * decay + 1
+    delta = value - mean
+    mean += delta / weight
+    m2 = m2 * decay + delta * (value - mean)
+    return weight, mean, m2
+
+
+def is_outlier(value, weight, mean, m2, z_threshold=2.0):
+    """
+    Whether `value` lies more than `z_threshold` standard deviations from running statistics. Without any
+    spread there is nothing to compare against, so nothing counts as an outlier.
+    """
+    if weight <= 0:
+        return False
+    std_dev = math.sqrt(max(m2, 0.0) / weight)
+    if std_dev == 0:
+        return False
+    return abs(value - mean) / std_dev > z_threshold
+
+
+# Upper bounds in milliseconds of the item time histogram: four buckets per doubling from 1µs to about 100s,
+# so a percentile read from it is at most 19% too high.
+ITEM_TIME_BUCKET_BOUNDS_MS = tuple(0.001 * 2 ** (index / 4) for index in range(107))
+
+
+def get_time_histogram(times_ms):
+    """
+    Counts the given times per ITEM_TIME_BUCKET_BOUNDS_MS bucket, with one more bucket for longer times.
+    Histograms of the same bounds add up element by element, so shards can report them instead of every time.
+    """
+    bucket_indexes = np.searchsorted(ITEM_TIME_BUCKET_BOUNDS_MS, np.asarray(times_ms, dtype=float))
+    return np.bincount(bucket_indexes, minlength=len(ITEM_TIME_BUCKET_BOUNDS_MS) + 1).tolist()
+
+
+def get_histogram_percentile(histogram, percentile):
+    """
+    The upper bound of the bucket holding the given percentile of a `get_time_histogram` histogram,
+    or None when it is empty. Times beyond the last bound are reported as that bound.
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    bucket_index = int(np.searchsorted(np.cumsum(histogram), math.ceil(total * percentile / 100)))
+    return ITEM_TIME_BUCKET_BOUNDS_MS[min(bucket_index, len(ITEM_TIME_BUCKET_BOUNDS_MS) - 1)]
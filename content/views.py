@@ -1,28 +1,52 @@
-from django.contrib.auth.models import User
-from rest_framework import generics, serializers
-from rest_framework.pagination import PageNumberPagination
-from .models import Content, ContentScore
-from .serializers import ContentSerializer, ContentScoreSerializer
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework import generics, permissions, serializers
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from .admission import admit_score_write
+from .cache import get_content_list_version, get_content_list_cache_key, record_content_list_cache_access, \
+    get_content_list_cache_stats, get_content_list_etag
+from .exports import get_export_queryset, iter_export_rows, render_export
+from .models import Content, ContentScore, NormalizationRun
+from .serializers import ContentSerializer, ContentScoreSerializer, ContentScoreBulkSerializer, \
+    ExportQuerySerializer, ContentScoreLookupSerializer, NormalizationRunSerializer, CONTENT_LIST_FIELDS, \
+    get_content_rows
+from .users import ensure_users_exist
 
 class UserMixin:
-    def get_user(self):
+    # JWT users are built from the token claims, so authenticating never loads the user row.
+    authentication_classes = (SessionAuthentication, JWTStatelessUserAuthentication)
+
+    def get_user_id(self, create=False):
         """
-        Retrieves the user for the current request.
-        If authenticated, uses request.user.
-        If `user_id` is provided in the query params, fetches the user by ID.
+        Retrieves the id of the user of the current request without loading the user.
+        If authenticated, uses the id of request.user.
+        Otherwise uses `user_id` from the query params or the body. With `create`, users that do not exist
+        yet are created first, as the writes reference them.
         """
         if self.request.user.is_authenticated:
-            return self.request.user
+            return self.request.user.id
 
         user_id = self.request.query_params.get('user_id')
         if not user_id:
-            user_id =  self.request.data.get('user_id')
-        if user_id:
-            user, created = User.objects.get_or_create(id=user_id, defaults={'username': f'user_{user_id}'})
-            return user
-
+            user_id = self.request.data.get('user_id')
+        if not user_id:
+            return None
 
-        return None
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({"user_id": "A valid integer is required."})
+        if create:
+            ensure_users_exist([user_id])
+        return user_id
 
 
 class ContentPagination(PageNumberPagination):
@@ -31,29 +55,201 @@ class ContentPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class ContentCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the content ids: no COUNT(*) and no OFFSET, so deep pages cost the same as the first one.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
+
+
 class ContentListView(UserMixin, generics.ListAPIView):
     queryset = Content.objects.order_by('id').all()
     serializer_class = ContentSerializer
     pagination_class = ContentPagination
+    pagination_classes = {
+        'page': ContentPagination,
+        'cursor': ContentCursorPagination,
+    }
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = self.get_pagination_class()()
+        return self._paginator
+
+    def get_pagination_class(self):
+        """
+        Picks the pagination mode from the `pagination` query param, falling back to cursor mode when a `cursor`
+        is sent and to the CONTENT_LIST_PAGINATION setting otherwise.
+        """
+        request = getattr(self, 'request', None)
+        query_params = request.query_params if request is not None else {}
+        mode = query_params.get('pagination')
+        if not mode:
+            mode = 'cursor' if 'cursor' in query_params else settings.CONTENT_LIST_PAGINATION
+
+        if mode not in self.pagination_classes:
+            raise serializers.ValidationError(
+                {"pagination": f"Must be one of: {', '.join(self.pagination_classes)}."})
+        return self.pagination_classes[mode]
+
+    def list(self, request, *args, **kwargs):
+        """
+        Serves the user independent part of a page from the shared cache and overlays `user_score` on top of it.
+        Pages are keyed by the content list version, which score writes and normalization runs bump.
+        Every page carries an ETag, and a request whose `If-None-Match` still matches gets a 304
+        without reading or rendering the page.
+        """
+        cache_key = None
+        if settings.CONTENT_LIST_CACHE_TIMEOUT:
+            cache_key = get_content_list_cache_key(get_content_list_version(), request)
+            entry = cache.get(cache_key)
+            record_content_list_cache_access(entry is not None)
+            if entry is not None:
+                etag = self.get_etag(entry['version'])
+                not_modified_response = self.get_not_modified_response(etag)
+                if not_modified_response is not None:
+                    return not_modified_response
+                return self.with_etag(Response(self.get_user_page(entry['page'])), etag)
+
+        if settings.CONTENT_LIST_ETAGS and 'If-None-Match' in request.headers:
+            not_modified_response = self.get_not_modified_response(self.get_etag(self.get_current_page_version()))
+            if not_modified_response is not None:
+                return not_modified_response
+
+        response = self.get_page_response(request, *args, **kwargs)
+        if cache_key is not None:
+            cache.set(cache_key, {'page': self.get_shared_page(response.data), 'version': self.page_version},
+                      settings.CONTENT_LIST_CACHE_TIMEOUT)
+        return self.with_etag(response, self.get_etag(self.page_version))
+
+    def get_page_version(self, contents):
+        """
+        Versions a page from the ids and modification stamps of its contents, the buffered score deltas
+        and what the pagination adds around them (the count, or whether there are more pages).
+        """
+        stamps = [
+            (content['id'], content['modified_at']) if isinstance(content, dict) else (content.id, content.modified_at)
+            for content in contents
+        ]
+        content_ids = [content_id for content_id, _ in stamps]
+        if isinstance(self.paginator, CursorPagination):
+            position = (self.paginator.has_next, self.paginator.has_previous)
+        else:
+            position = self.paginator.page.paginator.count
+        return (
+            position,
+            tuple(content_ids),
+            max((modified_at for _, modified_at in stamps), default=None),
+            tuple(sorted(Content.get_pending_score_deltas(content_ids).items())),
+        )
+
+    def get_current_page_version(self):
+        """
+        Reads the version of the requested page with the same pagination queries as the page itself,
+        but over the `(id, modified_at)` index only.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).values('id', 'modified_at')
+        return self.get_page_version(self.paginator.paginate_queryset(queryset, self.request, view=self))
+
+    def get_etag(self, page_version):
+        if not settings.CONTENT_LIST_ETAGS:
+            return None
+
+        if not hasattr(self, '_user_version'):
+            user_id = self.get_user_id()
+            self._user_version = None
+            if user_id:
+                # Every score write moves `scored_at` forward, so the latest one versions all scores of the user.
+                latest_scored_at = ContentScore.objects.filter(user_id=user_id).aggregate(
+                    latest_scored_at=Max('scored_at'))['latest_scored_at']
+                self._user_version = (user_id, latest_scored_at)
+        return get_content_list_etag(self.request, page_version, self._user_version)
+
+    def get_not_modified_response(self, etag):
+        if etag is None:
+            return None
+        response = get_conditional_response(self.request, etag=etag)
+        return self.with_etag(response, etag) if response is not None else None
+
+    @staticmethod
+    def with_etag(response, etag):
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+
+    def get_page_response(self, request, *args, **kwargs):
+        """
+        Renders a page from the database. In the fast path only the listed columns are read and rows are
+        rendered as dicts, with the same body as the serializer would produce.
+        """
+        if not settings.CONTENT_LIST_FAST_PATH:
+            return super().list(request, *args, **kwargs)
+
+        rows = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()).values(*CONTENT_LIST_FIELDS, 'modified_at')
+        )
+        content_ids = [row['id'] for row in rows]
+        user_id = self.get_user_id()
+        return self.get_paginated_response(get_content_rows(
+            rows,
+            Content.get_pending_score_deltas(content_ids),
+            self.get_user_scores(user_id, content_ids) if user_id else None,
+        ))
+
+    @staticmethod
+    def get_user_scores(user_id, content_ids):
+        return dict(ContentScore.objects.filter(
+            user_id=user_id, content_id__in=content_ids
+        ).values_list('content_id', 'score'))
+
+    @staticmethod
+    def get_shared_page(data):
+        page = dict(data)
+        for link in ('next', 'previous'):
+            if page.get(link):
+                page[link] = remove_query_param(page[link], 'user_id')
+        page['results'] = [dict(row, user_score=None) for row in data['results']]
+        return page
+
+    def get_user_page(self, page):
+        user_id = self.request.query_params.get('user_id')
+        if user_id and not self.request.user.is_authenticated:
+            for link in ('next', 'previous'):
+                if page.get(link):
+                    page[link] = replace_query_param(page[link], 'user_id', user_id)
+
+        user_id = self.get_user_id()
+        if user_id:
+            user_scores = self.get_user_scores(user_id, [row['id'] for row in page['results']])
+            for row in page['results']:
+                row['user_score'] = user_scores.get(row['id'])
+        return page
 
     def paginate_queryset(self, queryset, *args, **kwargs):
         paginated_data = super().paginate_queryset(queryset)
         if paginated_data is None:
             return None
 
+        self.page_version = self.get_page_version(paginated_data)
+        if settings.CONTENT_LIST_FAST_PATH:
+            return paginated_data
+
+        Content.attach_pending_score_deltas(paginated_data)
         return self.attach_current_user_score(paginated_data)
 
     def attach_current_user_score(self, paginated_data):
         """
         Fetches the related ContentScore for the given user and attaches the score to each content.
         """
-        user = self.get_user()
+        user_id = self.get_user_id()
 
-        if user:
+        if user_id:
             content_ids = [content.id for content in paginated_data]
-            content_scores = ContentScore.objects.filter(
-                user=user, content_id__in=content_ids
-            ).select_related('content')
+            content_scores = ContentScore.objects.filter(user_id=user_id, content_id__in=content_ids)
 
             content_scores_by_content_id = {score.content_id: score for score in content_scores}
             for content in paginated_data:
@@ -62,13 +258,152 @@ class ContentListView(UserMixin, generics.ListAPIView):
         return paginated_data
 
 
+class ContentTopListView(ContentListView):
+    """
+    Ranks contents by the score users see, served by the index on the materialized `effective_score`.
+    """
+    orderings = {
+        '-score': ('-effective_score', '-id'),
+        'score': ('effective_score', 'id'),
+    }
+
+    def get_pagination_class(self):
+        return ContentPagination
+
+    def get_queryset(self):
+        ordering = self.request.query_params.get('ordering', '-score')
+        if ordering not in self.orderings:
+            raise serializers.ValidationError({"ordering": f"Must be one of: {', '.join(self.orderings)}."})
+
+        min_score_count = serializers.IntegerField(min_value=1).run_validation(
+            self.request.query_params.get('min_score_count', 1)
+        )
+        return Content.objects.filter(
+            effective_score__isnull=False, score_count__gte=min_score_count
+        ).order_by(*self.orderings[ordering])
+
+
 class ContentScoreCreateUpdateView(UserMixin, generics.CreateAPIView):
     queryset = ContentScore.objects.all()
     serializer_class = ContentScoreSerializer
 
+    def create(self, request, *args, **kwargs):
+        # Admitted before the serializer, whose content lookup is the first query of a write.
+        with admit_score_write(self.get_user_id(), self.get_content_id()):
+            return super().create(request, *args, **kwargs)
+
+    def get_content_id(self):
+        try:
+            return int(self.request.data.get('content'))
+        except (TypeError, ValueError):
+            return None
+
     def perform_create(self, serializer):
-        user = self.get_user()
-        if user is None:
+        user_id = self.get_user_id(create=True)
+        if user_id is None:
+            raise serializers.ValidationError({"user": "user_id is required."})
+
+        serializer.save(user_id=user_id)
+
+
+class ContentScoreBulkCreateUpdateView(UserMixin, generics.GenericAPIView):
+    serializer_class = ContentScoreBulkSerializer
+
+    def post(self, request, *args, **kwargs):
+        user_id = self.get_user_id(create=True)
+        if user_id is None:
+            raise serializers.ValidationError({"user": "user_id is required."})
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = ContentScore.bulk_upsert(
+            user_id, [(item['content'], item['score']) for item in serializer.validated_data['scores']]
+        )
+        return Response({'results': results})
+
+
+class ContentScoreLookupView(UserMixin, generics.GenericAPIView):
+    """
+    Returns the scores of the requesting user for up to CONTENT_SCORE_LOOKUP_MAX_ITEMS content ids, with one
+    query. Ids come as `?ids=1,2,3` or, for large sets, as a `content_ids` list in a POST body.
+    The 'map' output is `{"scores": {"<id>": score}}` without the unscored ids. The 'compact' output is one
+    character per requested id, in request order: the score digit, or '-' when there is none.
+    """
+    serializer_class = ContentScoreLookupSerializer
+
+    def get(self, request, *args, **kwargs):
+        return self.lookup(request.query_params)
+
+    def post(self, request, *args, **kwargs):
+        return self.lookup(request.data)
+
+    def lookup(self, data):
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        user_id = self.get_user_id()
+        if user_id is None:
             raise serializers.ValidationError({"user": "user_id is required."})
 
-        serializer.save(user=user)
\ No newline at end of file
+        content_ids = serializer.validated_data['content_ids']
+        scores = ContentListView.get_user_scores(user_id, set(content_ids))
+        if serializer.validated_data['output'] == 'compact':
+            return Response({'scores': ''.join(str(scores.get(content_id, '-')) for content_id in content_ids)})
+        return Response({'scores': {str(content_id): score for content_id, score in scores.items()}})
+
+
+class ContentListCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_content_list_cache_stats())
+
+
+class NormalizationRunPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class NormalizationRunListView(generics.ListAPIView):
+    """
+    The recorded normalization runs, newest first. Unfinished runs are included with a null `finished_at`.
+    The `estimated_*` item times are not measured per content but shared out of each batch's measured time.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    queryset = NormalizationRun.objects.order_by('-started_at', '-id')
+    serializer_class = NormalizationRunSerializer
+    pagination_class = NormalizationRunPagination
+
+
+class ExportView(APIView):
+    """
+    Streams every matching row in id order; pass the last exported id as `after_id` to resume.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    kind = None
+    content_types = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+
+    def get(self, request, *args, **kwargs):
+        serializer = ExportQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filters = dict(serializer.validated_data)
+        output_format = filters.pop('output')
+
+        rows = iter_export_rows(self.kind, get_export_queryset(self.kind, **filters),
+                                settings.CONTENT_EXPORT_CHUNK_SIZE)
+        response = StreamingHttpResponse(
+            render_export(self.kind, rows, output_format), content_type=self.content_types[output_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{self.kind}.{output_format}"'
+        return response
+
+
+class ContentScoreExportView(ExportView):
+    kind = 'scores'
+
+
+class ScoreEventExportView(ExportView):
+    kind = 'events'
@@ -0,0 +1,2 @@
+# Same worker count as gunicorn.sh, but each worker runs an event loop serving the async views under content/async/.
+SERVE_STATIC=False gunicorn --bind 0.0.0.0:8000 --workers 3 --worker-class uvicorn_worker.UvicornWorker redit.asgi:application
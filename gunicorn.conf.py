@@ -0,0 +1,18 @@
+# Loaded by gunicorn from the working directory, next to the command line options.
+import glob
+import os
+
+
+def on_starting(server):
+    # Samples of a previous run would otherwise be added to the new ones.
+    multiprocess_directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiprocess_directory:
+        os.makedirs(multiprocess_directory, exist_ok=True)
+        for path in glob.glob(os.path.join(multiprocess_directory, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'redit.settings')
+# Static files are served by nginx; WhiteNoise would run every request through a thread (see settings).
+os.environ.setdefault('SERVE_STATIC', 'False')
 
 application = get_asgi_application()
@@ -1,6 +1,7 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from celery.signals import task_prerun, task_postrun, task_failure, worker_init, worker_process_shutdown
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'redit.settings')
 
@@ -9,3 +10,12 @@ app = Celery('redit')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks()
+
+# Task metrics, exported by the worker on CELERY_METRICS_PORT.
+from redit import metrics  # noqa: E402
+
+task_prerun.connect(metrics.record_task_started)
+task_postrun.connect(metrics.record_task_finished)
+task_failure.connect(metrics.record_task_failed)
+worker_init.connect(metrics.start_worker_metrics_server)
+worker_process_shutdown.connect(metrics.mark_worker_process_dead)
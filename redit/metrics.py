@@ -0,0 +1,217 @@
+"""
+Prometheus metrics of the web and Celery processes.
+
+With PROMETHEUS_MULTIPROC_DIR set (it has to be set before this module is imported), every process writes
+its samples to that directory and the `/metrics` endpoint aggregates all of them, so the numbers are correct
+behind several gunicorn workers or Celery pool processes. Without it, only the serving process is reported.
+"""
+import glob
+import hmac
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, Http404
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, \
+    generate_latest, multiprocess, start_http_server
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 200)
+TASK_DURATION_BUCKETS = (.01, .05, .1, .5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request', ['view', 'method', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL statements executed while handling a request', ['view', 'method'],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in SQL statements while handling a request', ['view', 'method'],
+    buckets=LATENCY_BUCKETS,
+)
+TASK_DURATION = Histogram(
+    'celery_task_duration_seconds', 'Time spent running a Celery task', ['task', 'state'],
+    buckets=TASK_DURATION_BUCKETS,
+)
+TASK_FAILURES = Counter('celery_task_failures_total', 'Celery tasks that raised', ['task'])
+TASK_ITEMS = Counter(
+    'celery_task_processed_items_total', 'Items (contents, deltas, events) processed by Celery tasks', ['task']
+)
+
+SCORE_WRITES_ADMITTED = Counter('content_score_writes_admitted_total', 'Score writes let through admission control')
+SCORE_WRITES_SHED = Counter(
+    'content_score_writes_shed_total', 'Score writes rejected by admission control, by exhausted limit', ['reason']
+)
+
+
+def get_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    """
+    Serves the metrics to scrapers sending `Authorization: Bearer <METRICS_TOKEN>`. Without a token configured
+    the endpoint does not exist, so a proxy that forgets to block it exposes nothing.
+    """
+    token = settings.METRICS_TOKEN
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        raise Http404
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def get_view_name(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return 'unresolved'
+    view = getattr(resolver_match.func, 'view_class', resolver_match.func)
+    return getattr(view, '__name__', resolver_match.view_name)
+
+
+class QueryTimer:
+    """
+    `execute_wrapper` hook adding up the number and duration of the statements it sees.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started_at
+            self.count += 1
+
+
+# The timer of the request being handled. Context variables follow `sync_to_async` into its executor threads,
+# so statements of async views are counted although they run on other threads' connections.
+current_query_timer = ContextVar('current_query_timer', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    query_timer = current_query_timer.get()
+    if query_timer is None:
+        return execute(sql, params, many, context)
+    return query_timer(execute, sql, params, many, context)
+
+
+def install_query_timing(connection, **kwargs):
+    """
+    Adds `time_query` to the wrappers of a connection for good; it costs nothing outside of a request.
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+connection_created.connect(install_query_timing)
+
+
+class RequestTimer:
+    """
+    Times one request and counts its SQL statements on every database connection and thread it uses.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.response = None
+        self.query_timer = QueryTimer()
+
+    def __enter__(self):
+        # Connections opened before this module was imported never sent `connection_created` to it.
+        for connection in connections.all():
+            install_query_timing(connection)
+        self.token = current_query_timer.set(self.query_timer)
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.started_at
+        current_query_timer.reset(self.token)
+        if self.response is None:
+            return
+
+        view, method = get_view_name(self.request), self.request.method
+        REQUEST_LATENCY.labels(view, method, self.response.status_code).observe(duration)
+        REQUEST_DB_QUERIES.labels(view, method).observe(self.query_timer.count)
+        REQUEST_DB_TIME.labels(view, method).observe(self.query_timer.duration)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, SQL statement count and SQL time of every request, labelled by view class.
+    Works in both modes, so it does not push async views under ASGI onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        with RequestTimer(request) as timer:
+            timer.response = self.get_response(request)
+        return timer.response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        with RequestTimer(request) as timer:
+            timer.response = await self.get_response(request)
+        return timer.response
+
+
+_task_started_at = {}
+
+
+def record_task_started(task_id=None, **kwargs):
+    _task_started_at[task_id] = time.perf_counter()
+
+
+def record_task_finished(task_id=None, task=None, state=None, **kwargs):
+    started_at = _task_started_at.pop(task_id, None)
+    if started_at is not None and task is not None:
+        TASK_DURATION.labels(task.name, state or 'UNKNOWN').observe(time.perf_counter() - started_at)
+
+
+def record_task_failed(sender=None, **kwargs):
+    if sender is not None:
+        TASK_FAILURES.labels(sender.name).inc()
+
+
+def start_worker_metrics_server(**kwargs):
+    """
+    Serves the metrics of a Celery worker and its pool processes on CELERY_METRICS_PORT.
+    """
+    multiprocess_directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiprocess_directory:
+        # Like the gunicorn `on_starting` hook, drops the samples of a previous run.
+        os.makedirs(multiprocess_directory, exist_ok=True)
+        for path in glob.glob(os.path.join(multiprocess_directory, '*.db')):
+            os.remove(path)
+    if settings.METRICS_ENABLED and settings.CELERY_METRICS_PORT:
+        start_http_server(settings.CELERY_METRICS_PORT, registry=get_registry())
+
+
+def mark_worker_process_dead(**kwargs):
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
@@ -64,6 +64,8 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+    # First, so its latency covers every other middleware.
+    'redit.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,8 +73,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
 ]
+# WhiteNoise only works synchronously. Under ASGI, where nginx serves /static/, it is left out
+# so async views are not pushed onto a thread.
+SERVE_STATIC = os.environ.get('SERVE_STATIC', 'True') == 'True'
+if SERVE_STATIC:
+    MIDDLEWARE.append("whitenoise.middleware.WhiteNoiseMiddleware")
 
 ROOT_URLCONF = 'redit.urls'
 
@@ -111,6 +117,25 @@ DATABASES = {
 }
 
 
+# Cache
+# Shared between processes through Redis when CACHE_REDIS_URL is set, per process otherwise.
+
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -202,6 +227,7 @@ LOGGING = {
 # Celery configuration for Docker using environment variables
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')  # Default to Redis if not set
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'
 
 # Celery Beat schedule example (adjust as necessary)
 CELERY_BEAT_SCHEDULE = {
@@ -209,9 +235,79 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'content.tasks.normalize_candidate_contents_scores',
         'schedule':  crontab(minute='*/1'),
     },
+    'flush_content_score_deltas': {
+        'task': 'content.tasks.flush_content_score_deltas',
+        'schedule': timedelta(seconds=float(os.environ.get('CONTENT_SCORE_FLUSH_INTERVAL', 5))),
+    },
+    'close_content_score_buckets': {
+        'task': 'content.tasks.close_content_score_buckets',
+        'schedule': crontab(minute=1),
+    },
+    'compact_expired_score_events': {
+        'task': 'content.tasks.compact_expired_score_events',
+        'schedule': crontab(hour=3, minute=0),
+    },
 }
 
 CELERY_TIMEZONE = os.environ.get('CELERY_TIMEZONE', TIME_ZONE)
 
 # Load task modules from all registered Django app configs.
-CELERY_IMPORTS = ('content.tasks',)
\ No newline at end of file
+CELERY_IMPORTS = ('content.tasks',)
+
+# Prometheus metrics, served on /metrics by the web processes and on CELERY_METRICS_PORT by Celery workers.
+# Set PROMETHEUS_MULTIPROC_DIR to aggregate the samples of all gunicorn workers and Celery pool processes.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+CELERY_METRICS_PORT = int(os.environ.get('CELERY_METRICS_PORT', 0))
+# Bearer token scrapers send to `/metrics`; the endpoint answers 404 while it is unset.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Admin changelists of the large tables count exactly up to this many rows and estimate beyond it.
+ADMIN_EXACT_COUNT_LIMIT = int(os.environ.get('ADMIN_EXACT_COUNT_LIMIT', 10000))
+
+# Content scoring
+CONTENT_SCORE_BULK_MAX_ITEMS = int(os.environ.get('CONTENT_SCORE_BULK_MAX_ITEMS', 500))
+# Admission control of single score writes: a token bucket per user and per content plus a cap on the writes
+# in flight per content. Writes over a limit get a 429 before touching the database. '' turns it off,
+# 'redis' shares the limits between processes and 'local' keeps them per process. A rate of 0 disables its bucket.
+CONTENT_SCORE_ADMISSION_BACKEND = os.environ.get('CONTENT_SCORE_ADMISSION_BACKEND', '')
+CONTENT_SCORE_ADMISSION_REDIS_URL = os.environ.get('CONTENT_SCORE_ADMISSION_REDIS_URL', CELERY_BROKER_URL)
+CONTENT_SCORE_ADMISSION_USER_RATE = float(os.environ.get('CONTENT_SCORE_ADMISSION_USER_RATE', 1))
+CONTENT_SCORE_ADMISSION_USER_BURST = int(os.environ.get('CONTENT_SCORE_ADMISSION_USER_BURST', 10))
+CONTENT_SCORE_ADMISSION_CONTENT_RATE = float(os.environ.get('CONTENT_SCORE_ADMISSION_CONTENT_RATE', 50))
+CONTENT_SCORE_ADMISSION_CONTENT_BURST = int(os.environ.get('CONTENT_SCORE_ADMISSION_CONTENT_BURST', 200))
+CONTENT_SCORE_ADMISSION_CONTENT_CONCURRENCY = int(os.environ.get('CONTENT_SCORE_ADMISSION_CONTENT_CONCURRENCY', 4))
+# Content ids one request to `/content/score/mine/` may look up.
+CONTENT_SCORE_LOOKUP_MAX_ITEMS = int(os.environ.get('CONTENT_SCORE_LOOKUP_MAX_ITEMS', 1000))
+# User ids recently seen to exist, so anonymous `user_id` requests skip the user lookup.
+CONTENT_KNOWN_USER_IDS_MAX_SIZE = int(os.environ.get('CONTENT_KNOWN_USER_IDS_MAX_SIZE', 100000))
+CONTENT_KNOWN_USER_IDS_TTL = int(os.environ.get('CONTENT_KNOWN_USER_IDS_TTL', 300))
+# Default pagination of the content list, 'page' or 'cursor'; clients can pick one with `?pagination=`.
+CONTENT_LIST_PAGINATION = os.environ.get('CONTENT_LIST_PAGINATION', 'page')
+# Render content list pages from the listed columns instead of full model instances; the body is the same.
+CONTENT_LIST_FAST_PATH = os.environ.get('CONTENT_LIST_FAST_PATH', 'True') == 'True'
+# Send ETags with content list pages and answer matching `If-None-Match` requests with 304 Not Modified.
+CONTENT_LIST_ETAGS = os.environ.get('CONTENT_LIST_ETAGS', 'True') == 'True'
+# Seconds a shared content list page stays cached; 0 disables the page cache.
+CONTENT_LIST_CACHE_TIMEOUT = int(os.environ.get('CONTENT_LIST_CACHE_TIMEOUT', 60))
+
+# Write-behind score counters: buffer score and hourly bucket deltas in Redis (or in-process with 'local')
+# and let `flush_content_score_deltas` apply them, instead of updating the Content and bucket rows per write.
+CONTENT_SCORE_WRITE_BEHIND = os.environ.get('CONTENT_SCORE_WRITE_BEHIND', 'False') == 'True'
+CONTENT_SCORE_BUFFER_BACKEND = os.environ.get('CONTENT_SCORE_BUFFER_BACKEND', 'redis')
+CONTENT_SCORE_BUFFER_REDIS_URL = os.environ.get('CONTENT_SCORE_BUFFER_REDIS_URL', CELERY_BROKER_URL)
+CONTENT_SCORE_FLUSH_CHUNK_SIZE = int(os.environ.get('CONTENT_SCORE_FLUSH_CHUNK_SIZE', 500))
+
+# Normalization computes the outlier statistics over all hourly buckets ('exact'), or keeps running statistics
+# that `close_content_score_buckets` updates as hours close ('online'). A decay below 1 weights older buckets less.
+CONTENT_NORMALIZATION_MODE = os.environ.get('CONTENT_NORMALIZATION_MODE', 'exact')
+CONTENT_NORMALIZATION_DECAY = float(os.environ.get('CONTENT_NORMALIZATION_DECAY', 1.0))
+# Days the telemetry of normalization runs (`NormalizationRun`) is kept; each run deletes older records.
+NORMALIZATION_RUN_RETENTION_DAYS = int(os.environ.get('NORMALIZATION_RUN_RETENTION_DAYS', 7))
+
+# Rows read per query by the streaming score and event exports.
+CONTENT_EXPORT_CHUNK_SIZE = int(os.environ.get('CONTENT_EXPORT_CHUNK_SIZE', 2000))
+
+# Score events older than the retention window are folded into ScoreEventSummary rows and deleted.
+SCORE_EVENT_RETENTION_DAYS = int(os.environ.get('SCORE_EVENT_RETENTION_DAYS', 90))
+SCORE_EVENT_COMPACTION_BATCH_SIZE = int(os.environ.get('SCORE_EVENT_COMPACTION_BATCH_SIZE', 1000))
+SCORE_EVENT_COMPACTION_MAX_BATCHES = int(os.environ.get('SCORE_EVENT_COMPACTION_MAX_BATCHES', 10000))
@@ -22,6 +22,8 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from django.contrib.auth import views as auth_views
 
+from redit.metrics import metrics_view
+
 schema_view = get_schema_view(
     openapi.Info(
         title="Redit API",
@@ -38,6 +40,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('content/', include('content.urls')),
     path('account/', include('account.urls')),
+    path('metrics', metrics_view, name='metrics'),
 
     # Swagger documentation
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),